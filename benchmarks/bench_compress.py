@@ -0,0 +1,62 @@
+"""
+Benchmark of writing compressed WARC files with different compression
+levels and strategies, and with members compressed on multiple threads.
+
+Reports the write throughput (of uncompressed data) and the size of the
+output relative to the uncompressed size. A zlib compatible backend can be
+compared by adding it to BACKENDS.
+"""
+
+import random
+import zlib
+from cStringIO import StringIO
+
+import common
+from warc.warc import WARCFile, WARCRecord
+
+RECORDS = 500
+
+BACKENDS = [("zlib", zlib)]
+
+def make_payloads():
+    """HTML-like payloads of 20-100KB, compressible but not trivially."""
+    rand = random.Random(42)
+    words = ["<div>", "</div>", "<a href=", "class=", "http://example.com/",
+             "the", "archive", "web", "data", "<p>", "</p>", "\n"]
+    payloads = []
+    for i in range(RECORDS):
+        body = " ".join(rand.choice(words) + str(rand.randint(0, 999))
+                        for j in range(rand.randint(3000, 15000)))
+        payloads.append("HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n" + body)
+    return payloads
+
+def write_all(records, compress):
+    def run():
+        f = WARCFile(fileobj=StringIO(), mode="wb", compress=compress)
+        for record in records:
+            f.write_record(record)
+        run.size = f.tell()
+        f.close()
+    return run
+
+def main():
+    payloads = make_payloads()
+    records = [WARCRecord(payload=p, headers={"WARC-Type": "response"}) for p in payloads]
+    total = sum(len(str(r)) for r in records)
+    print "%d records, %.1f MB uncompressed" % (len(records), total / 1024.0 / 1024)
+
+    strategies = [("default", zlib.Z_DEFAULT_STRATEGY), ("filtered", zlib.Z_FILTERED)]
+    for backend_name, backend in BACKENDS:
+        for strategy_name, strategy in strategies:
+            for level in [1, 3, 6, 9]:
+                run = write_all(records, dict(compresslevel=level, strategy=strategy, backend=backend))
+                seconds = common.measure(run)
+                name = "%s level=%d strategy=%s" % (backend_name, level, strategy_name)
+                common.report(name, seconds, total, extra="ratio %.3f" % (float(run.size) / total))
+
+    for threads in [1, 2, 4, 8]:
+        run = write_all(records, dict(compresslevel=6, threads=threads))
+        common.report("zlib level=6 threads=%d" % threads, common.measure(run), total)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark of converting ARC files to WARC files with warc.convert.
+
+Compares convert.convert_file with the conversion through WARCRecord that
+convert used before, where WARCRecord reads every payload once to compute
+a single digest of the block and copies it to a temporary file, then reads
+the copy to write it. convert_file computes both the WARC-Block-Digest and
+the digest of the HTTP payload in its single read, so it does twice the
+hashing, and hashes and writes uncompressed ARC files from a memory map.
+Also reports converting several files on 1 and 4 processes, which only
+helps with as many CPUs.
+"""
+
+import os
+import tempfile
+
+import common
+import warc
+from warc import convert
+from warc.arc import ARCFile, ARCRecord
+from warc.warc import WARCFile, WARCRecord
+
+RECORDS = 200
+PAYLOAD_SIZE = 256 * 1024
+FILES = 4
+
+def make_arc(path, compress):
+    payload = "HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n\r\n" + os.urandom(1024) * (PAYLOAD_SIZE // 1024)
+    f = ARCFile(path, "wb", compress=compress, version=1,
+                file_headers={"ip_address": "127.0.0.1", "date": "20120301093000", "org": "test"})
+    for i in range(RECORDS):
+        f.write(ARCRecord(payload=payload, headers={
+            "url": "http://example.com/%d" % i, "ip_address": "127.0.0.1", "date": "20120301093000",
+            "content_type": "text/html", "length": len(payload)}))
+    f.close()
+
+def legacy_convert(src, dst):
+    arcfile = warc.open(src)
+    warcfile = WARCFile(dst, "wb")
+    for record in arcfile:
+        header = record.header
+        warcfile.write_record(WARCRecord(payload=record.payload, headers={
+            "WARC-Type": "response",
+            "WARC-Target-URI": header.url,
+            "WARC-Date": header.date.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "Content-Length": header["length"],
+        }))
+    warcfile.close()
+    arcfile.close()
+
+def run(func, *args):
+    return lambda: func(*args)
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        for compress in [False, True]:
+            suffix = ".gz" if compress else ""
+            src = os.path.join(directory, "test.arc" + suffix)
+            dst = os.path.join(directory, "test.warc" + suffix)
+            make_arc(src, compress)
+            size = RECORDS * PAYLOAD_SIZE
+            print "%s: %d records, %d bytes" % (os.path.basename(src), RECORDS, os.path.getsize(src))
+            common.report("  through WARCRecord", common.measure(run(legacy_convert, src, dst)), size, RECORDS)
+            common.report("  convert_file", common.measure(run(convert.convert_file, src, dst)), size, RECORDS)
+            os.remove(dst)
+
+            files = [(src, os.path.join(directory, "test-%d.warc%s" % (i, suffix))) for i in range(FILES)]
+            for jobs in [1, 4]:
+                seconds = common.measure(run(lambda: list(convert.convert_files(files, jobs=jobs))))
+                common.report("  %d files, jobs=%d" % (FILES, jobs), seconds, size * FILES, RECORDS * FILES)
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+    finally:
+        os.rmdir(directory)
+
+if __name__ == "__main__":
+    main()
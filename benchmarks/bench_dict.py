@@ -0,0 +1,79 @@
+"""
+Benchmark of warc.utils.CaseInsensitiveDict on header-like workloads.
+
+Compares the current class, which implements the dictionary methods itself,
+with the previous one, which implemented only __getitem__, __setitem__,
+__delitem__ and keys and left the rest to UserDict.DictMixin.
+"""
+
+from UserDict import DictMixin
+
+import common
+from warc.utils import CaseInsensitiveDict
+
+COUNT = 100000
+
+FIELDS = [
+    ("WARC-Type", "response"),
+    ("WARC-Target-URI", "http://example.com/"),
+    ("WARC-Date", "2012-02-10T16:15:52Z"),
+    ("WARC-Record-ID", "<urn:uuid:80fb9262-5402-11e1-8206-545200690126>"),
+    ("WARC-IP-Address", "127.0.0.1"),
+    ("WARC-Warcinfo-ID", "<urn:uuid:80fb9262-5402-11e1-8206-545200690127>"),
+    ("Content-Type", "application/http; msgtype=response"),
+    ("Content-Length", "1234"),
+    ("WARC-Payload-Digest", "sha1:5a2fd4a1e5f0cea32d33e4e0b39e2b1e22be9fe2"),
+]
+
+class LegacyCaseInsensitiveDict(DictMixin):
+    def __init__(self, mapping=None, **kwargs):
+        self._d = {}
+        self.update(mapping, **kwargs)
+
+    def __setitem__(self, name, value):
+        self._d[name.lower()] = value
+
+    def __getitem__(self, name):
+        return self._d[name.lower()]
+
+    def __delitem__(self, name):
+        del self._d[name.lower()]
+
+    def keys(self):
+        return self._d.keys()
+
+def create(cls):
+    def run():
+        for i in xrange(COUNT):
+            cls(FIELDS)
+    return run
+
+def lookup(cls):
+    d = cls(FIELDS)
+    def run():
+        get = d.get
+        for i in xrange(COUNT):
+            get("WARC-Target-URI")
+            get("WARC-Refers-To")
+            "WARC-Type" in d
+            d["Content-Length"]
+    return run
+
+def iterate(cls):
+    d = cls(FIELDS)
+    def run():
+        for i in xrange(COUNT // 10):
+            for name, value in d.items():
+                pass
+    return run
+
+def main():
+    for name, func in [("create from 9 fields", create),
+                       ("get, in and [] lookups", lookup),
+                       ("items", iterate)]:
+        print name
+        for cls in [LegacyCaseInsensitiveDict, CaseInsensitiveDict]:
+            common.report("  " + cls.__name__, common.measure(func(cls)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Benchmark of writing many small records to a WARC file with the flush
+policies of WARCFile.
+
+Flushing after every record, like the previous implementation, makes a
+write system call for each record. Flushing every megabyte or only on
+close lets the records be written with large buffered writes.
+"""
+
+import os
+import tempfile
+
+import common
+from warc.warc import WARCFile, WARCRecord
+
+RECORDS = 20000
+
+POLICIES = [
+    ("every record", True),
+    ("every 1MB", {"bytes": 1024 * 1024}),
+    ("on close", False),
+]
+
+def make_records():
+    return [WARCRecord(payload="payload %d\r\n" % i, headers={
+        "WARC-Type": "resource",
+        "WARC-Target-URI": "http://example.com/%d" % i,
+    }) for i in range(RECORDS)]
+
+def write(path, records, compress, flush):
+    def run():
+        f = WARCFile(path, "wb", compress=compress, flush=flush)
+        f.write_records(records)
+        f.close()
+    return run
+
+def main():
+    records = make_records()
+    directory = tempfile.mkdtemp()
+    try:
+        for compress in [False, True]:
+            path = os.path.join(directory, "flush.warc" + (".gz" if compress else ""))
+            write(path, records, compress, False)()
+            size = os.path.getsize(path)
+            print "%s: %d records, %d bytes" % (os.path.basename(path), RECORDS, size)
+            for name, flush in POLICIES:
+                seconds = common.measure(write(path, records, compress, flush))
+                common.report("  flush " + name, seconds, size, RECORDS)
+            os.remove(path)
+    finally:
+        os.rmdir(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Benchmark of reading records with small payloads, where parsing the WARC
+headers dominates.
+
+Reports records/s and MB/s for synthetic files of small records, compressed
+and uncompressed, and for the files in test_data. The previous line by line
+header parser is included for comparison.
+
+Each reader is run without looking at the headers, looking at WARC-Type
+only, like a filter does, and looking at all the headers, which makes the
+lazy headers of WARCReader parse the whole header block.
+"""
+
+import os
+from cStringIO import StringIO
+
+import common
+from warc.warc import WARCFile, WARCHeader, WARCReader, WARCRecord
+
+RECORDS = 20000
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test_data")
+
+class LegacyWARCReader(WARCReader):
+    """WARCReader with the header parser that matched one line at a time."""
+    def read_header(self, fileobj):
+        version_line = fileobj.readline()
+        if not version_line:
+            return None
+
+        m = self.RE_VERSION.match(version_line)
+        if not m:
+            raise IOError("Bad version line: %r" % version_line)
+        version = m.group(1)
+        if version not in self.SUPPORTED_VERSIONS:
+            raise IOError("Unsupported WARC version: %s" % version)
+
+        headers = {}
+        while True:
+            line = fileobj.readline()
+            if line == "\r\n": # end of headers
+                break
+            m = self.RE_HEADER.match(line)
+            if not m:
+                raise IOError("Bad header line: %r" % line)
+            name, value = m.groups()
+            headers[name] = value
+        return WARCHeader(headers)
+
+def make_warc(compress):
+    buffer = StringIO()
+    f = WARCFile(fileobj=buffer, mode="w", compress=compress)
+    for i in range(RECORDS):
+        f.write_record(WARCRecord(payload="dns payload %d\r\n" % i, headers={
+            "WARC-Type": "request",
+            "WARC-Target-URI": "http://example.com/%d" % i,
+            "WARC-IP-Address": "127.0.0.1",
+            "WARC-Warcinfo-ID": "<urn:uuid:80fb9262-5402-11e1-8206-545200690126>",
+        }))
+    return buffer.getvalue()
+
+ACCESS = [
+    ("no headers", None),
+    ("WARC-Type", lambda header: header.type),
+    ("all headers", lambda header: header.items()),
+]
+
+def read_all(reader_class, data, compress, access):
+    def run():
+        f = WARCFile(fileobj=StringIO(data), compress=compress)
+        f._reader = reader_class(f.fileobj)
+        for record in f:
+            if access is not None:
+                access(record.header)
+    return run
+
+def count(data, compress):
+    f = WARCFile(fileobj=StringIO(data), compress=compress)
+    return len(list(f))
+
+def main():
+    datasets = []
+    for compress in [False, True]:
+        name = "synthetic %s" % ("warc.gz" if compress else "warc")
+        datasets.append((name, make_warc(compress), compress))
+    for filename in sorted(os.listdir(TEST_DATA)):
+        if ".warc" in filename:
+            data = open(os.path.join(TEST_DATA, filename), "rb").read()
+            datasets.append((filename, data, filename.endswith(".gz")))
+
+    for name, data, compress in datasets:
+        records = count(data, compress)
+        print "%s: %d records, %d bytes" % (name, records, len(data))
+        for label, access in ACCESS:
+            for cls in [LegacyWARCReader, WARCReader]:
+                seconds = common.measure(read_all(cls, data, compress, access))
+                common.report("  %s, %s" % (cls.__name__, label), seconds, len(data), records)
+
+if __name__ == "__main__":
+    main()
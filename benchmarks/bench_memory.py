@@ -0,0 +1,116 @@
+"""
+Benchmark of the memory used by records held in memory, like when building
+an index or a deduplication table.
+
+Reports the bytes per record of the headers and records read from a
+synthetic WARC file, counting every object reachable from them once. The
+previous header classes, built on UserDict.DictMixin with an instance
+__dict__ and a new copy of each lower-cased name, are included for
+comparison.
+"""
+
+import sys
+from cStringIO import StringIO
+from UserDict import DictMixin
+
+import common
+from warc.warc import WARCFile, WARCReader, WARCRecord
+
+RECORDS = 10000
+
+class LegacyCaseInsensitiveDict(DictMixin):
+    def __init__(self, mapping):
+        self._d = {}
+        for k, v in mapping:
+            self._d[k.lower()] = v
+
+    def __getitem__(self, name):
+        return self._d[name.lower()]
+
+    def keys(self):
+        return self._d.keys()
+
+class LegacyWARCHeader(LegacyCaseInsensitiveDict):
+    def __init__(self, headers):
+        self.version = "WARC/1.0"
+        LegacyCaseInsensitiveDict.__init__(self, headers)
+
+class LegacyWARCRecord(object):
+    def __init__(self, header, payload):
+        self.header = header
+        self.payload = payload
+
+def deep_size(obj, seen):
+    """Returns the size of obj and the objects reachable from it, skipping
+    the objects in `seen`.
+    """
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for k, v in obj.iteritems():
+            size += deep_size(k, seen) + deep_size(v, seen)
+    elif isinstance(obj, (list, tuple)):
+        for item in obj:
+            size += deep_size(item, seen)
+    if hasattr(obj, "__dict__"):
+        size += deep_size(obj.__dict__, seen)
+    for cls in type(obj).__mro__:
+        for name in cls.__dict__.get("__slots__", ()):
+            # The slot descriptor doesn't fall back to __getattr__, which
+            # would parse lazy headers.
+            try:
+                value = cls.__dict__[name].__get__(obj, cls)
+            except AttributeError:
+                continue
+            size += deep_size(value, seen)
+    return size
+
+def make_warc():
+    buffer = StringIO()
+    f = WARCFile(fileobj=buffer, mode="w")
+    for i in range(RECORDS):
+        f.write_record(WARCRecord(payload="payload %d\r\n" % i, headers={
+            "WARC-Type": "response",
+            "WARC-Target-URI": "http://example.com/%d" % i,
+            "WARC-IP-Address": "127.0.0.1",
+            "WARC-Warcinfo-ID": "<urn:uuid:80fb9262-5402-11e1-8206-545200690126>",
+        }))
+    return buffer.getvalue()
+
+def legacy_records(data):
+    records = []
+    for record in WARCFile(fileobj=StringIO(data)):
+        # The block kept by the lazy header, parsed like before
+        header = record.header
+        fields = WARCReader.RE_HEADER.findall(header._block, header._pos)
+        records.append(LegacyWARCRecord(LegacyWARCHeader(fields), None))
+    return records
+
+def lazy_records(data):
+    records = []
+    for record in WARCFile(fileobj=StringIO(data)):
+        record.payload = None
+        records.append(record)
+    return records
+
+def parsed_records(data):
+    records = lazy_records(data)
+    for record in records:
+        record.header.keys()
+    return records
+
+def main():
+    data = make_warc()
+    print "%d records" % RECORDS
+    for name, func in [("legacy headers", legacy_records),
+                       ("headers, not parsed", lazy_records),
+                       ("headers, parsed", parsed_records)]:
+        records = func(data)
+        seen = set()
+        size = sum(deep_size(record, seen) for record in records)
+        print "  %-43s %8.0f bytes/record" % (name, float(size) / len(records))
+
+if __name__ == "__main__":
+    main()
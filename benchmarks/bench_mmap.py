@@ -0,0 +1,61 @@
+"""
+Benchmark of reading an uncompressed WARC file through a memory map.
+
+Reads every record of the file and computes the sha1 of its payload, once
+through the file with FilePart payloads read in chunks and once through the
+map with MappedPart payloads hashed from view() without copying them.
+"""
+
+import hashlib
+import os
+import tempfile
+
+import common
+from warc.warc import WARCFile, WARCRecord
+
+RECORDS = 2000
+
+def make_warc(path, payload_size):
+    payload = os.urandom(1024) * (payload_size // 1024)
+    f = WARCFile(path, "wb")
+    for i in range(RECORDS):
+        f.write_record(WARCRecord(payload=payload, headers={
+            "WARC-Type": "resource",
+            "WARC-Target-URI": "http://example.com/%d" % i,
+        }))
+    f.close()
+
+def hash_read(path):
+    def run():
+        f = WARCFile(path)
+        for record in f:
+            sha1 = hashlib.sha1()
+            for chunk in iter(lambda: record.payload.read(65536), ""):
+                sha1.update(chunk)
+        f.close()
+    return run
+
+def hash_view(path):
+    def run():
+        f = WARCFile(path, mmap=True)
+        for record in f:
+            hashlib.sha1(record.payload.view())
+        f.close()
+    return run
+
+def main():
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "mmap.warc")
+    try:
+        for payload_size in [4 * 1024, 64 * 1024, 256 * 1024]:
+            make_warc(path, payload_size)
+            size = os.path.getsize(path)
+            print "%d records of %d KB, %d bytes" % (RECORDS, payload_size // 1024, size)
+            common.report("  FilePart read + sha1", common.measure(hash_read(path)), size, RECORDS)
+            common.report("  MappedPart view + sha1", common.measure(hash_view(path)), size, RECORDS)
+            os.remove(path)
+    finally:
+        os.rmdir(directory)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Benchmark of reading large payloads through warc.utils.FilePart.
+
+Compares FilePart with the previous implementation, which built new strings
+of the remaining buffer on every call and read lines in 1024 byte chunks.
+"""
+
+import tempfile
+
+import common
+from warc.utils import FilePart
+
+PAYLOAD_SIZE = 64 * 1024 * 1024
+
+class LegacyFilePart:
+    """The FilePart implementation before the buffer-backed reader."""
+    def __init__(self, fileobj, length):
+        self.fileobj = fileobj
+        self.length = length
+        self.offset = 0
+        self.buf = ""
+
+    def read(self, size=-1):
+        if size == -1:
+            return self._read(self.length)
+        else:
+            return self._read(size)
+
+    def _read(self, size):
+        if len(self.buf) >= size:
+            content = self.buf[:size]
+            self.buf = self.buf[size:]
+        else:
+            size = min(size, self.length - self.offset - len(self.buf))
+            content = self.buf + self.fileobj.read(size)
+            self.buf = ""
+        self.offset += len(content)
+        return content
+
+    def _unread(self, content):
+        self.buf = content + self.buf
+        self.offset -= len(content)
+
+    def readline(self):
+        chunks = []
+        chunk = self._read(1024)
+        while chunk and "\n" not in chunk:
+            chunks.append(chunk)
+            chunk = self._read(1024)
+
+        if "\n" in chunk:
+            index = chunk.index("\n")
+            self._unread(chunk[index+1:])
+            chunk = chunk[:index+1]
+        chunks.append(chunk)
+        return "".join(chunks)
+
+    def __iter__(self):
+        line = self.readline()
+        while line:
+            yield line
+            line = self.readline()
+
+def make_payload(line_length):
+    f = tempfile.TemporaryFile()
+    line = "x" * (line_length - 1) + "\n"
+    block = line * max(1, (1024 * 1024) // line_length)
+    written = 0
+    while written < PAYLOAD_SIZE:
+        f.write(block)
+        written += len(block)
+    f.flush()
+    return f, written
+
+def read_chunks(cls, f, size, chunk_size):
+    def run():
+        f.seek(0)
+        part = cls(f, size)
+        while part.read(chunk_size):
+            pass
+    return run
+
+def read_lines(cls, f, size):
+    def run():
+        f.seek(0)
+        for line in cls(f, size):
+            pass
+    return run
+
+def read_into(f, size, chunk_size):
+    def run():
+        f.seek(0)
+        part = FilePart(f, size)
+        buf = bytearray(chunk_size)
+        while part.readinto(buf):
+            pass
+    return run
+
+def main():
+    for line_length in [80, 4096, 256 * 1024]:
+        f, size = make_payload(line_length)
+        print "payload of %d MB, lines of %d bytes" % (size // 1024 // 1024, line_length)
+        for cls in [LegacyFilePart, FilePart]:
+            common.report("  %s.readline" % cls.__name__, common.measure(read_lines(cls, f, size)), size)
+        f.close()
+
+    f, size = make_payload(4096)
+    print "payload of %d MB, read in chunks" % (size // 1024 // 1024)
+    for chunk_size in [1024, 65536]:
+        for cls in [LegacyFilePart, FilePart]:
+            common.report("  %s.read(%d)" % (cls.__name__, chunk_size),
+                          common.measure(read_chunks(cls, f, size, chunk_size)), size)
+        common.report("  FilePart.readinto(%d)" % chunk_size, common.measure(read_into(f, size, chunk_size)), size)
+    f.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Benchmark of scanning the headers of a WARC file with large payloads, where
+skipping the payloads dominates.
+
+Reports records/s and MB/s of WARCFile.iter_headers, which skips the
+payloads, and of a reader that reads and discards the rest of each payload
+like the previous implementation.
+"""
+
+import os
+import tempfile
+
+import common
+from warc.warc import WARCFile, WARCReader, WARCRecord
+
+RECORDS = 200
+PAYLOAD_SIZE = 1024 * 1024
+
+class LegacyWARCReader(WARCReader):
+    """WARCReader that reads the unread part of a payload into a string."""
+    def finish_reading_current_record(self):
+        if self.current_payload:
+            self.current_payload.read()
+            self.expect(self.current_payload.fileobj, "\r\n")
+            self.expect(self.current_payload.fileobj, "\r\n")
+            self.current_payload = None
+
+def make_warc(path, compress):
+    payload = os.urandom(1024) * (PAYLOAD_SIZE // 1024)
+    f = WARCFile(path, "wb", compress=compress)
+    for i in range(RECORDS):
+        f.write_record(WARCRecord(payload=payload, headers={
+            "WARC-Type": "resource",
+            "WARC-Target-URI": "http://example.com/%d" % i,
+        }))
+    f.close()
+
+def scan(reader_class, path, compress):
+    def run():
+        f = WARCFile(path, compress=compress)
+        f._reader = reader_class(f.fileobj)
+        for header in f.iter_headers():
+            pass
+        f.close()
+    return run
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        for compress in [False, True]:
+            path = os.path.join(directory, "scan.warc" + (".gz" if compress else ""))
+            make_warc(path, compress)
+            size = os.path.getsize(path)
+            print "%s: %d records, %d bytes" % (os.path.basename(path), RECORDS, size)
+            for cls in [LegacyWARCReader, WARCReader]:
+                seconds = common.measure(scan(cls, path, compress))
+                common.report("  " + cls.__name__, seconds, size, RECORDS)
+            os.remove(path)
+    finally:
+        os.rmdir(directory)
+
+if __name__ == "__main__":
+    main()
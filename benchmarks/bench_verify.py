@@ -0,0 +1,49 @@
+"""
+Benchmark of verifying the digests of WARC files with warc.verify.
+
+Reports MB/s of verifying an uncompressed file, whose payloads are hashed
+from the memory map, and a compressed file on 1 and 4 processes.
+"""
+
+import os
+import tempfile
+
+import common
+from warc import verify
+from warc.warc import WARCFile, WARCRecord
+
+RECORDS = 400
+PAYLOAD_SIZE = 256 * 1024
+
+def make_warc(path, compress):
+    payload = "HTTP/1.1 200 OK\r\n\r\n" + os.urandom(1024) * (PAYLOAD_SIZE // 1024)
+    f = WARCFile(path, "wb", compress=compress)
+    for i in range(RECORDS):
+        f.write_record(WARCRecord(payload=payload, headers={
+            "WARC-Type": "response",
+            "WARC-Target-URI": "http://example.com/%d" % i,
+        }))
+    f.close()
+
+def run_verify(path, jobs):
+    def run():
+        assert list(verify.verify_files([path], jobs=jobs)) == []
+    return run
+
+def main():
+    directory = tempfile.mkdtemp()
+    try:
+        for compress, jobs in [(False, [1]), (True, [1, 4])]:
+            path = os.path.join(directory, "verify.warc" + (".gz" if compress else ""))
+            make_warc(path, compress)
+            size = RECORDS * PAYLOAD_SIZE
+            print "%s: %d records, %d bytes" % (os.path.basename(path), RECORDS, os.path.getsize(path))
+            for n in jobs:
+                seconds = common.measure(run_verify(path, n))
+                common.report("  jobs=%d" % n, seconds, size, RECORDS, "(uncompressed MB/s)")
+            os.remove(path)
+    finally:
+        os.rmdir(directory)
+
+if __name__ == "__main__":
+    main()
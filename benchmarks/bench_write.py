@@ -0,0 +1,61 @@
+"""
+Benchmark of writing WARC headers.
+
+Compares WARCHeader.write_to, which looks up the names to write in a cache
+and writes the header with one call, with the previous implementation,
+which converted every name with title() and four replace() calls and made
+four writes per header line. Headers read from a file, which are written
+back from the block they were read from, are measured as well.
+"""
+
+from cStringIO import StringIO
+
+import common
+from warc.warc import WARCHeader, WARCReader
+
+COUNT = 50000
+
+HEADERS = [
+    ("WARC-Type", "response"),
+    ("WARC-Target-URI", "http://example.com/"),
+    ("WARC-Date", "2012-02-10T16:15:52Z"),
+    ("WARC-Record-ID", "<urn:uuid:80fb9262-5402-11e1-8206-545200690126>"),
+    ("WARC-IP-Address", "127.0.0.1"),
+    ("Content-Type", "application/http; msgtype=response"),
+    ("Content-Length", "1234"),
+    ("WARC-Payload-Digest", "sha1:5a2fd4a1e5f0cea32d33e4e0b39e2b1e22be9fe2"),
+]
+
+def legacy_write_to(header, f):
+    f.write(header.version + "\r\n")
+    for name, value in header.items():
+        name = name.title()
+        name = name.replace("Warc-", "WARC-").replace("-Ip-", "-IP-").replace("-Id", "-ID").replace("-Uri", "-URI")
+        f.write(name)
+        f.write(": ")
+        f.write(value)
+        f.write("\r\n")
+    f.write("\r\n")
+
+def write(headers, write_to):
+    def run():
+        f = StringIO()
+        for header in headers:
+            write_to(header, f)
+    return run
+
+def read_headers():
+    block = str(WARCHeader(HEADERS))
+    reader = WARCReader(StringIO(""))
+    return [reader.read_header(StringIO(block)) for i in range(COUNT)]
+
+def main():
+    headers = [WARCHeader(HEADERS) for i in range(COUNT)]
+    nbytes = len(str(headers[0])) * COUNT
+    print "%d headers of %d bytes" % (COUNT, nbytes // COUNT)
+    common.report("  legacy write_to", common.measure(write(headers, legacy_write_to)), nbytes, COUNT)
+    common.report("  WARCHeader.write_to", common.measure(write(headers, WARCHeader.write_to)), nbytes, COUNT)
+    common.report("  LazyWARCHeader.write_to", common.measure(write(read_headers(), lambda h, f: h.write_to(f))), nbytes, COUNT)
+
+if __name__ == "__main__":
+    main()
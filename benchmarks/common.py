@@ -0,0 +1,37 @@
+"""
+Helpers shared by the benchmarks.
+
+The benchmarks are plain scripts, run them from the top-level directory of
+the repository:
+
+    $ python benchmarks/bench_payload.py
+"""
+
+import os
+import sys
+import time
+
+# Use the warc package from this source tree.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+def measure(func, repeat=3):
+    """Runs func `repeat` times and returns the best time in seconds."""
+    best = None
+    for i in range(repeat):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def report(name, seconds, nbytes=None, records=None, extra=None):
+    """Prints one line of results."""
+    line = "%-45s %8.3fs" % (name, seconds)
+    if nbytes is not None:
+        line += " %10.1f MB/s" % (nbytes / seconds / 1024 / 1024)
+    if records is not None:
+        line += " %12.0f records/s" % (records / seconds)
+    if extra:
+        line += "  " + extra
+    print line
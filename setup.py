@@ -12,7 +12,9 @@ setup(
     author_email="info@archive.org",
     url="http://github.com/internetarchive/warc",
     packages=["warc"],
+    entry_points={"console_scripts": ["warc = warc.cli:main"]},
     platforms=["any"],
+    python_requires=">=2.7, <3",
     package_data={'': ["LICENSE", "Readme.rst"]},
     include_package_data=True,
     classifiers=[
@@ -22,5 +24,6 @@ setup(
         'License :: OSI Approved :: BSD License',
         'Operating System :: OS Independent',
         'Programming Language :: Python',
+        'Programming Language :: Python :: 2.7',
     ],
 )
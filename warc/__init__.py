@@ -7,8 +7,17 @@ Python library to work with WARC files.
 :copyright: (c) 2012 Internet Archive
 """
 
+import __builtin__
+import zlib
+
+from . import gzip2
 from .arc import ARCFile, ARCRecord, ARCHeader
+from .utils import PeekableFile
 from .warc import WARCFile, WARCRecord, WARCHeader, WARCReader
+from .writer import AsyncWARCWriter, RotatingWARCWriter
+
+# Number of bytes at the start of a file looked at by sniff_format
+SNIFF_SIZE = 4096
 
 def detect_format(filename):
     """Tries to figure out the type of the file. Return 'warc' for
@@ -21,18 +30,74 @@ def detect_format(filename):
 
     return "unknown"
 
-def open(filename, mode="rb", format = None):
-    """Shorthand for WARCFile(filename, mode).
+def sniff_format(data):
+    """Tells the type of a file from its first bytes. Returns a tuple of 
+    'warc', 'arc' or 'unknown' and whether the file is gzip compressed.
+
+    The start of the first gzip member of a compressed file is 
+    decompressed to look at the record it contains.
+    """
+    compressed = data.startswith(gzip2.GZIP_MAGIC)
+    if compressed:
+        try:
+            data = zlib.decompressobj(16 + zlib.MAX_WBITS).decompress(data)
+        except zlib.error:
+            return "unknown", True
+    if data.startswith("WARC/"):
+        return "warc", compressed
+    if data.startswith("filedesc://"):
+        return "arc", compressed
+    return "unknown", compressed
+
+def _peek(fileobj):
+    """Returns the first bytes of the file without consuming them, and the
+    file to read from, which is a PeekableFile for files that can't seek.
+    """
+    try:
+        position = fileobj.tell()
+        fileobj.seek(position)
+    except (AttributeError, IOError):
+        fileobj = PeekableFile(fileobj)
+        return fileobj, fileobj.peek(SNIFF_SIZE)
+    data = fileobj.read(SNIFF_SIZE)
+    fileobj.seek(position)
+    return fileobj, data
+
+def open(filename=None, mode="rb", format=None, fileobj=None, mmap=False):
+    """Opens a WARC or ARC file, given by name or as `fileobj`.
 
-    Auto detects file and opens it.
+    When reading, the type of the file and whether it is gzip compressed
+    are told from its first bytes (see :func:`sniff_format`), so files 
+    with any name can be read. The first bytes are not consumed, also from
+    files that can't seek, like pipes and ``sys.stdin``. The type is told 
+    from the filename when writing and for files that don't start like a 
+    WARC or ARC file, like empty files.
 
+    `format` can be "warc" or "arc" to use that type regardless of the 
+    contents. With `mmap`, uncompressed files read by name are memory 
+    mapped. Returns a :class:`WARCFile` or an :class:`ARCFile`.
     """
+    compress = None
+    if not mode.startswith(("w", "a")):
+        if fileobj is None:
+            f = __builtin__.open(filename, "rb")
+            try:
+                data = f.read(SNIFF_SIZE)
+            finally:
+                f.close()
+        else:
+            fileobj, data = _peek(fileobj)
+        sniffed, compress = sniff_format(data)
+        if format in (None, "auto") and sniffed != "unknown":
+            format = sniffed
+
     if format == "auto" or format == None:
-        format = detect_format(filename)
+        format = detect_format(filename or "")
 
+    mmap = bool(mmap and fileobj is None and compress is False)
     if format == "warc":
-        return WARCFile(filename, mode)
+        return WARCFile(filename, mode, fileobj=fileobj, compress=compress, mmap=mmap)
     elif format == "arc":
-        return ARCFile(filename, mode)
+        return ARCFile(filename, mode, fileobj=fileobj, compress=compress, mmap=mmap)
     else:
         raise IOError("Don't know how to open '%s' files"%format)
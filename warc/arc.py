@@ -6,12 +6,14 @@ Provides support for ARC v1 files.
 
 import __builtin__
 import datetime
+import mmap as _mmap
 import os
 import re
 import StringIO
 import warnings
 
-from .utils import CaseInsensitiveDict
+from . import gzip2
+from .utils import CaseInsensitiveDict, FilePart, MappedPart, map_file
 
 ARC1_HEADER_RE = re.compile('(?P<url>\S*)\s(?P<ip_address>\S*)\s(?P<date>\S*)\s(?P<content_type>\S*)\s(?P<length>\S*)')
 ARC2_HEADER_RE = re.compile('(?P<url>\S*)\s(?P<ip_address>\S*)\s(?P<date>\S*)\s(?P<content_type>\S*)\s(?P<result_code>\S*)\s(?P<checksum>\S*)\s(?P<location>\S*)\s(?P<offset>\S*)\s(?P<filename>\S*)\s(?P<length>\S*)')
@@ -41,6 +43,8 @@ class ARCHeader(CaseInsensitiveDict):
         * length (length of the n/w doc in bytes)
 
     """
+    __slots__ = ("version",)
+
     def __init__(self, url = "",  ip_address = "",  date = "",  content_type = "",  
                  result_code = "",  checksum = "",  location = "",  offset = "",  filename = "",  length = "", version = 2):
 
@@ -150,6 +154,14 @@ class ARCHeader(CaseInsensitiveDict):
 
         
 class ARCRecord(object):
+    __slots__ = ("header", "payload", "version")
+
+    def __getstate__(self):
+        return self.header, self.payload, self.version
+
+    def __setstate__(self, state):
+        self.header, self.payload, self.version = state
+
     def __init__(self, header = None, payload = None, headers = {}, version = None):
         if not (header or headers):
             raise TypeError("Can't write create an ARC1 record without a header")
@@ -206,7 +218,7 @@ class ARCRecord(object):
         
     
 class ARCFile(object):
-    def __init__(self, filename=None, mode=None, fileobj=None, version = None, file_headers = {}):
+    def __init__(self, filename=None, mode=None, fileobj=None, version = None, file_headers = {}, compress=None, mmap=False):
         """
         Initialises a file like object that can be used to read or
         write Arc files. Works for both version 1 or version 2.
@@ -247,11 +259,36 @@ class ARCFile(object):
                   * When we try to read a record, it will read out one
                     record and try to guess the version from it (for
                     the first read).
+
+        The compress parameter tells whether the file is gzip
+        compressed. It defaults to True when the filename ends with
+        ".gz". Like WARC files, compressed ARC files are written with
+        each record in a gzip member of its own, and the offsets
+        returned by `tell` and `browse` are offsets in the compressed
+        file.
+
+        If mmap is True, an uncompressed file is memory mapped for
+        reading and the payloads are `warc.utils.MappedPart` objects, 
+        like with `WARCFile`.
         
         """
+        if compress is None and filename and filename.endswith(".gz"):
+            compress = True
+        if mmap and (compress or (mode and mode[0] in "wa")):
+            raise ValueError("mmap can only be used for reading uncompressed files")
+
+        # The file opened here, which is closed along with this file
+        self._myfileobj = None
         if fileobj is None:
-            fileobj = __builtin__.open(filename, mode or "rb")
+            fileobj = self._myfileobj = __builtin__.open(filename, mode or "rb")
+            mode = fileobj.mode
+        if mmap:
+            fileobj = map_file(fileobj)
+        if compress:
+            fileobj = gzip2.GzipFile(fileobj=fileobj, mode=mode)
         self.fileobj = fileobj
+        self.compressed = isinstance(fileobj, gzip2.GzipFile)
+        self.mapped = isinstance(fileobj, _mmap.mmap)
 
         if version != None and int(version) not in (1, 2):
             raise TypeError("ARC version has to be 1 or 2")
@@ -259,6 +296,7 @@ class ARCFile(object):
         self.file_headers = file_headers
         self.header_written = False
         self.header_read = False
+        self.current_payload = None
 
         
     def _write_header(self):
@@ -289,7 +327,7 @@ class ARCFile(object):
                            result_code = "200",
                            checksum = "-", 
                            location = "-",
-                           offset = str(self.fileobj.tell()),
+                           offset = str(self.tell()),
                            filename = fname)
         arc_file_header_record = ARCRecord(header, payload%self.file_headers)
         self.write(arc_file_header_record)
@@ -303,14 +341,27 @@ class ARCFile(object):
             self._write_header()
         arc_record.write_to(self.fileobj, self.version)
         self.fileobj.write("\n") # Record separator
+        if self.compressed:
+            self.fileobj.close_member()
 
     def _read_file_header(self):
         """Reads out the file header for the arc file. If version was
         not provided, this will autopopulate it."""
+        if self.compressed:
+            self.fileobj.read_member()
         header = self.fileobj.readline()
         payload1 = self.fileobj.readline()
         payload2 = self.fileobj.readline()
         version, reserved, organisation = payload1.split(None, 2)
+        # Skip the rest of the file header record, like the XML metadata 
+        # of some version 1 files. Some writers leave the last newline out
+        # of the length, which is then shorter than the lines read.
+        rest = int(header.split()[-1]) - len(payload1) - len(payload2)
+        if rest > 0:
+            if self.compressed:
+                self.fileobj.skip(rest)
+            else:
+                self.fileobj.read(rest)
         self.fileobj.readline() # Lose the separator newline
         self.header_read = True
         # print "--------------------------------------------------"
@@ -334,18 +385,32 @@ class ARCFile(object):
         else:
             raise IOError("Unknown ARC version '%s'"%version)
 
+    def _finish_reading_current_record(self):
+        """Skips the rest of the payload of the last record read and the 
+        newline separating it from the next record.
+        """
+        if self.current_payload is not None:
+            self.current_payload.skip()
+            self.fileobj.readline() # Munge the separator newline.
+            self.current_payload = None
+
+    def _readline(self):
+        """Reads a line, moving on to the next gzip member at the end of a
+        member in compressed files.
+        """
+        line = self.fileobj.readline()
+        if line == "" and self.compressed and self.fileobj.read_member() is not None:
+            line = self.fileobj.readline()
+        return line
+
     def _read_arc_record(self):
         "Reads out an arc record, formats it and returns it"
-        #XXX:Noufal Stream payload here rather than just read it
-        # r = self.fileobj.readline() # Drop the initial newline
-        # if r == "":
-        #     return None
-        # header = self.fileobj.readline()
+        self._finish_reading_current_record()
 
         # Strip the initial new lines and read first line
-        header = self.fileobj.readline()
+        header = self._readline()
         while header and header.strip() == "":
-            header = self.fileobj.readline()
+            header = self._readline()
 
         if header == "":
             return None
@@ -359,14 +424,20 @@ class ARCFile(object):
         headers = matches.groupdict()
         arc_header = ARCHeader(**headers)
 
-        payload = self.fileobj.read(int(headers['length']))
-
-        self.fileobj.readline() # Munge the separator newline.
-
-        return ARCRecord(header = arc_header, payload = payload)
+        # The payload is read from the file only when the caller reads it,
+        # whatever is left of it is skipped by the next read.
+        if self.mapped:
+            self.current_payload = MappedPart(self.fileobj, int(headers['length']))
+        else:
+            self.current_payload = FilePart(self.fileobj, int(headers['length']))
+        return ARCRecord(header = arc_header, payload = self.current_payload)
         
     def read(self):
-        "Reads out an arc record from the file"
+        """Reads out an arc record from the file.
+
+        The payload of the record is a file-like object reading from this 
+        file, which can only be read until the next record is read.
+        """
         if not self.header_read:
             self._read_file_header()
         return self._read_arc_record()
@@ -375,6 +446,57 @@ class ARCFile(object):
     read_record = read
     write_record = write
 
+    def read_record_at(self, offset):
+        """Reads the arc record starting at the given offset, which is the
+        offset in the compressed file if this is a compressed file.
+        """
+        self.seek(offset)
+        return self.read()
+
+    def seek(self, offset):
+        """Moves to the record starting at the given offset.
+
+        If this is a compressed file, the offset must be the offset of a
+        gzip member in the compressed file. The file header is read first
+        if it hasn't been read yet, to find out the version of the file.
+        """
+        if not self.header_read:
+            self._read_file_header()
+        # The payload of the current record belongs to the old position.
+        self.current_payload = None
+        if self.compressed:
+            self.fileobj.seek_member(offset)
+        else:
+            self.fileobj.seek(offset)
+
+    def tell(self):
+        """Returns the file offset. If this is a compressed file, then the 
+        offset in the compressed file is returned.
+        """
+        if self.compressed:
+            return self.fileobj.fileobj.tell()
+        return self.fileobj.tell()
+
+    def browse(self):
+        """Utility to browse through the records in the arc file.
+
+        This returns an iterator over (record, offset, size) for each record
+        in the file, not including the file header. The offset of a record
+        may include the blank lines separating it from the previous record.
+
+        Like :meth:`WARCFile.browse`, only the first 1MB of each payload is
+        kept.
+        """
+        if not self.header_read:
+            self._read_file_header()
+        offset = self.tell()
+        for record in self:
+            record.payload = StringIO.StringIO(record.payload.read(1024*1024))
+            self._finish_reading_current_record()
+            next_offset = self.tell()
+            yield record, offset, next_offset-offset
+            offset = next_offset
+
     def __iter__(self):
         record = self.read()
         while record:
@@ -383,6 +505,10 @@ class ARCFile(object):
     
     def close(self):
         self.fileobj.close()
+        # GzipFile doesn't close the file given to it
+        if self._myfileobj is not None:
+            self._myfileobj.close()
+            self._myfileobj = None
         
         
         
@@ -0,0 +1,188 @@
+"""
+warc.cli
+~~~~~~~~
+
+Command line interface to the warc library, run as ``python -m warc``.
+
+    $ python -m warc ls crawl.warc.gz
+    $ python -m warc cat crawl.warc.gz --offset 1234
+    $ python -m warc extract crawl.warc.gz 1234 > page.html
+    $ python -m warc index --jobs 4 crawl.warc.gz > crawl.cdx
+    $ python -m warc recompress --level 6 --jobs 4 crawl.warc crawl.warc.gz
+    $ python -m warc convert crawl.arc.gz crawl.warc.gz
+    $ python -m warc convert --jobs 8 arcs/*.arc.gz warcs/
+    $ python -m warc verify --jobs 8 *.warc.gz
+
+Files named "-" are read from stdin or written to stdout.
+
+:copyright: (c) 2012 Internet Archive
+"""
+
+import argparse
+import errno
+import os
+import sys
+
+from . import open as open_file
+from . import convert, index, verify
+from .arc import ARCFile
+from .warc import WARCFile, CHUNK_SIZE
+
+def _open(path):
+    if path == "-":
+        return open_file(fileobj=sys.stdin)
+    return open_file(path)
+
+def cmd_ls(args):
+    for path in args.files:
+        f = _open(path)
+        if isinstance(f, ARCFile):
+            for record, offset, length in f.browse():
+                args.out.write("%d %d %s %s\n" % (offset, length, "-", record.header.url))
+        else:
+            reader = f.reader
+            offset = f.tell()
+            record = reader.read_record()
+            while record is not None:
+                # The payload is skipped without reading it
+                reader.finish_reading_current_record()
+                next_offset = f.tell()
+                args.out.write("%d %d %s %s\n" % (offset, next_offset - offset, record.type,
+                                                  record.url or "-"))
+                offset = next_offset
+                record = reader.read_record()
+        f.close()
+
+def _copy(payload, out):
+    for chunk in iter(lambda: payload.read(CHUNK_SIZE), ""):
+        out.write(chunk)
+
+def cmd_cat(args):
+    f = _open(args.file)
+    if args.offset is None:
+        records = iter(f.read_record, None)
+    else:
+        records = [f.read_record_at(offset) for offset in args.offset]
+    for record in records:
+        if isinstance(f, ARCFile):
+            record.write_to(args.out, f.version)
+            args.out.write("\n")
+        else:
+            record.write_to(args.out)
+    f.close()
+
+def cmd_extract(args):
+    f = _open(args.file)
+    record = f.read_record_at(args.offset)
+    if record is None:
+        raise IOError("No record at offset %d" % args.offset)
+    if isinstance(f, ARCFile):
+        is_http = record.header.url.startswith("http")
+    else:
+        is_http = record.header.get("Content-Type", "").startswith("application/http")
+    if args.http_body and is_http:
+        index.read_http_headers(record.payload)
+    _copy(record.payload, args.out)
+    f.close()
+
+def cmd_index(args):
+    for path in args.files:
+        if path == "-":
+            index.write_index(_open(path), args.out, filename="-", format=args.format)
+        else:
+            index.write_index(path, args.out, format=args.format, jobs=args.jobs)
+
+def cmd_recompress(args):
+    src = _open(args.src)
+    if not isinstance(src, WARCFile):
+        raise IOError("Only WARC files can be recompressed")
+    compress = {"compresslevel": args.level}
+    if args.jobs > 1:
+        compress["threads"] = args.jobs
+    if args.dst == "-":
+        dst = WARCFile(fileobj=args.out, mode="wb", compress=compress, flush=False)
+    else:
+        dst = WARCFile(args.dst, "wb", compress=compress, flush=False,
+                       member_index=args.member_index or None)
+    try:
+        dst.write_records(iter(src.read_record, None))
+    finally:
+        dst.close()
+        src.close()
+
+def cmd_convert(args):
+    if len(args.src) == 1 and not os.path.isdir(args.dst):
+        files = [(args.src[0], args.dst)]
+    elif os.path.isdir(args.dst):
+        files = [(src, os.path.join(args.dst, convert.warc_name(os.path.basename(src))))
+                 for src in args.src]
+    else:
+        raise IOError("%s is not a directory" % args.dst)
+    for count in convert.convert_files(files, jobs=args.jobs, metadata=args.metadata):
+        pass
+
+def cmd_verify(args):
+    problems = verify.write_report(args.files, args.out, jobs=args.jobs)
+    return 1 if problems else 0
+
+def make_parser():
+    parser = argparse.ArgumentParser(prog="warc", description="Work with WARC and ARC files.")
+    commands = parser.add_subparsers(title="commands")
+
+    p = commands.add_parser("ls", help="list the records with their offsets and lengths")
+    p.add_argument("files", nargs="+", metavar="FILE")
+    p.set_defaults(func=cmd_ls)
+
+    p = commands.add_parser("cat", help="write records as they are in the file")
+    p.add_argument("file", metavar="FILE")
+    p.add_argument("--offset", type=int, action="append",
+                   help="offset of a record to write, can be repeated (default: all records)")
+    p.set_defaults(func=cmd_cat)
+
+    p = commands.add_parser("extract", help="write the payload of the record at an offset")
+    p.add_argument("file", metavar="FILE")
+    p.add_argument("offset", type=int)
+    p.add_argument("--http-body", action="store_true",
+                   help="leave out the HTTP status line and headers")
+    p.set_defaults(func=cmd_extract)
+
+    p = commands.add_parser("index", help="write a CDX or CDXJ index")
+    p.add_argument("files", nargs="+", metavar="FILE")
+    p.add_argument("--format", choices=sorted(index.FORMATS), default="cdx")
+    p.add_argument("--jobs", type=int, default=1, help="number of processes")
+    p.set_defaults(func=cmd_index)
+
+    p = commands.add_parser("recompress", help="write a WARC file with a gzip member for each record")
+    p.add_argument("src")
+    p.add_argument("dst")
+    p.add_argument("--level", type=int, default=9, help="compression level, 1 to 9")
+    p.add_argument("--jobs", type=int, default=1, help="number of compression threads")
+    p.add_argument("--member-index", action="store_true",
+                   help="write the gzip member index file next to dst")
+    p.set_defaults(func=cmd_recompress)
+
+    p = commands.add_parser("convert", help="convert ARC files to WARC files")
+    p.add_argument("src", nargs="+", help="ARC files")
+    p.add_argument("dst", help="WARC file, or directory for the WARC files")
+    p.add_argument("--metadata", action="store_true",
+                   help="write a metadata record with the ARC fields after every record")
+    p.add_argument("--jobs", type=int, default=1, help="number of processes")
+    p.set_defaults(func=cmd_convert)
+
+    p = commands.add_parser("verify", help="check the digests of the records")
+    p.add_argument("files", nargs="+", metavar="FILE")
+    p.add_argument("--jobs", type=int, default=1, help="number of processes")
+    p.set_defaults(func=cmd_verify)
+    return parser
+
+def main(argv=None, out=None):
+    parser = make_parser()
+    args = parser.parse_args(argv)
+    args.out = out or sys.stdout
+    try:
+        return args.func(args) or 0
+    except IOError as e:
+        if e.errno == errno.EPIPE:
+            # The output was closed, like by head
+            return 0
+        parser.exit(1, "warc: error: %s\n" % e)
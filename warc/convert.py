@@ -0,0 +1,212 @@
+"""
+warc.convert
+~~~~~~~~~~~~
+
+Converts ARC files to WARC files.
+
+The WARC file starts with a warcinfo record made from the header of the ARC
+file. Every ARC record becomes a response record when its url is an HTTP
+url, whose payloads are HTTP responses, and a resource record otherwise.
+With ``metadata=True``, every record is followed by a metadata record with
+the fields of the ARC record that have no WARC header, like the ARC content
+type, the result code and the checksum.
+
+    >>> from warc import convert
+    >>> convert.convert_file("crawl.arc.gz", "crawl.warc.gz")
+
+Every payload is read once, computing the WARC-Block-Digest and the
+WARC-Payload-Digest of the HTTP payload on the way. The payloads of
+uncompressed ARC files are hashed and written from a memory map of the
+file, other payloads are copied to a temporary file that is kept in memory
+only up to :data:`warc.warc.SPOOL_SIZE` bytes, so the memory used doesn't
+depend on the size of the records. Like all compressed WARC files, each
+record is written in a gzip member of its own.
+
+Many files are converted on a process pool with :func:`convert_files`.
+
+:copyright: (c) 2012 Internet Archive
+"""
+
+import hashlib
+import multiprocessing
+import os
+import tempfile
+
+from .verify import HTTPPayloadHash, iter_payload
+from .warc import WARCFile, WARCRecord, SPOOL_SIZE
+
+def _warc_date(date):
+    return date.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def warc_name(arc_name):
+    """Returns the name of the WARC file converted from an ARC file, like
+    "crawl.warc.gz" for "crawl.arc.gz".
+    """
+    head, tail = os.path.split(arc_name)
+    if ".arc" in tail:
+        tail = tail.replace(".arc", ".warc", 1)
+    else:
+        tail += ".warc.gz"
+    return os.path.join(head, tail)
+
+def make_warcinfo(arcfile, filename):
+    """Returns the warcinfo record for the WARC file `filename` converted
+    from the :class:`warc.ARCFile` `arcfile`, whose header must have been
+    read.
+    """
+    headers = arcfile.file_headers
+    fields = [("software", "warc python library"),
+              ("format", "WARC File Format 1.0"),
+              ("conformsTo", "http://bibnum.bnf.fr/WARC/WARC_ISO_28500_version1_latestdraft.pdf"),
+              ("description", "Converted from ARC version %s" % arcfile.version),
+              ("operator", headers.get("org", "")),
+              ("ip", headers.get("ip_address", ""))]
+    payload = "".join("%s: %s\r\n" % (name, value.strip()) for name, value in fields if value.strip())
+    record_headers = {
+        "WARC-Type": "warcinfo",
+        "WARC-Filename": filename,
+    }
+    if "date" in headers:
+        record_headers["WARC-Date"] = _warc_date(headers["date"])
+    return WARCRecord(payload=payload, headers=record_headers)
+
+def read_payload(payload, http=False):
+    """Reads an ARC payload once and returns a tuple of the payload to
+    write, its length, its block digest and its payload digest.
+
+    The payload digest is the digest of the HTTP payload when `http` is
+    True and the payload has HTTP headers, otherwise the digest of the
+    whole block. A memory mapped payload is returned as a buffer over the
+    map, any other payload is copied to a spooled temporary file.
+    """
+    block_hash = hashlib.sha1()
+    http_hash = HTTPPayloadHash("sha1") if http else None
+    if hasattr(payload, "view"):
+        spool = None
+    else:
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+
+    length = 0
+    for chunk in iter_payload(payload):
+        length += len(chunk)
+        block_hash.update(chunk)
+        if http_hash is not None:
+            http_hash.update(chunk)
+        if spool is not None:
+            spool.write(chunk)
+
+    block_digest = "sha1:" + block_hash.hexdigest()
+    if http_hash is not None and http_hash.found:
+        payload_digest = "sha1:" + http_hash.hash.hexdigest()
+    else:
+        payload_digest = block_digest
+    if spool is None:
+        # Viewing the payload doesn't move its position
+        return payload.view(), length, block_digest, payload_digest
+    spool.seek(0)
+    return spool, length, block_digest, payload_digest
+
+def convert_record(record, warcinfo_id=None):
+    """Returns the WARC record for an ARC record. The payload is read from
+    the ARC record.
+    """
+    header = record.header
+    http = header.url.startswith(("http:", "https:"))
+    payload, length, block_digest, payload_digest = read_payload(record.payload, http)
+    headers = {
+        "WARC-Target-URI": header.url,
+        "WARC-Date": _warc_date(header.date),
+        "Content-Length": str(length),
+        "WARC-Block-Digest": block_digest,
+        "WARC-Payload-Digest": payload_digest,
+    }
+    if http:
+        headers["WARC-Type"] = "response"
+        headers["Content-Type"] = "application/http; msgtype=response"
+    else:
+        headers["WARC-Type"] = "resource"
+        headers["Content-Type"] = header.content_type
+    if header.ip_address and header.ip_address != "-":
+        headers["WARC-IP-Address"] = header.ip_address
+    if warcinfo_id:
+        headers["WARC-Warcinfo-ID"] = warcinfo_id
+    return WARCRecord(payload=payload, headers=headers)
+
+def make_metadata(record, converted):
+    """Returns the metadata record with the fields of the ARC record
+    `record` that are not in the WARC record `converted`, or None if there
+    are none.
+    """
+    # The fields of ARC version 2 are empty in version 1 records
+    fields = [("arc-content-type", record.header.content_type),
+              ("arc-result-code", record.header.result_code),
+              ("arc-checksum", record.header.checksum),
+              ("arc-location", record.header.location)]
+    payload = "".join("%s: %s\r\n" % (name, value) for name, value in fields
+                      if value and value != "-")
+    if not payload:
+        return None
+    headers = {
+        "WARC-Type": "metadata",
+        "WARC-Target-URI": converted.url,
+        "WARC-Date": converted.date,
+        "WARC-Concurrent-To": converted.header.record_id,
+    }
+    if "WARC-Warcinfo-ID" in converted.header:
+        headers["WARC-Warcinfo-ID"] = converted.header["WARC-Warcinfo-ID"]
+    return WARCRecord(payload=payload, headers=headers)
+
+def convert_file(src, dst, compress=None, metadata=False):
+    """Converts the ARC file with the name `src` to the WARC file `dst`.
+    `compress` is passed to :class:`warc.WARCFile`. With `metadata`, a
+    metadata record is written after every record, see
+    :func:`make_metadata`. Returns the number of ARC records converted.
+    """
+    from . import open as open_file
+    arcfile = open_file(src, format="arc", mmap=True)
+    warcfile = WARCFile(dst, "wb", compress=compress, flush=False)
+    count = 0
+    try:
+        record = arcfile.read()
+        warcinfo = make_warcinfo(arcfile, os.path.basename(dst))
+        warcfile.write_record(warcinfo)
+        while record is not None:
+            converted = convert_record(record, warcinfo.header.record_id)
+            warcfile.write_record(converted)
+            if metadata:
+                metadata_record = make_metadata(record, converted)
+                if metadata_record is not None:
+                    warcfile.write_record(metadata_record)
+            count += 1
+            record = arcfile.read()
+    finally:
+        warcfile.close()
+        arcfile.close()
+    return count
+
+def _convert_task(args):
+    src, dst, options = args
+    return convert_file(src, dst, **options)
+
+def convert_files(files, jobs=1, **options):
+    """Converts ARC files to WARC files on `jobs` processes.
+
+    `files` is a list of tuples of the names of an ARC file and the WARC
+    file to write. The other arguments are passed to :func:`convert_file`.
+    Returns an iterator over the numbers of records converted, in the
+    order of the files.
+    """
+    tasks = [(src, dst, options) for src, dst in files]
+    if jobs <= 1:
+        for task in tasks:
+            yield _convert_task(task)
+        return
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for count in pool.imap(_convert_task, tasks):
+            yield count
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
@@ -0,0 +1,262 @@
+"""
+warc.dedup
+~~~~~~~~~~
+
+Deduplication of WARC files with revisit records.
+
+A response record whose HTTP payload was already written is replaced by a
+revisit record, which keeps the HTTP headers of the response and refers to
+the record with the payload by its WARC-Refers-To header. The digests of
+the payloads written are kept in a digest store, which can be kept in
+memory (:class:`MemoryDigestStore`), in a dbm file (:class:`DbmDigestStore`)
+or in a sqlite database (:class:`SqliteDigestStore`). The stores in files
+can be shared by the writers of a whole crawl.
+
+    >>> store = dedup.SqliteDigestStore("crawl-digests.db")
+    >>> writer = dedup.DedupWARCWriter(warc.open("crawl.warc.gz", "w"), store)
+    >>> writer.write_record(record)
+    >>> writer.close()
+
+Existing files are deduplicated by rewriting them with :func:`dedup_file`.
+
+:copyright: (c) 2012 Internet Archive
+"""
+
+import anydbm
+import collections
+import hashlib
+import sqlite3
+import tempfile
+from cStringIO import StringIO
+
+from .verify import MAX_HTTP_HEADERS
+from .warc import WARCFile, WARCRecord, SPOOL_SIZE, _iter_chunks
+
+REVISIT_PROFILE = "http://netpreserve.org/warc/1.0/revisit/identical-payload-digest"
+
+# Headers of the response record not copied to the revisit record
+_NOT_COPIED = set(["warc-type", "warc-record-id", "content-length", "content-type",
+                   "warc-payload-digest", "warc-block-digest", "warc-truncated"])
+
+class MemoryDigestStore:
+    """Keeps the digests in memory.
+
+    With `max_size`, only the `max_size` digests used last are kept, so that
+    the memory used is bounded and the payloads seen again most often are
+    still deduplicated.
+
+    The stores map the digest of a payload to a tuple of the record id, the
+    target URI and the date of the record with the payload.
+    """
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+
+    def get(self, digest):
+        """Returns the entry for the digest or None."""
+        try:
+            entry = self._entries.pop(digest)
+        except KeyError:
+            return None
+        # Move it to the end as used last
+        self._entries[digest] = entry
+        return entry
+
+    def put(self, digest, entry):
+        self._entries.pop(digest, None)
+        self._entries[digest] = entry
+        if self.max_size is not None and len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def close(self):
+        pass
+
+class DbmDigestStore:
+    """Keeps the digests in an on-disk hash table, with the dbm module
+    chosen by :mod:`anydbm`. The file is created if it doesn't exist.
+    """
+    def __init__(self, path, flag="c"):
+        self._db = anydbm.open(path, flag)
+
+    def get(self, digest):
+        try:
+            return tuple(self._db[digest].split("\n"))
+        except KeyError:
+            return None
+
+    def put(self, digest, entry):
+        self._db[digest] = "\n".join(entry)
+
+    def __len__(self):
+        return len(self._db)
+
+    def close(self):
+        self._db.close()
+
+class SqliteDigestStore:
+    """Keeps the digests in a sqlite database, which is created if it
+    doesn't exist. New digests are committed every `commit_every` digests
+    and on :meth:`close`.
+    """
+    def __init__(self, path, commit_every=1000):
+        self.commit_every = commit_every
+        self._db = sqlite3.connect(path)
+        self._db.execute("CREATE TABLE IF NOT EXISTS digests "
+                         "(digest TEXT PRIMARY KEY, record_id TEXT, uri TEXT, date TEXT)")
+        self._uncommitted = 0
+
+    def get(self, digest):
+        row = self._db.execute("SELECT record_id, uri, date FROM digests WHERE digest = ?",
+                               (digest,)).fetchone()
+        if row is None:
+            return None
+        return tuple(str(value) for value in row)
+
+    def put(self, digest, entry):
+        self._db.execute("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?)",
+                         (digest,) + tuple(entry))
+        self._uncommitted += 1
+        if self._uncommitted >= self.commit_every:
+            self._db.commit()
+            self._uncommitted = 0
+
+    def __len__(self):
+        return self._db.execute("SELECT COUNT(*) FROM digests").fetchone()[0]
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+def split_payload(payload):
+    """Reads the payload of a response record and returns a tuple of the
+    HTTP status line and headers, the sha1 digest of the rest of the
+    payload and the payload to write in place of the one read.
+
+    The payload can be a string or a file-like object. A file is read in
+    chunks and copied to a temporary file, which is returned. HTTP headers
+    that don't end within :data:`warc.verify.MAX_HTTP_HEADERS` bytes are
+    taken as part of the body, as when verifying the digests.
+    """
+    if isinstance(payload, basestring):
+        fileobj = StringIO(payload)
+    else:
+        fileobj = payload
+        payload = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+
+    lines = []
+    body = ""
+    line = fileobj.readline(MAX_HTTP_HEADERS)
+    if line.startswith("HTTP/"):
+        size = 0
+        while line:
+            lines.append(line)
+            size += len(line)
+            if line.strip() == "":
+                break
+            if size >= MAX_HTTP_HEADERS:
+                body = "".join(lines)
+                lines = []
+                break
+            line = fileobj.readline(MAX_HTTP_HEADERS - size)
+    else:
+        # No HTTP headers, the whole payload is the body
+        body = line
+    http_headers = "".join(lines)
+
+    sha1 = hashlib.sha1(body)
+    if not isinstance(payload, basestring):
+        payload.write(http_headers)
+        payload.write(body)
+    for chunk in _iter_chunks(fileobj):
+        sha1.update(chunk)
+        if not isinstance(payload, basestring):
+            payload.write(chunk)
+    if not isinstance(payload, basestring):
+        payload.seek(0)
+    return http_headers, "sha1:" + sha1.hexdigest(), payload
+
+class DedupWARCWriter:
+    """Writes WARC records to a :class:`warc.WARCFile`, writing revisit
+    records in place of the response records with a payload already in
+    the digest `store`.
+
+    The digest is computed over the HTTP payload of the response, without
+    the HTTP headers, which differ between fetches of the same content.
+    Other records are written as they are.
+
+    The number of records written, how many of them are revisit records and
+    the number of bytes of payloads left out are counted in
+    :attr:`records`, :attr:`revisits` and :attr:`saved_bytes`.
+    """
+    def __init__(self, warcfile, store):
+        self.warcfile = warcfile
+        self.store = store
+        self.records = 0
+        self.revisits = 0
+        self.saved_bytes = 0
+
+    def make_revisit(self, record, http_headers, digest, entry):
+        """Returns the revisit record for a response record whose payload
+        was written in the record of the store `entry`.
+        """
+        headers = dict((name, value) for name, value in record.header.original_items()
+                       if name.lower() not in _NOT_COPIED)
+        record_id, uri, date = entry
+        headers.update({
+            "WARC-Type": "revisit",
+            "Content-Type": "application/http; msgtype=response",
+            "WARC-Profile": REVISIT_PROFILE,
+            "WARC-Refers-To": record_id,
+            "WARC-Refers-To-Target-URI": uri,
+            "WARC-Refers-To-Date": date,
+            "WARC-Payload-Digest": digest,
+        })
+        return WARCRecord(payload=http_headers, headers=headers)
+
+    def write_record(self, record):
+        """Writes a record, or a revisit record in its place. Returns the
+        record written.
+        """
+        if record.type == "response":
+            http_headers, digest, record.payload = split_payload(record.payload)
+            entry = self.store.get(digest)
+            if entry is None:
+                self.store.put(digest, (record.header.record_id, record.url or "", record.date or ""))
+            else:
+                revisit = self.make_revisit(record, http_headers, digest, entry)
+                self.saved_bytes += record.header.content_length - len(http_headers)
+                self.revisits += 1
+                record = revisit
+        self.warcfile.write_record(record)
+        self.records += 1
+        return record
+
+    def close(self):
+        """Closes the WARC file. The store is left open, it can be shared
+        with other writers.
+        """
+        self.warcfile.close()
+
+def dedup_file(src, dst, store, compress=None):
+    """Rewrites the WARC file `src` as `dst`, with revisit records in place
+    of the responses with a payload in the `store` or earlier in the file.
+
+    `compress` is passed to :class:`warc.WARCFile` for writing `dst`.
+    Returns the :class:`DedupWARCWriter` used, which has the counts of
+    records written.
+    """
+    from . import open as open_file
+    reader = open_file(src)
+    try:
+        writer = DedupWARCWriter(WARCFile(dst, "wb", compress=compress, flush=False), store)
+        try:
+            for record in reader:
+                writer.write_record(record)
+        finally:
+            writer.close()
+    finally:
+        reader.close()
+    return writer
@@ -12,29 +12,65 @@ http://www.gzip.org/zlib/rfc-gzip.html
 This library provides support for creating and reading multi-member gzip files.
 """
 from gzip import WRITE, READ, write32u, GzipFile as BaseGzipFile
+import __builtin__
+import array
+import bisect
+import collections
+import os
+import Queue
+import struct
+import sys
+import threading
+import time
 import zlib
 
-def open(filename, mode="rb", compresslevel=9):
-    """Shorthand for GzipFile(filename, mode, compresslevel).
+# The first bytes of a gzip member: magic number and the deflate method.
+GZIP_MAGIC = "\037\213\010"
+
+# Compressed bytes decompressed at a time by GzipFile.skip
+SKIP_SIZE = 64 * 1024
+
+def open(filename, mode="rb", compresslevel=9, strategy=zlib.Z_DEFAULT_STRATEGY, backend=zlib):
+    """Shorthand for GzipFile(filename, mode, compresslevel, strategy=strategy, backend=backend).
     """
-    return GzipFile(filename, mode, compresslevel)
+    return GzipFile(filename, mode, compresslevel, strategy=strategy, backend=backend)
 
 class GzipFile(BaseGzipFile):
     """GzipFile with support for multi-member gzip files.
+
+    When writing, every member is compressed with the given `compresslevel`
+    and `strategy` (one of the zlib.Z_*_STRATEGY constants). The compressor
+    is created by `backend.compressobj`, which takes the same arguments as
+    `zlib.compressobj`. This allows a faster zlib compatible implementation
+    to be used in place of the zlib module.
+
+    When a :class:`MemberIndex` is given as `member_index`, every member 
+    written is added to it, which needs a file that supports tell.
     """
     def __init__(self, filename=None, mode=None, 
-                 compresslevel=9, fileobj=None):
+                 compresslevel=9, fileobj=None,
+                 strategy=zlib.Z_DEFAULT_STRATEGY, backend=zlib,
+                 member_index=None):
+        self.member_index = member_index
+        self._member_offset = None
+        # The header of the first member is written by the first write, like
+        # the headers of the other members, so that until then tell() on the
+        # file is the offset of the first member.
+        self._new_member = True
         BaseGzipFile.__init__(self, 
             filename=filename, 
             mode=mode,
             compresslevel=compresslevel,
             fileobj=fileobj)
+
+        self.compresslevel = compresslevel
+        self.strategy = strategy
+        self.backend = backend
             
         if self.mode == WRITE:
-            # Indicates the start of a new member if value is True.
-            # The BaseGzipFile constructor already wrote the header for new 
-            # member, so marking as False.
-            self._new_member = False
+            # Nothing has been compressed yet, replacing the compressor
+            # created by BaseGzipFile is safe.
+            self.compress = self._new_compressobj()
             
         # When _member_lock is True, only one member in gzip file is read
         self._member_lock = False
@@ -50,25 +86,53 @@ class GzipFile(BaseGzipFile):
         write32u(self.fileobj, self.crc)
         # self.size may exceed 2GB, or even 4GB
         write32u(self.fileobj, self.size & 0xffffffffL)
+        if self.member_index is not None:
+            end = self.fileobj.tell()
+            self.member_index.append(self._member_offset, end - self._member_offset, self.size)
         self.size = 0
-        self.compress = zlib.compressobj(9,
-                                         zlib.DEFLATED,
-                                         -zlib.MAX_WBITS,
-                                         zlib.DEF_MEM_LEVEL,
-                                         0)
+        self.compress = self._new_compressobj()
         self._new_member = True
+
+    def _new_compressobj(self):
+        return self.backend.compressobj(self.compresslevel,
+                                        zlib.DEFLATED,
+                                        -zlib.MAX_WBITS,
+                                        zlib.DEF_MEM_LEVEL,
+                                        self.strategy)
         
+    def _write_gzip_header(self):
+        # Called by BaseGzipFile.__init__, the first member is started by 
+        # _start_member instead.
+        if self._new_member:
+            return
+        if self.member_index is not None:
+            self._member_offset = self.fileobj.tell()
+        BaseGzipFile._write_gzip_header(self)
+
     def _start_member(self):
         """Starts writing a new member if required.
         """
         if self._new_member:
             self._init_write(self.name)
-            self._write_gzip_header()
             self._new_member = False
+            self._write_gzip_header()
         
     def write(self, data):
         self._start_member()
         BaseGzipFile.write(self, data)
+
+    def flush(self, zlib_mode=zlib.Z_SYNC_FLUSH):
+        """Flushes the data written so far to the file.
+
+        Between members, only the file is flushed. Flushing the compressor
+        of the next member, which hasn't been started, would write deflate
+        data that isn't part of any member.
+        """
+        if self.mode == WRITE and self._new_member:
+            self._check_closed()
+            self.fileobj.flush()
+        else:
+            BaseGzipFile.flush(self, zlib_mode)
         
     def close(self):
         """Closes the gzip with care to handle multiple members.
@@ -89,8 +153,23 @@ class GzipFile(BaseGzipFile):
         # Treat end of member as end of file when _member_lock flag is set
         if self._member_lock and self._new_member:
             raise EOFError()
-        else:
-            return BaseGzipFile._read(self, size)
+        return self._read_unlocked(size)
+
+    def _read_unlocked(self, size):
+        """Reads like BaseGzipFile._read, moving to the next member at the 
+        end of a member.
+        """
+        if self._new_member and hasattr(self.fileobj, "peek"):
+            # BaseGzipFile finds the end of the file by seeking to it, which
+            # files that can't seek (see warc.utils.PeekableFile) tell by 
+            # peeking instead.
+            if not self.fileobj.peek(1):
+                raise EOFError("Reached EOF")
+            self._init_read()
+            self._read_gzip_header()
+            self.decompress = zlib.decompressobj(-zlib.MAX_WBITS)
+            self._new_member = False
+        return BaseGzipFile._read(self, size)
             
     def read_member(self):
         """Returns a file-like object to read one member from the gzip file.
@@ -101,13 +180,86 @@ class GzipFile(BaseGzipFile):
         if self._new_member:
             try:
                 # Read one byte to move to the next member
-                BaseGzipFile._read(self, 1)
+                self._read_unlocked(1)
                 assert self._new_member is False
             except EOFError:
                 return None
         
         return self
 
+    def read_until(self, delimiter):
+        """Reads up to and including the first occurrence of `delimiter`.
+
+        The delimiter is searched for directly in the decompressed buffer, 
+        so a block of lines can be read with one call instead of one
+        readline call per line. If the delimiter is not found, everything
+        up to the end of the file (or member, when reading members) is 
+        returned.
+        """
+        offset = self.offset - self.extrastart
+        i = self.extrabuf.find(delimiter, offset)
+        readsize = 1024
+        eof = False
+        while i == -1 and not eof:
+            # Only the new data and the tail of the old data need a search
+            start = max(len(self.extrabuf) - len(delimiter) + 1, offset)
+            try:
+                self._read(readsize)
+            except EOFError:
+                eof = True
+            readsize = min(self.max_read_chunk, readsize * 2)
+            # _read drops the consumed part of the buffer when adding data
+            start -= offset
+            offset = self.offset - self.extrastart
+            i = self.extrabuf.find(delimiter, start + offset)
+
+        if i == -1:
+            size = self.extrasize
+        else:
+            size = i + len(delimiter) - offset
+        data = self.extrabuf[offset:offset+size]
+        self.extrasize -= size
+        self.offset += size
+        return data
+
+    def skip(self, size):
+        """Skips up to `size` bytes of decompressed data and returns the 
+        number of bytes skipped, which is less than `size` only at the end
+        of the file (or member, when reading members).
+
+        The data is decompressed in blocks of `SKIP_SIZE` bytes of 
+        compressed data and dropped from the buffer without making strings
+        of it, unlike reading and discarding it.
+        """
+        skipped = 0
+        while True:
+            n = min(size - skipped, self.extrasize)
+            self.extrasize -= n
+            self.offset += n
+            skipped += n
+            if skipped == size:
+                break
+            try:
+                self._read(SKIP_SIZE)
+            except EOFError:
+                break
+        return skipped
+
+    def seek_member(self, offset):
+        """Moves to the member starting at `offset` in the compressed file.
+
+        Any data buffered from the current member is discarded, so the next
+        read starts decompressing the member found at `offset`. The offset
+        must point to the beginning of a gzip member.
+        """
+        if self.mode != READ:
+            raise IOError("seek_member() on write-only GzipFile object")
+        self.fileobj.seek(offset)
+        self._new_member = True
+        self.extrabuf = ""
+        self.extrasize = 0
+        self.extrastart = self.offset
+
     def write_member(self, data):
         """Writes the given data as one gzip member.
         
@@ -119,3 +271,393 @@ class GzipFile(BaseGzipFile):
             for text in data:
                 self.write(text)
         self.close_member()
+
+
+def compress_member(chunks, compresslevel=9, strategy=zlib.Z_DEFAULT_STRATEGY, backend=zlib, mtime=None):
+    """Compresses the given strings as one complete gzip member and returns it.
+    """
+    compress = backend.compressobj(compresslevel, zlib.DEFLATED, -zlib.MAX_WBITS, 
+                                   zlib.DEF_MEM_LEVEL, strategy)
+    if mtime is None:
+        mtime = time.time()
+    # magic, method, no flags, mtime, extra flags, unknown OS
+    parts = [GZIP_MAGIC, "\000", struct.pack("<L", long(mtime) & 0xffffffffL), "\002\377"]
+    crc = zlib.crc32("") & 0xffffffffL
+    size = 0
+    for data in chunks:
+        parts.append(compress.compress(data))
+        crc = zlib.crc32(data, crc) & 0xffffffffL
+        size += len(data)
+    parts.append(compress.flush())
+    parts.append(struct.pack("<LL", crc, size & 0xffffffffL))
+    return "".join(parts)
+
+class _Job:
+    """A member waiting to be compressed by ParallelGzipWriter."""
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.size = sum(len(data) for data in chunks)
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+class ParallelGzipWriter:
+    """File-like object for writing multi-member gzip files, compressing the
+    members on a pool of threads.
+
+    Data written is collected until :meth:`close_member` is called, then the
+    member is compressed by one of the threads while the next member is 
+    being written. zlib releases the GIL while compressing, so the members
+    are compressed on multiple cores. The compressed members are written to
+    `fileobj` in the order they were closed.
+
+    At most `max_pending` members are held in memory waiting to be 
+    compressed or written, :meth:`close_member` blocks until the oldest 
+    member is written when there are more. This bounds the number of 
+    members, not their size, so the memory held grows with the size of the
+    members. With `max_pending_bytes`, :meth:`close_member` also blocks 
+    while the pending members are larger than that in total, counting the
+    data before compression.
+
+    Like with :class:`GzipFile`, the members written are added to the
+    :class:`MemberIndex` given as `member_index`.
+
+    When a member fails to compress, its error is raised by the call that
+    would have written it and by every later call, so that no member is
+    written after it. :meth:`close` stops the threads before raising it.
+    """
+    def __init__(self, fileobj, threads=4, max_pending=None, compresslevel=9,
+                 strategy=zlib.Z_DEFAULT_STRATEGY, backend=zlib, member_index=None,
+                 max_pending_bytes=None):
+        self.fileobj = fileobj
+        self.member_index = member_index
+        self.max_pending = max_pending or 2 * threads
+        self.max_pending_bytes = max_pending_bytes
+        self.compresslevel = compresslevel
+        self.strategy = strategy
+        self.backend = backend
+
+        self._chunks = []
+        self._pending = collections.deque()
+        # Size of the pending members before compression
+        self._pending_bytes = 0
+        # The first error of a member, after which nothing is written
+        self._error = None
+        self._queue = Queue.Queue()
+        self._threads = []
+        for i in range(threads):
+            t = threading.Thread(target=self._work)
+            t.setDaemon(True)
+            t.start()
+            self._threads.append(t)
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            try:
+                job.result = compress_member(job.chunks, self.compresslevel, self.strategy, self.backend)
+            except Exception as e:
+                job.error = e
+            job.chunks = None
+            job.done.set()
+
+    def _write_next(self):
+        """Waits for the oldest pending member and writes it to the file."""
+        job = self._pending.popleft()
+        self._pending_bytes -= job.size
+        job.done.wait()
+        if job.error is not None:
+            self._error = job.error
+            raise job.error
+        if self.member_index is not None:
+            self.member_index.append(self.fileobj.tell(), len(job.result), job.size)
+        self.fileobj.write(job.result)
+
+    def _check_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def _write_completed(self):
+        """Writes the members that are already compressed, in order."""
+        while self._pending and self._pending[0].done.isSet():
+            self._write_next()
+
+    def write(self, data):
+        if self.fileobj is None:
+            raise ValueError("write() on closed ParallelGzipWriter object")
+        self._check_error()
+        if data:
+            self._chunks.append(data)
+
+    def close_member(self):
+        """Closes the current member and queues it for compression.
+        """
+        self._check_error()
+        if not self._chunks:
+            return
+        job = _Job(self._chunks)
+        self._chunks = []
+        self._pending.append(job)
+        self._pending_bytes += job.size
+        self._queue.put(job)
+
+        self._write_completed()
+        while len(self._pending) > self.max_pending:
+            self._write_next()
+        if self.max_pending_bytes is not None:
+            while self._pending and self._pending_bytes > self.max_pending_bytes:
+                self._write_next()
+
+    def write_member(self, data):
+        """Writes the given data as one gzip member.
+        
+        The data can be a string or an iterator that gives strings.
+        """
+        if isinstance(data, basestring):
+            self.write(data)
+        else:
+            for text in data:
+                self.write(text)
+        self.close_member()
+
+    def flush(self, wait=False):
+        """Writes the members that are already compressed and flushes the 
+        file. Members still being compressed are waited for only if `wait`
+        is True.
+        """
+        self._check_error()
+        if wait:
+            while self._pending:
+                self._write_next()
+        else:
+            self._write_completed()
+        self.fileobj.flush()
+
+    def tell(self):
+        """Returns the offset in the compressed file after all the closed 
+        members. This waits for the pending members to be written.
+        """
+        self._check_error()
+        while self._pending:
+            self._write_next()
+        return self.fileobj.tell()
+
+    def close(self):
+        """Closes the current member, writes all pending members and stops 
+        the threads. The error of a member that failed to compress is 
+        raised after the threads are stopped.
+        """
+        if self.fileobj is None:
+            return
+        try:
+            self._check_error()
+            self.close_member()
+            while self._pending:
+                self._write_next()
+            self.fileobj.flush()
+        finally:
+            for t in self._threads:
+                self._queue.put(None)
+            for t in self._threads:
+                t.join()
+            self.fileobj = None
+
+def _is_member(fileobj, offset, validate):
+    """Checks if a valid gzip member starts at `offset`.
+    """
+    fileobj.seek(offset)
+    # 16 + MAX_WBITS makes zlib parse the gzip header as well
+    decompress = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompress.decompress(fileobj.read(4096))
+    except zlib.error:
+        return False
+    return validate is None or validate(data)
+
+def find_member(fileobj, offset, validate=None, blocksize=65536):
+    """Finds the first gzip member starting at or after `offset` in the 
+    compressed file.
+
+    Candidates are found by looking for the gzip magic number and are 
+    checked by decompressing the first few bytes of them. The optional 
+    `validate` function is called with those bytes and must return True
+    for the member to be accepted, which helps to rule out the magic number
+    appearing by chance in compressed data.
+
+    Returns the offset of the member or None if there are no more members.
+    """
+    pos = offset
+    while True:
+        fileobj.seek(pos)
+        block = fileobj.read(blocksize)
+        if len(block) < len(GZIP_MAGIC):
+            return None
+        i = block.find(GZIP_MAGIC)
+        while i != -1:
+            if _is_member(fileobj, pos+i, validate):
+                return pos+i
+            i = block.find(GZIP_MAGIC, i+1)
+        # Keep the tail of the block, a magic number may span two blocks.
+        pos += len(block) - len(GZIP_MAGIC) + 1
+
+# Suffix of the name of the member index file of a gzip file
+INDEX_SUFFIX = ".idx"
+
+# First bytes of a member index file
+INDEX_MAGIC = "GZMEMBR1"
+
+def _typecode():
+    """Returns the typecode of a 64 bit unsigned integer array, or of double,
+    which holds integers exactly up to 2**53, where there is none.
+    """
+    for typecode in "LI":
+        if array.array(typecode).itemsize == 8:
+            return typecode
+    return "d"
+
+class MemberIndex(object):
+    """Offsets and lengths of the members of a multi-member gzip file.
+
+    For each member this holds its offset and length in the compressed file
+    and the length of its decompressed data, in arrays of 64 bit numbers.
+    The index is saved in a binary file next to the gzip file, named with
+    :data:`INDEX_SUFFIX` added to its name, which starts with 
+    :data:`INDEX_MAGIC` and the number of members followed by the three 
+    arrays, as little-endian 64 bit integers.
+
+    Finding the member that contains an offset takes O(log n) time.
+
+        >>> index = MemberIndex.build(open("test.warc.gz", "rb"))
+        >>> index.save("test.warc.gz.idx")
+        >>> index = MemberIndex.load("test.warc.gz.idx")
+        >>> index.find(12345)
+        11954
+    """
+    typecode = _typecode()
+
+    def __init__(self):
+        self.offsets = array.array(self.typecode)
+        self.lengths = array.array(self.typecode)
+        self.sizes = array.array(self.typecode)
+
+    def append(self, offset, length, size):
+        """Adds a member, which must start after the members added so far."""
+        self.offsets.append(offset)
+        self.lengths.append(length)
+        self.sizes.append(size)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, i):
+        """Returns the offset, length and decompressed size of the i-th
+        member as a tuple of integers.
+        """
+        return int(self.offsets[i]), int(self.lengths[i]), int(self.sizes[i])
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+    def find(self, offset):
+        """Returns the offset of the member containing the given offset in
+        the compressed file, or None if it is past the last member.
+        """
+        i = bisect.bisect_right(self.offsets, offset) - 1
+        if i < 0 or offset >= self.offsets[i] + self.lengths[i]:
+            return None
+        return int(self.offsets[i])
+
+    def write(self, fileobj):
+        """Writes the index to a file."""
+        fileobj.write(struct.pack("<8sQ", INDEX_MAGIC, len(self)))
+        for values in [self.offsets, self.lengths, self.sizes]:
+            if values.typecode != "d" and sys.byteorder == "little":
+                fileobj.write(values.tostring())
+            else:
+                fileobj.write(struct.pack("<%dQ" % len(values), *[long(v) for v in values]))
+
+    @classmethod
+    def read(cls, fileobj):
+        """Reads an index written by :meth:`write`."""
+        header = fileobj.read(16)
+        if len(header) != 16 or header[:8] != INDEX_MAGIC:
+            raise IOError("Not a gzip member index file")
+        count = struct.unpack("<Q", header[8:])[0]
+
+        index = cls()
+        for values in [index.offsets, index.lengths, index.sizes]:
+            data = fileobj.read(8 * count)
+            if len(data) != 8 * count:
+                raise IOError("Truncated gzip member index file")
+            if values.typecode != "d" and sys.byteorder == "little":
+                values.fromstring(data)
+            else:
+                values.extend(struct.unpack("<%dQ" % count, data))
+        return index
+
+    def save(self, path):
+        """Writes the index to the file `path`."""
+        f = __builtin__.open(path, "wb")
+        try:
+            self.write(f)
+        finally:
+            f.close()
+
+    @classmethod
+    def load(cls, path):
+        """Reads the index from the file `path`."""
+        f = __builtin__.open(path, "rb")
+        try:
+            return cls.read(f)
+        finally:
+            f.close()
+
+    @classmethod
+    def build(cls, fileobj, blocksize=16384):
+        """Builds the index of a gzip file by decompressing it from the 
+        current position. The decompressed data is counted, not kept.
+        """
+        index = cls()
+        offset = fileobj.tell()
+        # Compressed data read past the end of the last member
+        data = ""
+        while True:
+            data = data or fileobj.read(blocksize)
+            if not data:
+                break
+            decompress = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            length = size = 0
+            while data:
+                length += len(data)
+                # max_length is not used to limit the memory use, zlib in 
+                # Python 2 mixes up unused_data and unconsumed_tail with it.
+                size += len(decompress.decompress(data))
+                if decompress.unused_data:
+                    break
+                data = fileobj.read(blocksize)
+            size += len(decompress.flush())
+            data = decompress.unused_data
+            length -= len(data)
+            index.append(offset, length, size)
+            offset += length
+        return index
+
+def load_index(path):
+    """Loads the member index file of the gzip file named `path`.
+
+    Returns None if there is no index file or if it is out of date, which
+    is when it is older than the gzip file or its last member doesn't end
+    where the gzip file ends, like after the gzip file was rewritten or 
+    appended to without updating the index.
+    """
+    index_path = path + INDEX_SUFFIX
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(path):
+        return None
+    index = MemberIndex.load(index_path)
+    end = index[-1][0] + index[-1][1] if len(index) else 0
+    if end != os.path.getsize(path):
+        return None
+    return index
@@ -0,0 +1,353 @@
+"""
+warc.index
+~~~~~~~~~~
+
+Builds CDX and CDXJ indexes of WARC and ARC files.
+
+Each indexed record produces one entry with the SURT form of the url, the
+timestamp, the original url, the mime type, the HTTP status code, the payload
+digest, the redirect location, the length and offset of the record in the
+file and the name of the file. Only the HTTP status line and headers are read
+from the payload of each record.
+
+    >>> from warc import index
+    >>> index.write_index("test.warc.gz", sys.stdout)
+
+The entries are written in the order of the records in the file. CDX files
+are expected to be sorted, which is left to tools like `sort`.
+
+Compressed WARC files can be indexed on multiple processes by passing the
+number of processes as `jobs`. The file is split into ranges at gzip member
+boundaries and each range is indexed by a separate process.
+
+    >>> index.write_index("test.warc.gz", sys.stdout, jobs=4)
+
+:copyright: (c) 2012 Internet Archive
+"""
+
+import bisect
+import json
+import multiprocessing
+import os
+import re
+import urlparse
+from cStringIO import StringIO
+
+from . import gzip2
+from .arc import ARCFile
+from .warc import WARCFile
+from .utils import CaseInsensitiveDict
+
+# Fields of each index entry, in the order of the CDX format.
+FIELDS = ["urlkey", "timestamp", "url", "mime", "status", "digest",
+          "redirect", "metatags", "length", "offset", "filename"]
+
+CDX_HEADER = " CDX N b a m s k r M S V g"
+
+# Fields written in the JSON block of CDXJ lines, in that order.
+CDXJ_FIELDS = ["url", "mime", "status", "digest", "redirect", "length",
+               "offset", "filename"]
+
+# WARC record types that end up in the index.
+INDEXED_TYPES = ["response", "revisit", "resource"]
+
+RE_STATUS_LINE = re.compile(r"HTTP/\d\.\d +(\d{3})")
+RE_WWW = re.compile(r"^www\d*\.")
+
+DEFAULT_PORTS = {"http": "80", "https": "443"}
+
+def surt(url):
+    """Returns the SURT (Sort-friendly URI Reordering Transform) form of the
+    url, which is used as the key in CDX files.
+
+        >>> surt("http://www.Example.com:80/a/b?y=2&x=1")
+        'com,example)/a/b?x=1&y=2'
+
+    Urls with schemes other than http and https are only lower-cased.
+    """
+    scheme, netloc, path, query, fragment = urlparse.urlsplit(url.strip())
+    scheme = scheme.lower()
+    if scheme not in DEFAULT_PORTS or not netloc:
+        return url.strip().lower()
+
+    host = netloc.rpartition("@")[2].lower()
+    host, sep, port = host.partition(":")
+    host = RE_WWW.sub("", host.strip("."))
+
+    key = ",".join(reversed(host.split(".")))
+    if sep and port != DEFAULT_PORTS[scheme]:
+        key += ":" + port
+    key += ")" + (path or "/")
+    if query:
+        key += "?" + "&".join(sorted(query.split("&")))
+    return key.lower()
+
+def _format_timestamp(date):
+    """Converts WARC date "2012-02-10T16:15:52Z" to "20120210161552"."""
+    return re.sub(r"\D", "", date)[:14]
+
+def _format_digest(digest):
+    if not digest:
+        return "-"
+    return digest.partition(":")[2] or digest
+
+def read_http_headers(fileobj):
+    """Reads the HTTP status line and headers from the beginning of a payload.
+
+    Returns a tuple of the status code and a :class:`CaseInsensitiveDict` of
+    headers. The status code is None when the payload doesn't start with an
+    HTTP status line. Nothing beyond the end of the headers is read.
+    """
+    headers = CaseInsensitiveDict()
+    m = RE_STATUS_LINE.match(fileobj.readline())
+    if not m:
+        return None, headers
+
+    while True:
+        line = fileobj.readline()
+        if line.strip() == "":
+            break
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip()] = value.strip()
+    return m.group(1), headers
+
+def _make_entry(url, timestamp, mime, status, digest, redirect):
+    return {
+        "urlkey": surt(url),
+        "timestamp": timestamp,
+        "url": url,
+        "mime": mime or "-",
+        "status": status or "-",
+        "digest": digest or "-",
+        "redirect": redirect or "-",
+        "metatags": "-",
+    }
+
+def _warc_entry(record):
+    header = record.header
+    if header.type not in INDEXED_TYPES or not record.url:
+        return None
+
+    if header.get("Content-Type", "").startswith("application/http"):
+        status, http_headers = read_http_headers(record.payload)
+        mime = http_headers.get("Content-Type", "").partition(";")[0].strip()
+    else:
+        status, http_headers = None, {}
+        mime = header.get("Content-Type")
+
+    if header.type == "revisit":
+        mime = "warc/revisit"
+
+    return _make_entry(url=record.url,
+                       timestamp=_format_timestamp(record.date or ""),
+                       mime=mime,
+                       status=status,
+                       digest=_format_digest(header.get("WARC-Payload-Digest")),
+                       redirect=http_headers.get("Location"))
+
+def _arc_entry(record):
+    header = record.header
+    payload = record.payload
+    if isinstance(payload, basestring):
+        payload = StringIO(payload)
+
+    if header['url'].startswith("http"):
+        status, http_headers = read_http_headers(payload)
+    else:
+        status, http_headers = None, {}
+
+    checksum = header['checksum']
+    return _make_entry(url=header['url'],
+                       timestamp=header['date'],
+                       mime=header['content_type'],
+                       status=status,
+                       digest=checksum if checksum != "-" else None,
+                       redirect=http_headers.get("Location"))
+
+def _iter_warc(f, end=None):
+    """Yields index entries for the records of a WARC file, stopping at the
+    first record starting at or after `end`, if given.
+    """
+    reader = f.reader
+    offset = f.tell()
+    while end is None or offset < end:
+        record = reader.read_record()
+        if record is None:
+            break
+        entry = _warc_entry(record)
+        # The rest of the payload is skipped without looking at it.
+        reader.finish_reading_current_record()
+        next_offset = f.tell()
+        if entry is not None:
+            entry['offset'] = offset
+            entry['length'] = next_offset - offset
+            yield entry
+        offset = next_offset
+
+def _iter_arc(f):
+    """Yields index entries for the records of an ARC file."""
+    if not f.header_read:
+        f._read_file_header()
+    offset = f.tell()
+    for record in f:
+        entry = _arc_entry(record)
+        # The rest of the payload is skipped without looking at it.
+        f._finish_reading_current_record()
+        next_offset = f.tell()
+        entry['offset'] = offset
+        entry['length'] = next_offset - offset
+        yield entry
+        offset = next_offset
+
+def _is_warc_member(data):
+    return data.startswith("WARC/")
+
+def split_ranges(path, count):
+    """Splits a compressed WARC file into at most `count` ranges of about the
+    same size, starting at gzip members. Returns a list of (start, end) 
+    offsets in the compressed file.
+
+    The members are taken from the member index file next to the WARC file
+    when it is up to date (see :func:`warc.gzip2.load_index`), otherwise 
+    they are found by looking for gzip headers in the file.
+    """
+    size = os.path.getsize(path)
+    fileobj = None
+    member_index = gzip2.load_index(path)
+    if member_index is not None:
+        offsets = member_index.offsets
+        find_member = lambda offset: _next_offset(offsets, offset)
+    else:
+        fileobj = open(path, "rb")
+        find_member = lambda offset: gzip2.find_member(fileobj, offset, _is_warc_member)
+
+    boundaries = [0]
+    try:
+        for i in range(1, count):
+            start = find_member(max(size*i//count, boundaries[-1]+1))
+            if start is None:
+                break
+            boundaries.append(start)
+    finally:
+        if fileobj is not None:
+            fileobj.close()
+    boundaries.append(size)
+    return zip(boundaries[:-1], boundaries[1:])
+
+def _next_offset(offsets, offset):
+    """Returns the first of the sorted offsets at or after `offset`."""
+    i = bisect.bisect_left(offsets, offset)
+    if i == len(offsets):
+        return None
+    return int(offsets[i])
+
+def _index_range(args):
+    """Returns index entries of the records starting in the given range of a
+    compressed WARC file. Runs in the worker processes.
+    """
+    path, start, end = args
+    f = WARCFile(path, compress=True)
+    try:
+        f.seek(start)
+        return list(_iter_warc(f, end))
+    finally:
+        f.close()
+
+def _iter_parallel(path, jobs):
+    # More ranges than processes to keep all the processes busy when some 
+    # parts of the file are slower to index than others.
+    tasks = [(path, start, end) for start, end in split_ranges(path, jobs*4)]
+    pool = multiprocessing.Pool(jobs)
+    try:
+        # imap returns the results in the order of the ranges
+        for entries in pool.imap(_index_range, tasks):
+            for entry in entries:
+                yield entry
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def _is_compressed_warc(path):
+    from . import SNIFF_SIZE, sniff_format
+    fileobj = open(path, "rb")
+    try:
+        return sniff_format(fileobj.read(SNIFF_SIZE)) == ("warc", True)
+    finally:
+        fileobj.close()
+
+def iter_index(f, filename=None, jobs=1):
+    """Returns an iterator over index entries of the records in `f`.
+
+    :param f: An instance of :class:`warc.WARCFile` or :class:`warc.ARCFile`
+              or the name of a file to open.
+    :param filename: The filename to put in the entries. Defaults to the
+                     basename of `f` when it is a filename.
+    :param jobs: Number of processes to use. Only compressed WARC files given
+                 by name are indexed in parallel, others are indexed on the
+                 current process.
+
+    Each entry is a dictionary with the keys listed in :data:`FIELDS`.
+    """
+    if isinstance(f, basestring) and jobs > 1 and _is_compressed_warc(f):
+        filename = filename or os.path.basename(f)
+        for entry in _iter_parallel(f, jobs):
+            entry['filename'] = filename
+            yield entry
+        return
+
+    opened = None
+    if isinstance(f, basestring):
+        from . import open as open_file
+        filename = filename or os.path.basename(f)
+        f = opened = open_file(f)
+
+    try:
+        if isinstance(f, ARCFile):
+            entries = _iter_arc(f)
+        else:
+            entries = _iter_warc(f)
+
+        for entry in entries:
+            entry['filename'] = filename or "-"
+            yield entry
+    finally:
+        if opened is not None:
+            opened.close()
+
+def format_cdx(entry):
+    """Formats an index entry as a line of a CDX file, in the order of
+    :data:`CDX_HEADER`, without the trailing newline.
+    """
+    return " ".join(str(entry[name]).replace(" ", "%20") for name in FIELDS)
+
+def format_cdxj(entry):
+    """Formats an index entry as a line of a CDXJ file, without the trailing
+    newline.
+    """
+    fields = ['"%s": %s' % (name, json.dumps(str(entry[name])))
+              for name in CDXJ_FIELDS if entry[name] != "-"]
+    return "%s %s {%s}" % (entry['urlkey'], entry['timestamp'], ", ".join(fields))
+
+FORMATS = {
+    "cdx": format_cdx,
+    "cdxj": format_cdxj,
+}
+
+def write_index(f, out, filename=None, format="cdx", jobs=1):
+    """Writes the index of the records in `f` to the file object `out`.
+
+    :param f: An instance of :class:`warc.WARCFile` or :class:`warc.ARCFile`
+              or the name of a file to open.
+    :param format: "cdx" or "cdxj". CDX output starts with the CDX header line.
+    :param jobs: Number of processes to use, see :func:`iter_index`.
+    """
+    if format not in FORMATS:
+        raise ValueError("Unknown index format: %r" % format)
+    formatter = FORMATS[format]
+
+    if format == "cdx":
+        out.write(CDX_HEADER + "\n")
+    for entry in iter_index(f, filename, jobs=jobs):
+        out.write(formatter(entry) + "\n")
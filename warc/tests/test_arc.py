@@ -1,5 +1,7 @@
 import datetime
+import gzip
 import hashlib
+import pickle
 import StringIO
 
 from .. import arc
@@ -109,6 +111,20 @@ def test_arc_v2_record_creation():
     record_v2_string = f.getvalue()
     assert record_v2_string == "http://archive.org 127.0.0.1 20120301093000 text/html 200 a123456 http://www.archive.org 300 sample.arc.gz 500\nBlahBlah\n"
 
+def test_arc_record_pickle():
+    "Make sure that ARC records and headers can be pickled"
+    record = arc.ARCRecord(payload = "BlahBlah", version = 1, headers = dict(url = "http://archive.org",
+                                                                           ip_address = "127.0.0.1",
+                                                                           date = "20120301093000",
+                                                                           content_type = "text/html",
+                                                                           length = "8"))
+    for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+        copy = pickle.loads(pickle.dumps(record, protocol))
+        assert (copy.payload, copy.version) == ("BlahBlah", 1)
+        assert copy.header == record.header
+        assert copy.header.version == 1
+        assert str(copy) == str(record)
+
 def test_arc_v1_writer():
     "Try writing records to an ARC V1 file. This is what API will feel like to a user of the library"
     now = "20120302193210"
@@ -210,29 +226,33 @@ def test_arc_reader_v1():
     v1 = StringIO.StringIO("filedesc://sample.arc 127.0.0.1 20120302193210 text/plain 68\n1 0 Unknown\nURL IP-address Archive-date Content-type Archive-length\n\n\nhttp://www.archive.org 127.0.0.1 20120302193210 text/html 8\nPayload1\nhttp://archive.org 127.0.0.1 20120302193211 text/plain 8\nPayload2")
     arc_file = arc.ARCFile(fileobj = v1)    
 
+    # The payload must be read before reading the next record
     r1  = arc_file.read()
+    p1 = r1.payload.read()
     r2  = arc_file.read()
+    p2 = r2.payload.read()
     
     assert r1['url'] == "http://www.archive.org"
     assert r1['ip_address'] == "127.0.0.1"
     assert r1['date'] == "20120302193210"
     assert r1['content_type'] == "text/html"
     assert r1['length'] == "8"
-    assert r1.payload == "Payload1"
+    assert p1 == "Payload1"
 
     assert r2['url'] == "http://archive.org"
     assert r2['ip_address'] == "127.0.0.1"
     assert r2['date'] == "20120302193211"
     assert r2['content_type'] == "text/plain"
     assert r2['length'] == "8"
-    assert r2.payload == "Payload2"
+    assert p2 == "Payload2"
 
 
 def test_arc_reader_v2():    
     "Make sure that the parser reads out V2 ARC records. (Also tests iterator behaviour)"
     v2 = StringIO.StringIO("filedesc://sample.arc 127.0.0.1 20120302193210 text/plain 200 - - 0 sample.arc 114\n2 0 Internet Archive\nURL IP-address Archive-date Content-type Result-code Checksum Location Offset Filename Archive-length\n\n\nhttp://archive.org 127.0.0.1 20120301093000 text/html 200 a123456 http://www.archive.org 300 sample.arc.gz 8\nPayload1\nhttp://archive.org 127.0.0.1 20120301093000 text/html 200 a123456 http://www.archive.org 300 sample.arc.gz 8\nPayload2")
     arc_file = arc.ARCFile(fileobj = v2)    
-    r1, r2 = list(arc_file)
+    records = [(r, r.payload.read()) for r in arc_file]
+    (r1, p1), (r2, p2) = records
     
     assert r1['url'] == "http://archive.org"
     assert r1['ip_address'] == "127.0.0.1"
@@ -243,7 +263,21 @@ def test_arc_reader_v2():
     assert r1['offset'] == "300"
     assert r1['filename'] == "sample.arc.gz"
     assert r1['length'] == "8"
-    assert r1.payload == "Payload1"
+    assert p1 == "Payload1"
+    assert p2 == "Payload2"
+
+def test_arc_reader_skips_unread_payload():
+    "Make sure that payloads not read by the caller are skipped by the next read"
+    payload = "x" * 100000 + "\nhttp://fake 127.0.0.1 20120302193210 text/plain 4\nfake"
+    v1 = StringIO.StringIO("filedesc://sample.arc 127.0.0.1 20120302193210 text/plain 68\n1 0 Unknown\nURL IP-address Archive-date Content-type Archive-length\n\n\nhttp://www.archive.org 127.0.0.1 20120302193210 text/html %d\n%s\nhttp://archive.org 127.0.0.1 20120302193211 text/plain 8\nPayload2\n" % (len(payload), payload))
+    arc_file = arc.ARCFile(fileobj = v1)
+
+    r1 = arc_file.read()
+    assert r1.payload.read(5) == "xxxxx"
+    r2 = arc_file.read()
+    assert r2['url'] == "http://archive.org"
+    assert r2.payload.read() == "Payload2"
+    assert arc_file.read() is None
 
 def test_arc_v1_record_from_string():
     "Validate ARC V1 record creation from string"
@@ -298,3 +332,68 @@ def test_arc_record_versions():
     record_string = f.getvalue()
     assert record_string == "http://archive.org 127.0.0.1 20120301093000 text/html 200 a123456 http://www.archive.org 300 sample.arc.gz 500\nBlahBlah\n"
 
+
+def test_arc_gz_reader():
+    "Make sure that gzip compressed ARC files are read member by member"
+    arc_file = arc.ARCFile("test_data/alexa_short_header.arc.gz")
+    assert arc_file.compressed
+    records = [(r['url'], r.payload.read(), offset, size) for r, offset, size in arc_file.browse()]
+    assert records == [("http://www.killerjo.net:80/robots.txt",
+                        "SSH-2.0-OpenSSH_5.3p1 Debian-3ubuntu3\r\n", 161, 139)]
+    assert arc_file.read_record_at(161)['url'] == "http://www.killerjo.net:80/robots.txt"
+    arc_file.close()
+
+def test_arc_gz_single_member(tmpdir):
+    "Make sure that an ARC file compressed as a single gzip member is read like the uncompressed file"
+    header_payload = "1 0 Internet Archive\nURL IP-address Archive-date Content-type Archive-length\n<arcmetadata/>\n"
+    data = ("filedesc://sample.arc 127.0.0.1 20120302193210 text/plain %d\n%s\n" % (len(header_payload), header_payload) +
+            "http://www.archive.org 127.0.0.1 20120302193210 text/html 8\nPayload1\n" +
+            "http://archive.org 127.0.0.1 20120302193211 text/plain 8\nPayload2\n")
+    tmpdir.join("sample.arc").write(data)
+    f = gzip.open(str(tmpdir.join("sample.arc.gz")), "wb")
+    f.write(data)
+    f.close()
+
+    for name in ["sample.arc", "sample.arc.gz"]:
+        arc_file = arc.ARCFile(str(tmpdir.join(name)))
+        assert [(r['url'], r.payload.read()) for r in arc_file] == [("http://www.archive.org", "Payload1"),
+                                                                   ("http://archive.org", "Payload2")]
+        assert arc_file.file_headers['org'] == "Internet Archive\n"
+        arc_file.close()
+
+def test_arc_gz_writer(tmpdir):
+    "Make sure that each record is written as a gzip member and can be read back at its offset"
+    path = str(tmpdir.join("sample.arc.gz"))
+    arc_file = arc.ARCFile(path, "wb", version = 1, file_headers = dict(ip_address = "127.0.0.1",
+                                                                          date = datetime.datetime(2012, 3, 1),
+                                                                          org = "Internet Archive"))
+    ends = []
+    for i in range(3):
+        payload = "Payload%d" % i
+        arc_file.write(arc.ARCRecord(payload = payload, headers = dict(url = "http://archive.org/%d" % i,
+                                                                       ip_address = "127.0.0.1",
+                                                                       date = "20120301093000",
+                                                                       content_type = "text/plain",
+                                                                       length = len(payload))))
+        ends.append(arc_file.tell())
+    arc_file.close()
+
+    arc_file = arc.ARCFile(path)
+    assert [r.payload.read() for r in arc_file] == ["Payload0", "Payload1", "Payload2"]
+    offsets = [(offset, size) for r, offset, size in arc.ARCFile(path).browse()]
+    assert [offset + size for offset, size in offsets] == ends
+    assert arc.ARCFile(path).read_record_at(ends[1])['url'] == "http://archive.org/2"
+
+def test_arc_mmap_reader(tmpdir):
+    "Make sure that memory mapped ARC files give the same records"
+    path = tmpdir.join("sample.arc")
+    path.write("filedesc://sample.arc 127.0.0.1 20120302193210 text/plain 68\n1 0 Unknown\nURL IP-address Archive-date Content-type Archive-length\n\n\nhttp://www.archive.org 127.0.0.1 20120302193210 text/html 8\nPayload1\nhttp://archive.org 127.0.0.1 20120302193211 text/plain 8\nPayload2\n")
+    arc_file = arc.ARCFile(str(path), mmap = True)
+    assert arc_file.mapped
+    r1 = arc_file.read()
+    assert str(r1.payload.view()) == "Payload1"
+    r2 = arc_file.read()
+    assert r2['url'] == "http://archive.org"
+    assert r2.payload.read() == "Payload2"
+    assert arc_file.read() is None
+    arc_file.close()
@@ -0,0 +1,91 @@
+import sys
+from cStringIO import StringIO
+
+from .. import cli
+from ..warc import WARCFile, WARCRecord
+from .test_convert import write_arc, HTTP_RESPONSE
+
+import pytest
+
+def write_warc(path, compress=False):
+    f = WARCFile(path, "wb", compress=compress)
+    offsets = []
+    for i in range(3):
+        offsets.append(f.tell())
+        f.write_record(WARCRecord(payload=HTTP_RESPONSE + str(i), headers={
+            "WARC-Type": "response",
+            "WARC-Target-URI": "http://example.com/%d" % i,
+        }))
+    f.close()
+    return offsets
+
+def run(*argv):
+    out = StringIO()
+    status = cli.main(list(argv), out=out)
+    return status, out.getvalue()
+
+def test_ls(tmpdir, monkeypatch):
+    path = str(tmpdir.join("test.warc.gz"))
+    offsets = write_warc(path, compress=True)
+    status, output = run("ls", path)
+    lines = [line.split() for line in output.splitlines()]
+    assert [int(offset) for offset, length, type, url in lines] == offsets
+    assert [url for offset, length, type, url in lines] == ["http://example.com/%d" % i for i in range(3)]
+
+    monkeypatch.setattr(sys, "stdin", open(path, "rb"))
+    assert run("ls", "-") == (0, output)
+
+    arc = str(tmpdir.join("test.arc"))
+    write_arc(arc)
+    status, output = run("ls", arc)
+    assert [line.split()[3] for line in output.splitlines()] == ["http://example.com/", "dns:example.com"]
+
+def test_cat_extract(tmpdir):
+    path = str(tmpdir.join("test.warc"))
+    offsets = write_warc(path)
+    data = open(path, "rb").read()
+
+    assert run("cat", path) == (0, data)
+    assert run("cat", path, "--offset", str(offsets[1])) == (0, data[offsets[1]:offsets[2]])
+    assert run("extract", path, str(offsets[2])) == (0, HTTP_RESPONSE + "2")
+    assert run("extract", "--http-body", path, str(offsets[2])) == (0, "hello2")
+
+def test_index_verify(tmpdir):
+    path = str(tmpdir.join("test.warc.gz"))
+    write_warc(path, compress=True)
+    status, output = run("index", "--format", "cdxj", path)
+    assert len(output.splitlines()) == 3
+    assert output.startswith("com,example)/0 ")
+
+    status, output = run("verify", path)
+    assert status == 0
+    assert output == "3 records verified, 0 problems found\n"
+
+def test_recompress(tmpdir):
+    src = str(tmpdir.join("test.warc"))
+    dst = str(tmpdir.join("test.warc.gz"))
+    write_warc(src)
+    assert run("recompress", "--level", "1", "--jobs", "2", "--member-index", src, dst)[0] == 0
+    assert tmpdir.join("test.warc.gz.idx").check()
+    assert [r.payload.read() for r in WARCFile(dst)] == [HTTP_RESPONSE + str(i) for i in range(3)]
+
+    status, output = run("recompress", dst, "-")
+    assert [r.payload.read() for r in WARCFile(fileobj=StringIO(output), compress=True)] == \
+        [HTTP_RESPONSE + str(i) for i in range(3)]
+
+def test_convert(tmpdir):
+    src = str(tmpdir.join("test.arc"))
+    dst = str(tmpdir.join("test.warc"))
+    write_arc(src)
+    assert run("convert", src, dst)[0] == 0
+    assert [r.type for r in WARCFile(dst)] == ["warcinfo", "response", "resource"]
+
+    out = tmpdir.mkdir("out")
+    assert run("convert", "--jobs", "2", "--metadata", src, str(out))[0] == 0
+    assert [r.type for r in WARCFile(str(out.join("test.warc")))] == \
+        ["warcinfo", "response", "metadata", "resource", "metadata"]
+
+def test_error(tmpdir):
+    with pytest.raises(SystemExit) as e:
+        run("ls", str(tmpdir.join("missing.warc")))
+    assert e.value.code == 1
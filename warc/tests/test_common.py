@@ -1,7 +1,9 @@
 from .. import open as libopen
-from .. import WARCFile, ARCFile
+from .. import WARCFile, WARCRecord, ARCFile, ARCRecord, sniff_format
+from .test_utils import Unseekable
 
 import os
+from cStringIO import StringIO
 
 import pytest
 
@@ -39,6 +41,52 @@ def test_sample_data():
 SSH-2.0-OpenSSH_5.3p1 Debian-3ubuntu3\r\n\n"""
     assert record == expected
 
+def make_warc(compress):
+    buffer = StringIO()
+    f = WARCFile(fileobj=buffer, mode="wb", compress=compress)
+    for i in range(3):
+        f.write_record(WARCRecord(payload="hello %d" % i))
+    # every record is a complete gzip member
+    return buffer.getvalue()
 
-    
+def make_arc(compress):
+    # cStringIO objects don't take a name
+    from StringIO import StringIO as NamedStringIO
+    buffer = NamedStringIO()
+    buffer.name = "sample.arc"
+    f = ARCFile(fileobj=buffer, mode="wb", compress=compress, version=1,
+                file_headers={"ip_address": "127.0.0.1", "date": "20120301093000", "org": "test"})
+    f.write(ARCRecord(payload="hello", headers={"url": "http://example.com/", "ip_address": "127.0.0.1",
+                                                "date": "20120301093000", "content_type": "text/plain",
+                                                "length": 5}))
+    return buffer.getvalue()
+
+def test_sniff_format():
+    assert sniff_format(make_warc(False)) == ("warc", False)
+    assert sniff_format(make_warc(True)) == ("warc", True)
+    assert sniff_format(make_arc(False)) == ("arc", False)
+    assert sniff_format(make_arc(True)[:100]) == ("arc", True)
+    assert sniff_format("") == ("unknown", False)
+    assert sniff_format("\037\213\010\000" + "\000" * 6 + "\xff" * 20) == ("unknown", True)
+
+def test_open_sniffed(tmpdir):
+    for compress in [False, True]:
+        data = make_warc(compress)
+        path = tmpdir.join("upstream-object")
+        path.write(data, "wb")
+        for f in [libopen(str(path)), libopen(fileobj=StringIO(data)), libopen(fileobj=Unseekable(data))]:
+            assert isinstance(f, WARCFile)
+            assert [r.payload.read() for r in f] == ["hello %d" % i for i in range(3)]
+            f.close()
+
+        f = libopen(fileobj=Unseekable(make_arc(compress)))
+        assert isinstance(f, ARCFile)
+        assert f.read().payload.read() == "hello"
+
+    # the name is used when the contents don't tell
+    path = tmpdir.join("empty.warc")
+    path.write("")
+    assert isinstance(libopen(str(path)), WARCFile)
+    with pytest.raises(IOError):
+        libopen(fileobj=StringIO("hello"))
 
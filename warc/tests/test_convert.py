@@ -0,0 +1,78 @@
+from StringIO import StringIO
+
+import hashlib
+
+from .. import convert, verify
+from ..arc import ARCFile, ARCRecord
+from ..warc import WARCFile
+
+HTTP_RESPONSE = "HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\nhello"
+
+def write_arc(path, compress=False, version=1):
+    f = ARCFile(path, "wb", compress=compress, version=version,
+                file_headers={"ip_address": "10.0.0.1", "date": "20120301093000", "org": "Test Archive"})
+    f.write(ARCRecord(payload=HTTP_RESPONSE, headers={
+        "url": "http://example.com/", "ip_address": "127.0.0.1", "date": "20120301093010",
+        "content_type": "text/plain", "length": len(HTTP_RESPONSE)}))
+    f.write(ARCRecord(payload="127.0.0.1\n", headers={
+        "url": "dns:example.com", "ip_address": "10.0.0.2", "date": "20120301093011",
+        "content_type": "text/dns", "length": 10}))
+    f.close()
+
+def test_convert_file(tmpdir):
+    for compress in [False, True]:
+        src = str(tmpdir.join("test.arc" + (".gz" if compress else "")))
+        dst = str(tmpdir.join("test.warc.gz"))
+        write_arc(src, compress)
+        assert convert.convert_file(src, dst) == 2
+
+        records = []
+        for record in WARCFile(dst):
+            records.append((record.header, record.payload.read()))
+        warcinfo, payload = records[0]
+        assert warcinfo.type == "warcinfo"
+        assert warcinfo['WARC-Filename'] == "test.warc.gz"
+        assert warcinfo['WARC-Date'] == "2012-03-01T09:30:00Z"
+        assert "operator: Test Archive\r\n" in payload
+
+        response, payload = records[1]
+        assert response.type == "response"
+        assert response['WARC-Target-URI'] == "http://example.com/"
+        assert response['WARC-Date'] == "2012-03-01T09:30:10Z"
+        assert response['WARC-IP-Address'] == "127.0.0.1"
+        assert response['WARC-Warcinfo-ID'] == warcinfo.record_id
+        assert response['Content-Type'] == "application/http; msgtype=response"
+        assert payload == HTTP_RESPONSE
+
+        resource, payload = records[2]
+        assert resource.type == "resource"
+        assert resource['Content-Type'] == "text/dns"
+        assert payload == "127.0.0.1\n"
+        assert response['WARC-Payload-Digest'] == "sha1:" + hashlib.sha1("hello").hexdigest()
+        assert list(verify.verify_files([dst])) == []
+
+def test_metadata(tmpdir):
+    src = str(tmpdir.join("test.arc"))
+    dst = str(tmpdir.join("test.warc"))
+    write_arc(src, version=2)
+    convert.convert_file(src, dst, metadata=True)
+    records = [(record.header, record.payload.read()) for record in WARCFile(dst)]
+    assert [header.type for header, payload in records] == ["warcinfo", "response", "metadata", "resource", "metadata"]
+    header, payload = records[2]
+    assert header['WARC-Concurrent-To'] == records[1][0].record_id
+    assert header['WARC-Target-URI'] == "http://example.com/"
+    assert "arc-content-type: text/plain\r\n" in payload
+
+def test_convert_files(tmpdir):
+    files = []
+    for i in range(3):
+        src = str(tmpdir.join("test-%d.arc.gz" % i))
+        write_arc(src, compress=True)
+        files.append((src, convert.warc_name(src)))
+    assert files[0][1] == str(tmpdir.join("test-0.warc.gz"))
+    assert list(convert.convert_files(files, jobs=2, compress={"threads": 2})) == [2, 2, 2]
+    for src, dst in files:
+        assert [r.type for r in WARCFile(dst)] == ["warcinfo", "response", "resource"]
+
+    assert convert.warc_name("dir/crawl") == "dir/crawl.warc.gz"
+
@@ -0,0 +1,142 @@
+import hashlib
+from cStringIO import StringIO
+
+from ..warc import WARCFile, WARCRecord
+from ..dedup import (MemoryDigestStore, DbmDigestStore, SqliteDigestStore, DedupWARCWriter,
+                     REVISIT_PROFILE, dedup_file, split_payload)
+
+import pytest
+
+def response(body, date="Fri, 10 Feb 2012 16:15:52 GMT", uri="http://example.com/"):
+    payload = ("HTTP/1.1 200 OK\r\n"
+               "Date: %s\r\n"
+               "Content-Type: text/plain\r\n"
+               "\r\n" % date) + body
+    return WARCRecord(payload=payload, headers={
+        "WARC-Type": "response",
+        "WARC-Target-URI": uri,
+        "WARC-IP-Address": "127.0.0.1",
+    })
+
+def test_split_payload():
+    payload = "HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\nhello"
+    http_headers, digest, rest = split_payload(payload)
+    assert http_headers == "HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\n"
+    assert digest == "sha1:aaf4c61ddcc5e8a2dabede0f3b482cd9aea9434d"
+    assert rest == payload
+
+    http_headers, digest2, rest = split_payload(StringIO(payload))
+    assert digest2 == digest
+    assert rest.read() == payload
+
+    assert split_payload("hello") == ("", digest, "hello")
+
+def test_split_payload_no_newlines():
+    class Limited(object):
+        def __init__(self, data):
+            self.f = StringIO(data)
+            self.read = self.f.read
+        def readline(self, size=-1):
+            assert 0 < size <= 64 * 1024
+            return self.f.readline(size)
+
+    digest = lambda data: "sha1:" + hashlib.sha1(data).hexdigest()
+    for payload in ["x" * 200000, "HTTP/1.1 200 OK" + "x" * 200000]:
+        http_headers, digest1, rest = split_payload(Limited(payload))
+        # the headers don't end, the whole payload is the body
+        assert http_headers == ""
+        assert digest1 == digest(payload)
+        assert rest.read() == payload
+
+def test_memory_store_lru():
+    store = MemoryDigestStore(max_size=2)
+    store.put("a", ("1", "u", "d"))
+    store.put("b", ("2", "u", "d"))
+    assert store.get("a") == ("1", "u", "d")
+    store.put("c", ("3", "u", "d"))
+    # b was used least recently
+    assert store.get("b") is None
+    assert store.get("a") is not None
+    assert len(store) == 2
+
+@pytest.mark.parametrize("make_store", [
+    lambda path: DbmDigestStore(path),
+    lambda path: SqliteDigestStore(path, commit_every=2),
+])
+def test_file_stores(tmpdir, make_store):
+    path = str(tmpdir.join("digests"))
+    store = make_store(path)
+    assert store.get("sha1:x") is None
+    for i in range(5):
+        store.put("sha1:%d" % i, ("<urn:uuid:%d>" % i, "http://example.com/", "2012-02-10T16:15:52Z"))
+    store.close()
+
+    store = make_store(path)
+    assert len(store) == 5
+    assert store.get("sha1:3") == ("<urn:uuid:3>", "http://example.com/", "2012-02-10T16:15:52Z")
+    store.close()
+
+def read_records(f):
+    """Returns the records of a WARC file with the payloads read."""
+    records = []
+    for record in f:
+        record.payload = record.payload.read()
+        records.append(record)
+    return records
+
+class TestDedupWARCWriter:
+    def write(self, records, store):
+        buffer = StringIO()
+        writer = DedupWARCWriter(WARCFile(fileobj=buffer, mode="wb", compress=True), store)
+        for record in records:
+            writer.write_record(record)
+        buffer.seek(0)
+        return writer, read_records(WARCFile(fileobj=buffer, compress=True))
+
+    def test_revisit(self):
+        records = [response("hello"),
+                   response("hello", date="Sat, 11 Feb 2012 10:00:00 GMT", uri="http://example.com/copy"),
+                   WARCRecord(payload="hello", headers={"WARC-Type": "resource"}),
+                   response("world")]
+        original_id = records[0].header.record_id
+        writer, written = self.write(records, MemoryDigestStore())
+
+        assert [r.type for r in written] == ["response", "revisit", "resource", "response"]
+        assert (writer.records, writer.revisits, writer.saved_bytes) == (4, 1, 5)
+
+        revisit = written[1]
+        assert revisit['WARC-Refers-To'] == original_id
+        assert revisit['WARC-Refers-To-Target-URI'] == "http://example.com/"
+        assert revisit['WARC-Refers-To-Date'] == written[0].date
+        assert revisit['WARC-Profile'] == REVISIT_PROFILE
+        assert revisit['WARC-Target-URI'] == "http://example.com/copy"
+        assert revisit['WARC-IP-Address'] == "127.0.0.1"
+        assert revisit['WARC-Payload-Digest'] == "sha1:aaf4c61ddcc5e8a2dabede0f3b482cd9aea9434d"
+        # the HTTP headers of the response are kept
+        assert revisit.payload == "HTTP/1.1 200 OK\r\nDate: Sat, 11 Feb 2012 10:00:00 GMT\r\nContent-Type: text/plain\r\n\r\n"
+        assert written[3].payload.endswith("\r\n\r\nworld")
+
+    def test_shared_store(self):
+        store = MemoryDigestStore()
+        self.write([response("hello")], store)
+        writer, written = self.write([response("hello")], store)
+        assert written[0].type == "revisit"
+
+def test_dedup_file(tmpdir):
+    src = str(tmpdir.join("crawl.warc"))
+    f = WARCFile(src, "wb")
+    for i in range(6):
+        f.write_record(response("x" * 1000 + str(i % 2), uri="http://example.com/%d" % i))
+    f.close()
+
+    store = SqliteDigestStore(str(tmpdir.join("digests.db")))
+    dst = str(tmpdir.join("crawl-dedup.warc.gz"))
+    writer = dedup_file(src, dst, store)
+    store.close()
+    assert (writer.records, writer.revisits) == (6, 4)
+
+    records = read_records(WARCFile(dst))
+    assert [r.type for r in records] == ["response", "response"] + ["revisit"] * 4
+    assert [r.url for r in records] == ["http://example.com/%d" % i for i in range(6)]
+    assert records[5]['WARC-Refers-To'] == records[1].header.record_id
+    assert records[1].payload.endswith("x" * 1000 + "1")
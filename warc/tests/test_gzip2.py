@@ -0,0 +1,208 @@
+import itertools
+import random
+import zlib
+from cStringIO import StringIO
+
+from .. import gzip2
+
+import pytest
+
+_random = random.Random(1)
+TEXT = " ".join(_random.choice(["<div>", "</div>", "class", "href", "alpha"]) + str(_random.randint(0, 99))
+                for i in range(5000))
+
+def write_members(members, **kwargs):
+    buffer = StringIO()
+    f = gzip2.GzipFile(fileobj=buffer, mode="wb", **kwargs)
+    for data in members:
+        f.write_member(data)
+    f.close()
+    return buffer.getvalue()
+
+def read_members(data):
+    f = gzip2.GzipFile(fileobj=StringIO(data))
+    members = []
+    while f.read_member() is not None:
+        members.append(f.read())
+    return members
+
+def test_members():
+    data = write_members(["hello", "world"])
+    assert data.count(gzip2.GZIP_MAGIC) == 2
+    assert read_members(data) == ["hello", "world"]
+
+def test_compresslevel():
+    fast = write_members([TEXT] * 3, compresslevel=1)
+    best = write_members([TEXT] * 3, compresslevel=9)
+    assert len(fast) > len(best)
+    assert read_members(fast) == read_members(best) == [TEXT] * 3
+
+def test_strategy():
+    data = write_members([TEXT] * 2, strategy=zlib.Z_HUFFMAN_ONLY)
+    assert len(data) > len(write_members([TEXT] * 2))
+    assert read_members(data) == [TEXT] * 2
+
+def test_backend():
+    class Backend:
+        calls = []
+        def compressobj(self, *args):
+            self.calls.append(args)
+            return zlib.compressobj(*args)
+
+    backend = Backend()
+    data = write_members(["hello", "world"], compresslevel=3, backend=backend)
+    assert read_members(data) == ["hello", "world"]
+    # one compressor for each member plus one for the member never started
+    assert len(backend.calls) == 3
+    assert backend.calls[0][0] == 3
+
+def test_flush_between_members():
+    buffer = StringIO()
+    f = gzip2.GzipFile(fileobj=buffer, mode="wb")
+    f.write_member("hello")
+    f.flush()
+    f.write("wor")
+    f.flush()
+    f.write("ld")
+    f.close_member()
+    f.flush()
+    f.close()
+    # nothing is written between the members
+    data = buffer.getvalue()
+    assert data.count(gzip2.GZIP_MAGIC) == 2
+    assert data.startswith(write_members(["hello"]))
+    assert read_members(data) == ["hello", "world"]
+
+def test_read_until():
+    data = write_members(["a: 1\r\nb: 2\r\n\r\nbody" + "x" * 5000 + "\r\n\r\nend"])
+    f = gzip2.GzipFile(fileobj=StringIO(data))
+    f.read_member()
+    assert f.read_until("\r\n\r\n") == "a: 1\r\nb: 2\r\n\r\n"
+    assert f.read_until("\r\n\r\n") == "body" + "x" * 5000 + "\r\n\r\n"
+    assert f.read_until("\r\n\r\n") == "end"
+    assert f.read_until("\r\n\r\n") == ""
+
+def test_skip():
+    data = write_members([TEXT, "world"])
+    f = gzip2.GzipFile(fileobj=StringIO(data))
+    f.read_member()
+    assert f.read(5) == TEXT[:5]
+    assert f.skip(100) == 100
+    assert f.read(5) == TEXT[105:110]
+    # stops at the end of the member
+    assert f.skip(len(TEXT)) == len(TEXT) - 110
+    assert f.read_member() is not None
+    assert f.read() == "world"
+
+def test_seek_member():
+    data = write_members(["hello", "world"])
+    offset = data.index(gzip2.GZIP_MAGIC, 1)
+    f = gzip2.GzipFile(fileobj=StringIO(data))
+    f.read_member()
+    assert f.read(2) == "he"
+    f.seek_member(offset)
+    f.read_member()
+    assert f.read() == "world"
+
+def test_find_member():
+    data = write_members(["hello", "world", "again"])
+    second = data.index(gzip2.GZIP_MAGIC, 1)
+    fileobj = StringIO(data)
+    assert gzip2.find_member(fileobj, 0) == 0
+    assert gzip2.find_member(fileobj, 1) == second
+    assert gzip2.find_member(fileobj, 1, validate=lambda data: data == "again") > second
+    assert gzip2.find_member(fileobj, len(data) - 5) is None
+
+def test_compress_member():
+    data = gzip2.compress_member(["hello ", "world"], compresslevel=1)
+    assert data.startswith(gzip2.GZIP_MAGIC)
+    assert read_members(data * 2) == ["hello world", "hello world"]
+
+def test_parallel_writer():
+    members = [TEXT[i:i+3000] for i in range(0, len(TEXT), 3000)]
+    buffer = StringIO()
+    f = gzip2.ParallelGzipWriter(buffer, threads=3, max_pending=2, compresslevel=6)
+    for data in members:
+        f.write(data[:100])
+        f.write(data[100:])
+        f.close_member()
+        # members are written as they complete, never more than max_pending are held
+        assert len(f._pending) <= 2
+    f.close()
+    assert read_members(buffer.getvalue()) == members
+
+def test_parallel_writer_max_pending_bytes():
+    members = [TEXT[i:i+3000] for i in range(0, len(TEXT), 3000)]
+    buffer = StringIO()
+    f = gzip2.ParallelGzipWriter(buffer, threads=3, max_pending=100, max_pending_bytes=5000)
+    for data in members:
+        f.write_member(data)
+        # the members held are bounded by their size too
+        assert sum(job.size for job in f._pending) <= 5000
+    f.close()
+    assert read_members(buffer.getvalue()) == members
+
+def test_parallel_writer_error():
+    class Backend:
+        calls = itertools.count()
+        def compressobj(self, *args):
+            if next(self.calls) == 2:
+                raise ValueError("broken backend")
+            return zlib.compressobj(*args)
+
+    buffer = StringIO()
+    members = ["member %d" % i for i in range(6)]
+    f = gzip2.ParallelGzipWriter(buffer, threads=2, backend=Backend())
+    try:
+        # raised by whichever call writes the failed member
+        with pytest.raises(ValueError):
+            for data in members:
+                f.write_member(data)
+            f.flush(wait=True)
+        # and by every call after it
+        with pytest.raises(ValueError):
+            f.write_member("more")
+    finally:
+        with pytest.raises(ValueError):
+            f.close()
+    assert not any(t.isAlive() for t in f._threads)
+    # no member is written after the failed one
+    written = read_members(buffer.getvalue())
+    assert written == members[:len(written)]
+    assert len(written) < len(members)
+
+def test_member_index():
+    index = gzip2.MemberIndex()
+    f = gzip2.GzipFile(fileobj=StringIO(), mode="wb", member_index=index)
+    for data in ["hello", TEXT, "world"]:
+        f.write_member(data)
+    data = f.fileobj.getvalue()
+    f.close()
+
+    assert len(index) == 3
+    assert [size for offset, length, size in index] == [5, len(TEXT), 5]
+    offset, length, size = index[1]
+    assert offset == data.index(gzip2.GZIP_MAGIC, 1)
+    assert offset + length == data.index(gzip2.GZIP_MAGIC, offset + 1)
+    assert index.find(offset) == index.find(offset + length - 1) == offset
+    assert index.find(len(data)) is None
+
+    # the same index is built from the file
+    built = gzip2.MemberIndex.build(StringIO(data), blocksize=100)
+    assert list(built) == list(index)
+
+    buffer = StringIO()
+    index.write(buffer)
+    buffer.seek(0)
+    assert list(gzip2.MemberIndex.read(buffer)) == list(index)
+    with pytest.raises(IOError):
+        gzip2.MemberIndex.read(StringIO("not an index"))
+
+def test_parallel_writer_member_index():
+    index = gzip2.MemberIndex()
+    buffer = StringIO()
+    f = gzip2.ParallelGzipWriter(buffer, threads=2, member_index=index)
+    for i in range(10):
+        f.write_member("hello %d" % i)
+    f.close()
+    assert list(gzip2.MemberIndex.build(StringIO(buffer.getvalue()))) == list(index)
@@ -0,0 +1,192 @@
+import gzip
+import json
+from cStringIO import StringIO
+
+from .. import index
+import warc
+from ..arc import ARCFile
+from ..warc import WARCFile, WARCRecord
+
+HTTP_RESPONSE = (
+    "HTTP/1.1 301 Moved Permanently\r\n" +
+    "Content-Type: text/html; charset=utf-8\r\n" +
+    "Location: http://example.com/new\r\n" +
+    "\r\n" +
+    "<html>moved</html>"
+)
+
+def make_warc(compress=False):
+    buffer = StringIO()
+    f = WARCFile(fileobj=buffer, mode="w", compress=compress)
+    f.write_record(WARCRecord(payload="software: test\r\n", headers={
+        "WARC-Type": "warcinfo"
+    }))
+    f.write_record(WARCRecord(payload=HTTP_RESPONSE, headers={
+        "WARC-Type": "response",
+        "WARC-Target-URI": "http://www.Example.com/a?b=2&a=1",
+        "WARC-Date": "2012-02-10T16:15:52Z"
+    }))
+    f.write_record(WARCRecord(payload="hello", headers={
+        "WARC-Type": "resource",
+        "WARC-Target-URI": "http://example.com/hello.txt",
+        "WARC-Date": "2012-02-10T16:15:53Z",
+        "Content-Type": "text/plain"
+    }))
+    return buffer.getvalue()
+
+def test_surt():
+    assert index.surt("http://www.Example.com:80/a/b?y=2&x=1") == "com,example)/a/b?x=1&y=2"
+    assert index.surt("https://example.com:8443") == "com,example:8443)/"
+    assert index.surt("http://user@www2.example.com/#frag") == "com,example)/"
+    assert index.surt("dns:Example.com") == "dns:example.com"
+
+def test_read_http_headers():
+    payload = StringIO(HTTP_RESPONSE)
+    status, headers = index.read_http_headers(payload)
+    assert status == "301"
+    assert headers['location'] == "http://example.com/new"
+    # body must not be consumed
+    assert payload.read() == "<html>moved</html>"
+
+    status, headers = index.read_http_headers(StringIO("not http"))
+    assert status is None
+
+def test_iter_index():
+    for compress in [False, True]:
+        data = make_warc(compress)
+        entries = list(index.iter_index(WARCFile(fileobj=StringIO(data), compress=compress), "test.warc"))
+        assert len(entries) == 2
+
+        response, resource = entries
+        assert response['urlkey'] == "com,example)/a?a=1&b=2"
+        assert response['timestamp'] == "20120210161552"
+        assert response['status'] == "301"
+        assert response['mime'] == "text/html"
+        assert response['redirect'] == "http://example.com/new"
+        assert not response['digest'].startswith("sha1:")
+        assert response['filename'] == "test.warc"
+
+        assert resource['mime'] == "text/plain"
+        assert resource['status'] == "-"
+
+        # offsets and lengths must point at the records
+        assert response['offset'] + response['length'] == resource['offset']
+        assert resource['offset'] + resource['length'] == len(data)
+        for entry in entries:
+            f = WARCFile(fileobj=StringIO(data), compress=compress)
+            assert f.read_record_at(entry['offset']).url == entry['url']
+
+def test_write_index():
+    out = StringIO()
+    index.write_index(WARCFile(fileobj=StringIO(make_warc())), out, "test.warc", format="cdx")
+    lines = out.getvalue().splitlines()
+    assert lines[0] == index.CDX_HEADER
+    assert len(lines) == 3
+    assert len(lines[1].split(" ")) == 11
+
+    out = StringIO()
+    index.write_index(WARCFile(fileobj=StringIO(make_warc())), out, "test.warc", format="cdxj")
+    lines = out.getvalue().splitlines()
+    assert len(lines) == 2
+    urlkey, timestamp, data = lines[0].split(" ", 2)
+    assert urlkey == "com,example)/a?a=1&b=2"
+    assert json.loads(data)['status'] == "301"
+
+def test_split_ranges(tmpdir):
+    path = str(tmpdir.join("test.warc.gz"))
+    f = WARCFile(path, "wb")
+    for i in range(50):
+        f.write_record(WARCRecord(payload="hello %d" % i, headers={
+            "WARC-Type": "resource",
+            "WARC-Target-URI": "http://example.com/%d" % i
+        }))
+    f.close()
+
+    offsets = [offset for record, offset, size in WARCFile(path).browse()]
+    ranges = index.split_ranges(path, 4)
+    assert len(ranges) == 4
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == tmpdir.join("test.warc.gz").size()
+    for (start, end), (next_start, next_end) in zip(ranges, ranges[1:]):
+        assert end == next_start
+        assert next_start in offsets
+
+def test_split_ranges_member_index(tmpdir):
+    path = str(tmpdir.join("test.warc.gz"))
+    f = WARCFile(path, "wb", member_index=True)
+    for i in range(50):
+        f.write_record(WARCRecord(payload="hello %d" % i))
+    f.close()
+
+    offsets = [offset for record, offset, size in WARCFile(path).browse()]
+    ranges = index.split_ranges(path, 4)
+    assert len(ranges) == 4
+    assert ranges[-1][1] == tmpdir.join("test.warc.gz").size()
+    for start, end in ranges:
+        assert start in offsets
+
+    # the index file of the file before it was written again is not used
+    index_data = tmpdir.join("test.warc.gz.idx").read("rb")
+    f = WARCFile(path, "wb")
+    for i in range(50):
+        f.write_record(WARCRecord(payload="hello world %d" % i))
+    f.close()
+    tmpdir.join("test.warc.gz.idx").write(index_data, "wb")
+
+    offsets = [offset for record, offset, size in WARCFile(path).browse()]
+    for start, end in index.split_ranges(path, 4):
+        assert start in offsets
+
+def test_parallel_index(tmpdir):
+    path = str(tmpdir.join("test.warc.gz"))
+    f = WARCFile(path, "wb")
+    for i in range(100):
+        f.write_record(WARCRecord(payload=HTTP_RESPONSE, headers={
+            "WARC-Type": "response",
+            "WARC-Target-URI": "http://example.com/%d" % i
+        }))
+    f.close()
+
+    expected = list(index.iter_index(path))
+    assert len(expected) == 100
+    assert list(index.iter_index(path, jobs=3)) == expected
+
+def test_arc_index():
+    f = ARCFile(fileobj=gzip.GzipFile("test_data/alexa_short_header.arc.gz"))
+    entries = list(index.iter_index(f, "alexa.arc.gz"))
+    assert len(entries) == 1
+    assert entries[0]['urlkey'] == "net,killerjo)/robots.txt"
+    assert entries[0]['timestamp'] == "20110804181142"
+    assert entries[0]['status'] == "-"
+
+def test_arc_index_payload_not_copied(monkeypatch):
+    def browse(self):
+        raise AssertionError("browse() copies the payloads")
+    monkeypatch.setattr(ARCFile, "browse", browse)
+    f = ARCFile(fileobj=gzip.GzipFile("test_data/alexa_short_header.arc.gz"))
+    assert len(list(index.iter_index(f, "alexa.arc.gz"))) == 1
+
+def test_iter_index_closes_file(tmpdir, monkeypatch):
+    path = str(tmpdir.join("test.warc"))
+    f = WARCFile(path, "wb")
+    for i in range(2):
+        f.write_record(WARCRecord(payload=HTTP_RESPONSE, headers={
+            "WARC-Type": "response",
+            "WARC-Target-URI": "http://example.com/%d" % i
+        }))
+    f.close()
+
+    opened = []
+    open_file = warc.open
+    def open_and_remember(*args, **kwargs):
+        opened.append(open_file(*args, **kwargs))
+        return opened[-1]
+    monkeypatch.setattr(warc, "open", open_and_remember)
+
+    assert len(list(index.iter_index(path))) == 2
+    assert opened[0].fileobj.closed
+    # also when the iteration is stopped early
+    entries = index.iter_index(path)
+    next(entries)
+    entries.close()
+    assert opened[1].fileobj.closed
@@ -1,5 +1,9 @@
-from ..utils import FilePart, CaseInsensitiveDict
+from ..utils import FilePart, CaseInsensitiveDict, MappedPart, PeekableFile, map_file
 from cStringIO import StringIO
+import hashlib
+import pickle
+
+import pytest
 
 class TestCaseInsensitiveDict:
     def test_all(self):
@@ -17,6 +21,54 @@ class TestCaseInsensitiveDict:
         assert sorted(d.keys()) == ["bar", "foo"]
         assert sorted(d.items()) == [("bar", 2), ("foo", 1)]
         
+    def test_dict_methods(self):
+        d = CaseInsensitiveDict([("Foo", 1)], Bar=2)
+        assert len(d) == 2
+        assert sorted(d) == ["bar", "foo"]
+        assert d.get("FOO") == 1
+        assert d.get("baz", 3) == 3
+        assert d.setdefault("Baz", 3) == 3
+        assert d.pop("BAZ") == 3
+        assert d.pop("baz", None) is None
+        assert d == CaseInsensitiveDict(foo=1, bar=2)
+        assert d != CaseInsensitiveDict(foo=1)
+        # no per instance __dict__, the keys are shared
+        assert not hasattr(d, "__dict__")
+        assert [k for k in d if k == "foo"][0] is [k for k in CaseInsensitiveDict(FOO=1)][0]
+
+    def test_order_and_case(self):
+        d = CaseInsensitiveDict([("WARC-Type", 1), ("Content-Length", 2), ("x-b", 3), ("X-B", 4)])
+        assert d.keys() == ["warc-type", "content-length", "x-b"]
+        assert d.values() == [1, 2, 4]
+        assert d.original_items() == [("WARC-Type", 1), ("Content-Length", 2), ("x-b", 4)]
+
+        d['warc-type'] = 5
+        d['X-New'] = 6
+        del d['Content-Length']
+        assert d.original_items() == [("WARC-Type", 5), ("x-b", 4), ("X-New", 6)]
+        assert CaseInsensitiveDict(d).original_items() == d.original_items()
+        assert d.popitem() == ("x-new", 6)
+        d.clear()
+        assert d.items() == []
+
+        # unicode keys are not interned
+        assert CaseInsensitiveDict({u"Foo": 1})[u"FOO"] == 1
+
+    def test_unicode_keys(self):
+        d = CaseInsensitiveDict({u"Foo": 1})
+        d[u"Bar"] = 2
+        assert d.setdefault(u"BAZ", 3) == 3
+        d.update([(u"Qux", 4)])
+        assert (d["foo"], d[u"BAR"], d["baz"], d[u"qux"]) == (1, 2, 3, 4)
+
+    def test_pickle(self):
+        d = CaseInsensitiveDict([("Foo", 1), ("bar", 2)])
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(d, protocol))
+            assert copy == d
+            assert copy.original_items() == [("Foo", 1), ("bar", 2)]
+            assert [k for k in copy][0] is [k for k in d][0]
+
 class TestFilePart:
     def setup_method(self, m):
         # 5 chars in each line
@@ -53,4 +105,133 @@ class TestFilePart:
         
     def test_iter(self):
         part = FilePart(StringIO(self.text), 11)
-        assert list(part) == ["aaaa\n", "bbbb\n", "c"]
\ No newline at end of file
+        assert list(part) == ["aaaa\n", "bbbb\n", "c"]
+
+    def test_readline_small_blocks(self):
+        part = FilePart(StringIO(self.text), 22, blocksize=3)
+        assert list(part) == ["aaaa\n", "bbbb\n", "cccc\n", "dddd\n", "ee"]
+
+    def test_readline_with_size(self):
+        part = FilePart(StringIO(self.text), 11)
+        assert part.readline(3) == "aaa"
+        assert part.readline(3) == "a\n"
+        assert part.readline() == "bbbb\n"
+
+    def test_mixed_read_readline(self):
+        part = FilePart(StringIO(self.text), 17, blocksize=4)
+        assert part.readline() == "aaaa\n"
+        assert part.read(7) == "bbbb\ncc"
+        assert part.readline() == "cc\n"
+        assert part.read() == "dd"
+        assert part.read() == ""
+        # nothing past the end of the part is consumed
+        assert part.fileobj.read(3) == "dd\n"
+
+    def test_readinto(self):
+        part = FilePart(StringIO(self.text), 12)
+        assert part.readline() == "aaaa\n"
+        buf = bytearray(5)
+        assert part.readinto(buf) == 5
+        assert str(buf) == "bbbb\n"
+        assert part.readinto(buf) == 2
+        assert str(buf[:2]) == "cc"
+        assert part.readinto(buf) == 0
+
+    def test_skip(self):
+        for fileobj in [StringIO(self.text), Unseekable(self.text)]:
+            part = FilePart(fileobj, 12, blocksize=4)
+            assert part.readline() == "aaaa\n"
+            part.skip()
+            assert part.read() == ""
+            assert part.fileobj.read(3) == "cc\n"
+
+class TestMappedPart:
+    def setup_method(self, m):
+        self.text = "\n".join(["aaaa", "bbbb", "cccc", "dddd", "eeee", "ffff"])
+
+    def map(self, tmpdir):
+        path = tmpdir.join("text")
+        path.write(self.text)
+        return map_file(path.open("rb"))
+
+    def test_read(self, tmpdir):
+        m = self.map(tmpdir)
+        m.seek(5)
+        part = MappedPart(m, 12)
+        assert part.readline() == "bbbb\n"
+        assert part.read(3) == "ccc"
+        assert list(part) == ["c\n", "dd"]
+        assert part.read() == ""
+        assert m.read(3) == "dd\n"
+
+    def test_readinto(self, tmpdir):
+        part = MappedPart(self.map(tmpdir), 7)
+        buf = bytearray(5)
+        assert part.readinto(buf) == 5
+        assert str(buf) == "aaaa\n"
+        assert part.readinto(buf) == 2
+        assert str(buf[:2]) == "bb"
+
+    def test_view_and_skip(self, tmpdir):
+        m = self.map(tmpdir)
+        part = MappedPart(m, 10)
+        assert part.read(5) == "aaaa\n"
+        assert hashlib.sha1(part.view()).digest() == hashlib.sha1("bbbb\n").digest()
+        part.skip()
+        assert part.read() == ""
+        assert m.read(4) == "cccc"
+
+class TestPeekableFile:
+    def setup_method(self, m):
+        self.text = "\n".join(["aaaa", "bbbb", "cccc", "dddd", "eeee", "ffff"])
+
+    def test_peek(self):
+        f = PeekableFile(Unseekable(self.text))
+        assert f.peek(7) == "aaaa\nbb"
+        assert f.read(2) == "aa"
+        assert f.peek(4) == "aa\nb"
+        assert f.readline() == "aa\n"
+        assert f.tell() == 5
+        assert list(f) == ["bbbb\n", "cccc\n", "dddd\n", "eeee\n", "ffff"]
+        assert f.peek(1) == ""
+        assert f.tell() == len(self.text)
+
+    def test_readline_size(self):
+        f = PeekableFile(Unseekable(self.text))
+        assert f.readline(2) == "aa"
+        assert f.readline(10) == "aa\n"
+        assert f.read() == self.text[5:]
+
+    def test_read_all(self):
+        f = PeekableFile(Unseekable(self.text))
+        assert f.read(7) == "aaaa\nbb"
+        assert f.read() == self.text[7:]
+        assert f.tell() == len(self.text)
+        # the data read last can still be read again
+        f.seek(-4, 1)
+        assert f.read() == "ffff"
+
+    def test_seek(self):
+        f = PeekableFile(Unseekable(self.text))
+        assert f.read(12) == "aaaa\nbbbb\ncc"
+        # back into the data read last
+        f.seek(-7, 1)
+        assert f.read(4) == "bbbb"
+        assert f.read(8) == "\ncccc\ndd"
+        # the data before the last read is dropped
+        with pytest.raises(IOError):
+            f.seek(0)
+        with pytest.raises(IOError):
+            f.seek(0, 2)
+        f.seek(20)
+        assert f.read(4) == "eeee"
+        f.seek(100)
+        assert f.read() == ""
+
+class Unseekable:
+    """File that can't seek, like a pipe."""
+    def __init__(self, text):
+        self._f = StringIO(text)
+
+    def read(self, size=-1):
+        return self._f.read(size)
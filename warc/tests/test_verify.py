@@ -0,0 +1,102 @@
+import base64
+import hashlib
+from cStringIO import StringIO
+
+from ..warc import WARCFile, WARCRecord
+from .. import verify
+
+HTTP_HEADERS = "HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\n"
+
+def digest(algorithm, data, encoding="base32"):
+    value = hashlib.new(algorithm, data)
+    if encoding == "hex":
+        return algorithm + ":" + value.hexdigest()
+    return algorithm + ":" + base64.b32encode(value.digest()).rstrip("=")
+
+def make_records():
+    body = "hello world"
+    block = HTTP_HEADERS + body
+    return [
+        # WARC-Payload-Digest of the whole block, as written by WARCRecord
+        WARCRecord(payload="hello", headers={"WARC-Type": "resource"}),
+        WARCRecord(payload=block, headers={
+            "WARC-Type": "response",
+            "WARC-Block-Digest": digest("sha1", block),
+            "WARC-Payload-Digest": digest("sha1", body),
+        }),
+        WARCRecord(payload=block, headers={
+            "WARC-Type": "response",
+            "WARC-Block-Digest": digest("sha256", block, "hex"),
+            "WARC-Payload-Digest": digest("sha256", body),
+        }),
+        WARCRecord(payload=HTTP_HEADERS, headers={
+            "WARC-Type": "revisit",
+            "WARC-Payload-Digest": digest("sha1", body),
+        }),
+    ]
+
+def write_warc(path, records, compress=False):
+    f = WARCFile(path, "wb", compress=compress)
+    offsets = []
+    for record in records:
+        offsets.append(f.tell())
+        f.write_record(record)
+    f.close()
+    return offsets
+
+def test_parse_digest():
+    assert verify.parse_digest(digest("sha1", "hello")) == ("sha1", hashlib.sha1("hello").digest())
+    assert verify.parse_digest(digest("sha1", "hello", "hex")) == ("sha1", hashlib.sha1("hello").digest())
+    assert verify.parse_digest("SHA-256:" + hashlib.sha256("x").hexdigest()) == ("sha256", hashlib.sha256("x").digest())
+    assert verify.parse_digest("sha1:not a digest") is None
+    assert verify.parse_digest("crc42:1234") is None
+
+def test_verify_record():
+    for record in make_records():
+        record.payload = StringIO(record.payload)
+        assert verify.verify_record(record) == []
+
+    record = WARCRecord(payload="hello", headers={"WARC-Type": "resource", "WARC-Block-Digest": digest("md5", "hellO")})
+    record.payload = StringIO("hello")
+    assert verify.verify_record(record) == ["WARC-Block-Digest %s doesn't match the block" % digest("md5", "hellO")]
+
+    record = WARCRecord(payload="hello", headers={"WARC-Type": "resource", "WARC-Payload-Digest": "sha1:bad"})
+    record.payload = StringIO("hello")
+    assert verify.verify_record(record) == ["WARC-Payload-Digest sha1:bad can't be checked"]
+
+def test_verify_files(tmpdir):
+    good = str(tmpdir.join("good.warc"))
+    write_warc(good, make_records())
+
+    bad = str(tmpdir.join("bad.warc.gz"))
+    records = make_records() * 20
+    offsets = write_warc(bad, records, compress=True)
+    # Change the payload of a record after computing its digests
+    records[5] = make_records()[1]
+    records[5].payload = records[5].payload.replace("world", "w0rld")
+    write_warc(bad, records, compress=True)
+
+    for jobs in [1, 2]:
+        problems = list(verify.verify_files([good, bad], jobs=jobs))
+        assert [(p["filename"], p["offset"], p["record_id"]) for p in problems] == [
+            (bad, offsets[5], records[5].header.record_id)] * 2
+        assert "WARC-Block-Digest" in problems[0]["message"]
+        assert "WARC-Payload-Digest" in problems[1]["message"]
+
+    out = StringIO()
+    assert verify.write_report([good, bad], out, jobs=2) == 2
+    assert out.getvalue().splitlines()[-1] == "84 records verified, 2 problems found"
+
+def test_verify_damaged(tmpdir):
+    path = str(tmpdir.join("damaged.warc"))
+    offsets = write_warc(path, make_records())
+    data = open(path, "rb").read()
+    # Cut the file in the payload of the third record
+    open(path, "wb").write(data[:offsets[2] + 400])
+
+    problems = list(verify.verify_files([path]))
+    assert [p["offset"] for p in problems] == [offsets[2]]
+    assert problems[0]["message"].startswith("IOError: Record is truncated")
+
+    problems = list(verify.verify_files([str(tmpdir.join("missing.warc"))]))
+    assert len(problems) == 1
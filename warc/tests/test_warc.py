@@ -1,7 +1,12 @@
-from ..warc import WARCReader, WARCHeader, WARCRecord, WARCFile
+from ..warc import WARCReader, WARCHeader, LazyWARCHeader, WARCRecord, WARCFile
+from .. import gzip2
 
+import os
+import pickle
 from StringIO import StringIO
 
+import pytest
+
 class TestWARCHeader:
     def test_attrs(self):
         h = WARCHeader({
@@ -36,6 +41,28 @@ class TestWARCHeader:
         })
         assert str(h) == "WARC/1.0\r\n" + "WARC-Type: response\r\n\r\n"
 
+    def test_write_names(self):
+        h = WARCHeader([("warc-ip-address", "127.0.0.1"), ("X-Foo-Id", "1")])
+        assert str(h) == "WARC/1.0\r\nWARC-IP-Address: 127.0.0.1\r\nX-Foo-Id: 1\r\n\r\n"
+
+        class Writes:
+            count = 0
+            def write(self, data):
+                self.count += 1
+        f = Writes()
+        h.write_to(f)
+        assert f.count == 1
+
+    def test_write_read_header(self):
+        text = "WARC/1.0\r\nwarc-type:  response\r\nX-Custom-ID: 1\r\nContent-Length: 0\r\n\r\n"
+        h = WARCReader(StringIO(text + "\r\n\r\n")).read_header(StringIO(text))
+        # written back as it was read until it is parsed
+        assert str(h) == text
+        h['X-New'] = "2"
+        # once parsed, lower case names get the standard form and the others
+        # keep their case
+        assert str(h) == "WARC/1.0\r\nWARC-Type: response\r\nX-Custom-ID: 1\r\nContent-Length: 0\r\nX-New: 2\r\n\r\n"
+
     def test_init_defaults(self):
         # It should initialize all the mandatory headers
         h = WARCHeader({"WARC-Type": "resource"}, defaults=True)
@@ -52,6 +79,62 @@ class TestWARCHeader:
         assert f("warcinfo")["Content-Type"] == "application/warc-fields"
         assert f("newtype")["Content-Type"] == "application/octet-stream"
 
+class TestWARCRecord:
+    HEADERS = {
+        "WARC-Type": "resource",
+        "WARC-Record-ID": "<record-1>",
+        "WARC-Date": "2000-01-02T03:04:05Z"
+    }
+    PAYLOAD = "".join("line %d\n" % i for i in range(20000))
+
+    def make_record(self, payload):
+        return WARCRecord(payload=payload, headers=dict(self.HEADERS))
+
+    def test_file_payload(self):
+        expected = str(self.make_record(self.PAYLOAD))
+
+        f = StringIO("junk" + self.PAYLOAD)
+        f.seek(4)
+        record = self.make_record(f)
+        assert record['Content-Length'] == str(len(self.PAYLOAD))
+        # seekable files are rewound, not copied
+        assert record.payload is f
+        assert str(record) == expected
+
+    def test_iterator_payload(self):
+        expected = str(self.make_record(self.PAYLOAD))
+
+        lines = iter(StringIO(self.PAYLOAD))
+        record = self.make_record(lines)
+        assert record['Content-Length'] == str(len(self.PAYLOAD))
+        assert str(record) == expected
+
+    def test_unseekable_payload(self):
+        class Stream:
+            def __init__(self, data):
+                self.read = StringIO(data).read
+
+        expected = str(self.make_record(self.PAYLOAD))
+        assert str(self.make_record(Stream(self.PAYLOAD))) == expected
+
+    def test_stream_with_known_headers(self):
+        record = WARCRecord(payload=iter(["hello", "world"]), headers={
+            "WARC-Type": "resource",
+            "Content-Length": "10",
+            "WARC-Payload-Digest": "sha1:digest"
+        })
+        assert record['WARC-Payload-Digest'] == "sha1:digest"
+        assert str(record).endswith("\r\n\r\nhelloworld\r\n\r\n")
+
+    def test_pickle(self):
+        record = WARCRecord(payload="hello", headers={"WARC-Type": "resource", "X-Custom": "1"})
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copy = pickle.loads(pickle.dumps(record, protocol))
+            assert copy.payload == "hello"
+            assert copy.header.__class__ is WARCHeader
+            assert copy.header == record.header
+            assert str(copy.header) == str(record.header)
+
 SAMPLE_WARC_RECORD_TEXT = (
     "WARC/1.0\r\n" +
     "Content-Length: 10\r\n" +
@@ -84,6 +167,62 @@ class TestWARCReader:
         record = reader.read_record()
         assert "".join(record.payload) == "Helloworld"
 
+    def test_read_header_gz(self):
+        buffer = StringIO()
+        f = WARCFile(fileobj=buffer, mode="w", compress=True)
+        for i in range(3):
+            f.write_record(WARCRecord(payload="hello %d" % i, headers={"X-Long": "x" * (500 * i)}))
+        buffer.seek(0)
+
+        records = list(WARCFile(fileobj=buffer, compress=True))
+        assert [r.header['X-Long'] for r in records] == ["", "x" * 500, "x" * 1000]
+
+    def test_bad_header(self):
+        import pytest
+        text = SAMPLE_WARC_RECORD_TEXT.replace("WARC-Type: response", "WARC-Type response")
+        with pytest.raises(IOError) as excinfo:
+            WARCReader(StringIO(text)).read_record()
+        assert "WARC-Type response" in str(excinfo.value)
+
+        with pytest.raises(IOError):
+            WARCReader(StringIO("WARC/1.0\r\nWARC-Type: response\r\n")).read_record()
+
+        with pytest.raises(IOError):
+            WARCReader(StringIO("WARC/0.9\r\n\r\n")).read_record()
+
+    def test_lazy_header(self):
+        h = WARCReader(StringIO(SAMPLE_WARC_RECORD_TEXT)).read_record().header
+        assert isinstance(h, LazyWARCHeader)
+        # found in the block without parsing it
+        assert h.type == "response"
+        assert h.content_length == 10
+        assert h.__class__ is LazyWARCHeader
+
+        # other lookups parse the block
+        assert h['warc-date'] == "2012-02-10T16:15:52Z"
+        assert h.__class__ is WARCHeader
+        assert h.version == "WARC/1.0"
+        assert h.get("X-Missing") is None
+        h['X-New'] = "1"
+        assert str(h).startswith("WARC/1.0\r\n")
+
+    def test_lazy_header_pickle(self):
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            h = WARCReader(StringIO(SAMPLE_WARC_RECORD_TEXT)).read_record().header
+            copy = pickle.loads(pickle.dumps(h, protocol))
+            assert copy.__class__ is WARCHeader
+            assert copy == h
+            assert copy.version == "WARC/1.0"
+            assert copy['WARC-Target-URI'] == "http://example.com/"
+
+    def test_lazy_header_block(self):
+        h = LazyWARCHeader("WARC/1.0\r\nWARC-Type:response\r\nX-A:  1\r\nX-A: 2\r\n\r\n", 10)
+        assert h['WARC-Type'] == "response"
+        assert h['X-A'] == "2"
+        assert "X-B" not in h
+        assert sorted(h.keys()) == ["warc-type", "x-a"]
+        assert h['X-A'] == "2"
+
     def read_multiple_records(self):
         f = StringIO(SAMPLE_WARC_RECORD_TEXT * 5)
         reader = WARCReader(f)
@@ -108,6 +247,212 @@ class TestWarcFile:
         GZIP_MAGIC_NUMBER = '\037\213'
         assert buffer.getvalue().count(GZIP_MAGIC_NUMBER) == 10
 
+    def test_write_compresslevel(self):
+        import zlib
+        for compress in [0, 1, {"compresslevel": 6, "strategy": zlib.Z_FILTERED}]:
+            buffer = StringIO()
+            self._write_records(buffer, compress)
+            f = WARCFile(fileobj=buffer, compress=True)
+            assert [r.payload.read() for r in f] == ["hello %d" % i for i in range(10)]
+
+    def test_write_threads(self):
+        buffer = StringIO()
+        f = WARCFile(fileobj=buffer, mode="w", compress={"compresslevel": 6, "threads": 4})
+        for i in range(10):
+            f.write_record(WARCRecord(payload="hello %d" % i))
+        f.close()
+
+        buffer.seek(0)
+        f = WARCFile(fileobj=buffer, compress=True)
+        assert [r.payload.read() for r in f] == ["hello %d" % i for i in range(10)]
+
+    def _write_records(self, buffer, compress):
+        f = WARCFile(fileobj=buffer, mode="w", compress=compress)
+        for i in range(10):
+            record = WARCRecord(payload="hello %d" % i)
+            f.write_record(record)
+        buffer.seek(0)
+
+    def test_read_record_at(self):
+        for compress in [False, True]:
+            buffer = StringIO()
+            self._write_records(buffer, compress)
+            offsets = [offset for record, offset, size in WARCFile(fileobj=buffer, compress=compress).browse()]
+            assert len(offsets) == 10
+
+            buffer.seek(0)
+            f = WARCFile(fileobj=buffer, compress=compress)
+            for i in reversed(range(10)):
+                record = f.read_record_at(offsets[i])
+                assert record.payload.read() == "hello %d" % i
+
+    def test_read_record_at_tell(self, tmpdir):
+        """The offsets returned by tell() before writing each record, also 
+        the first one, are where the records start."""
+        for compress in [False, True]:
+            path = str(tmpdir.join("test.warc" + (".gz" if compress else "")))
+            f = WARCFile(path, "wb", member_index=compress or None)
+            offsets = []
+            for i in range(3):
+                offsets.append(f.tell())
+                f.write_record(WARCRecord(payload="hello %d" % i))
+            f.close()
+            assert offsets[0] == 0
+
+            f = WARCFile(path, member_index=compress or None)
+            for i in reversed(range(3)):
+                assert f.read_record_at(offsets[i]).payload.read() == "hello %d" % i
+
+    def test_read_record_at_after_partial_read(self):
+        """Seeking must discard the unread payload of the current record."""
+        buffer = StringIO()
+        self._write_records(buffer, True)
+        offsets = [offset for record, offset, size in WARCFile(fileobj=buffer, compress=True).browse()]
+
+        buffer.seek(0)
+        f = WARCFile(fileobj=buffer, compress=True)
+        record = f.read_record()
+        assert record.payload.read(3) == "hel"
+        assert f.read_record_at(offsets[5]).payload.read() == "hello 5"
+        assert f.read_record().payload.read() == "hello 6"
+
+    def test_iter_headers(self):
+        for compress in [False, True]:
+            buffer = StringIO()
+            self._write_records(buffer, compress)
+            f = WARCFile(fileobj=buffer, compress=compress)
+            headers = list(f.iter_headers())
+            assert len(headers) == 10
+            assert [h.content_length for h in headers] == [7] * 10
+
+    def test_mmap(self, tmpdir):
+        path = str(tmpdir.join("test.warc"))
+        f = WARCFile(path, "wb")
+        for i in range(10):
+            f.write_record(WARCRecord(payload="hello %d" % i))
+        f.close()
+
+        f = WARCFile(path, mmap=True)
+        records = list(f.browse())
+        assert [r.payload.read() for r, offset, size in records] == ["hello %d" % i for i in range(10)]
+        record = f.read_record_at(records[3][1])
+        assert str(record.payload.view()) == "hello 3"
+        assert f.read_record().payload.read() == "hello 4"
+        f.close()
+
+        with pytest.raises(ValueError):
+            WARCFile(path + ".gz", "wb", mmap=True)
+
+    def test_member_index(self, tmpdir):
+        path = str(tmpdir.join("test.warc.gz"))
+        f = WARCFile(path, "wb", member_index=True)
+        for i in range(10):
+            f.write_record(WARCRecord(payload="hello %d" % i))
+        f.close()
+        assert tmpdir.join("test.warc.gz.idx").check()
+
+        offsets = [offset for record, offset, size in WARCFile(path).browse()]
+        f = WARCFile(path, member_index=True)
+        assert [offset for offset, length, size in f.member_index] == offsets
+        assert f.read_record_at(offsets[5]).payload.read() == "hello 5"
+        with pytest.raises(IOError):
+            f.seek(offsets[5] + 1)
+
+        # built from the file when there is no index file
+        tmpdir.join("test.warc.gz.idx").remove()
+        f = WARCFile(path, member_index=True)
+        assert [offset for offset, length, size in f.member_index] == offsets
+
+    def test_member_index_append(self, tmpdir):
+        path = str(tmpdir.join("test.warc.gz"))
+        for mode, payloads in [("wb", ["hello 0", "hello 1", "hello 2"]), ("ab", ["hello 3"])]:
+            f = WARCFile(path, mode, member_index=True)
+            f.write_records(WARCRecord(payload=payload) for payload in payloads)
+            f.close()
+
+        f = WARCFile(path, member_index=True)
+        assert list(f.member_index) == list(gzip2.MemberIndex.build(open(path, "rb")))
+        for i, (offset, length, size) in enumerate(f.member_index):
+            assert f.read_record_at(offset).payload.read() == "hello %d" % i
+
+        # there is no index to extend
+        tmpdir.join("test.warc.gz.idx").remove()
+        with pytest.raises(ValueError):
+            WARCFile(path, "ab", member_index=True)
+
+    def test_member_index_out_of_date(self, tmpdir):
+        path = str(tmpdir.join("test.warc.gz"))
+        f = WARCFile(path, "wb", member_index=True)
+        f.write_records(WARCRecord(payload="hello %d" % i) for i in range(3))
+        f.close()
+        old_index = tmpdir.join("test.warc.gz.idx").read("rb")
+
+        # writing the file again without the index deletes it
+        f = WARCFile(path, "wb")
+        f.write_records(WARCRecord(payload="hello world %d" % i) for i in range(3))
+        f.close()
+        assert not tmpdir.join("test.warc.gz.idx").check()
+        offsets = [offset for offset, length, size in gzip2.MemberIndex.build(open(path, "rb"))]
+
+        # an index file of the old file is not used
+        tmpdir.join("test.warc.gz.idx").write(old_index, "wb")
+        assert gzip2.load_index(path) is None
+        assert [offset for offset, length, size in WARCFile(path, member_index=True).member_index] == offsets
+        # nor an index file older than the file
+        gzip2.MemberIndex.build(open(path, "rb")).save(path + ".idx")
+        assert gzip2.load_index(path) is not None
+        mtime = os.path.getmtime(path)
+        os.utime(path + ".idx", (mtime - 10, mtime - 10))
+        assert gzip2.load_index(path) is None
+
+    def _count_flushes(self, flush, compress=None, records=10):
+        class Output(object):
+            flushes = 0
+            def __init__(self):
+                self.buffer = StringIO()
+                self.write = self.buffer.write
+                self.tell = self.buffer.tell
+            def flush(self):
+                self.flushes += 1
+            def close(self):
+                pass
+
+        out = Output()
+        f = WARCFile(fileobj=out, mode="wb", compress=compress, flush=flush)
+        assert f.write_records(WARCRecord(payload="hello %d" % i) for i in range(records)) == records
+        flushes = out.flushes
+        f.close()
+        out.buffer.seek(0)
+        f = WARCFile(fileobj=out.buffer, compress=compress)
+        assert [r.payload.read() for r in f] == ["hello %d" % i for i in range(records)]
+        return flushes
+
+    def test_write_records_flush(self):
+        for compress in [None, True, {"threads": 2}]:
+            assert self._count_flushes(True, compress) == 10
+            assert self._count_flushes(False, compress) == 0
+            assert self._count_flushes({"records": 3}, compress) == 3
+            assert self._count_flushes({"seconds": 3600}, compress) == 0
+            assert self._count_flushes({"seconds": 0}, compress) == 10
+
+        size = len(str(WARCRecord(payload="hello 0")))
+        assert self._count_flushes({"bytes": size * 2}) == 5
+        with pytest.raises(TypeError):
+            WARCFile(fileobj=StringIO(), mode="wb", flush={"record": 1})
+
+    def test_write_records_fsync(self, tmpdir, monkeypatch):
+        synced = []
+        monkeypatch.setattr(os, "fsync", synced.append)
+        for compress in [False, True, {"threads": 2}]:
+            del synced[:]
+            path = str(tmpdir.join("test.warc"))
+            f = WARCFile(path, "wb", compress=compress, flush={"records": 4, "fsync": True})
+            f.write_records(WARCRecord(payload="hello %d" % i) for i in range(10))
+            assert len(synced) == 2
+            f.close()
+            assert len(synced) == 3
+            assert [r.payload.read() for r in WARCFile(path, compress=compress)] == ["hello %d" % i for i in range(10)]
+
     def test_long_header(self):
         """Test large WARC header with a CRLF across a 1024 byte boundrary"""
         from .. import warc
@@ -0,0 +1,225 @@
+import Queue
+import threading
+import time
+from cStringIO import StringIO
+
+from ..warc import WARCFile, WARCRecord
+from ..writer import AsyncWARCWriter, RotatingWARCWriter
+
+import pytest
+
+class Buffer(object):
+    """StringIO that keeps its value after close."""
+    def __init__(self):
+        self.buffer = StringIO()
+        self.write = self.buffer.write
+        self.flush = self.buffer.flush
+        self.tell = self.buffer.tell
+
+    def close(self):
+        self.value = self.buffer.getvalue()
+
+def read_payloads(data, compress=False):
+    f = WARCFile(fileobj=StringIO(data), compress=compress)
+    return [record.payload.read() for record in f]
+
+class TestAsyncWARCWriter:
+    def test_write(self):
+        out = Buffer()
+        writer = AsyncWARCWriter(WARCFile(fileobj=out, mode="wb"), batch_size=7)
+        for i in range(50):
+            writer.write_record(WARCRecord(payload="hello %d" % i))
+        writer.close()
+        assert read_payloads(out.value) == ["hello %d" % i for i in range(50)]
+
+    def test_flush_per_batch(self):
+        unblock = threading.Event()
+        out = Buffer()
+        out.flushes = 0
+        def write(data):
+            unblock.wait()
+            out.buffer.write(data)
+        def flush():
+            out.flushes += 1
+        out.write = write
+        out.flush = flush
+
+        writer = AsyncWARCWriter(WARCFile(fileobj=out, mode="wb"), batch_size=7)
+        for i in range(21):
+            writer.write_record(WARCRecord(payload="hello %d" % i))
+        # the records being written are pending too
+        assert writer.pending == 21
+        unblock.set()
+        writer.flush()
+        assert writer.pending == 0
+        # the first batch is taken before the others are queued
+        assert out.flushes <= 4
+        writer.close()
+        assert read_payloads(out.value) == ["hello %d" % i for i in range(21)]
+
+    def test_many_producers(self):
+        out = Buffer()
+        writer = AsyncWARCWriter(WARCFile(fileobj=out, mode="wb", compress=True), max_pending=5)
+
+        def produce(n):
+            for i in range(20):
+                writer.write_record(WARCRecord(payload="%d-%d" % (n, i)))
+
+        threads = [threading.Thread(target=produce, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        writer.flush()
+        assert writer.pending == 0
+        writer.close()
+
+        payloads = read_payloads(out.buffer.getvalue(), compress=True)
+        assert sorted(payloads) == sorted("%d-%d" % (n, i) for n in range(4) for i in range(20))
+        # records of each producer stay in order
+        assert [p for p in payloads if p.startswith("0-")] == ["0-%d" % i for i in range(20)]
+
+    def test_backpressure(self):
+        writing = threading.Event()
+        unblock = threading.Event()
+        out = Buffer()
+        def write(data):
+            writing.set()
+            unblock.wait()
+            out.buffer.write(data)
+        out.write = write
+
+        writer = AsyncWARCWriter(WARCFile(fileobj=out, mode="wb"), max_pending=2)
+        writer.write_record(WARCRecord(payload="hello"))
+        # the writer thread doesn't take any more records while it writes
+        writing.wait()
+        with pytest.raises(Queue.Full):
+            for i in range(10):
+                writer.write_record(WARCRecord(payload="hello"), block=False)
+        assert writer.full()
+        unblock.set()
+        writer.close()
+
+    def test_error(self):
+        out = Buffer()
+        def write(data):
+            raise IOError("disk full")
+        out.write = write
+
+        writer = AsyncWARCWriter(WARCFile(fileobj=out, mode="wb"))
+        writer.write_record(WARCRecord(payload="hello"))
+        with pytest.raises(IOError):
+            writer.flush()
+        with pytest.raises(IOError):
+            writer.write_record(WARCRecord(payload="hello"))
+        with pytest.raises(IOError):
+            writer.close()
+
+class TestRotatingWARCWriter:
+    def read_files(self, directory, writer):
+        files = []
+        for filename in writer.filenames:
+            f = WARCFile(str(directory.join(filename)))
+            files.append([(r.header, r.payload.read()) for r in f])
+            f.close()
+        return files
+
+    def test_max_records(self, tmpdir):
+        writer = RotatingWARCWriter(str(tmpdir), prefix="TEST", max_records=3, warcinfo={"operator": "test"})
+        for i in range(10):
+            writer.write_record(WARCRecord(payload="hello %d" % i))
+        writer.close()
+
+        assert len(writer.filenames) == 4
+        # the file opened in advance is deleted
+        assert sorted(tmpdir.listdir()) == sorted(tmpdir.join(name) for name in writer.filenames)
+        assert writer.filenames[0].startswith("TEST-")
+        assert writer.filenames[0].endswith("-00001.warc.gz")
+
+        files = self.read_files(tmpdir, writer)
+        assert [len(records) for records in files] == [4, 4, 4, 2]
+        payloads = []
+        for filename, records in zip(writer.filenames, files):
+            warcinfo, payload = records[0]
+            assert warcinfo.type == "warcinfo"
+            assert warcinfo['WARC-Filename'] == filename
+            assert "operator: test\r\n" in payload
+            for header, payload in records[1:]:
+                assert header['WARC-Warcinfo-ID'] == warcinfo.record_id
+                payloads.append(payload)
+        assert payloads == ["hello %d" % i for i in range(10)]
+
+    def test_max_size(self, tmpdir):
+        writer = RotatingWARCWriter(str(tmpdir), max_size=2000, compress=False)
+        for i in range(10):
+            writer.write_record(WARCRecord(payload="x" * 500))
+        writer.close()
+
+        assert writer.filenames[0].endswith(".warc")
+        files = self.read_files(tmpdir, writer)
+        assert sum(len(records) - 1 for records in files) == 10
+        for filename in writer.filenames[:-1]:
+            # a file is full after it reaches max_size, not before
+            size = tmpdir.join(filename).size()
+            assert 2000 <= size < 2000 + 1000
+
+    def test_max_size_without_tell(self, tmpdir, monkeypatch):
+        # telling the size of a compressed file can wait for compression
+        def tell(self):
+            raise AssertionError("tell() called")
+        monkeypatch.setattr(WARCFile, "tell", tell)
+        writer = RotatingWARCWriter(str(tmpdir), max_size=2000, compress={"threads": 2})
+        for i in range(10):
+            writer.write_record(WARCRecord(payload="x" * 500))
+        writer.close()
+        assert len(writer.filenames) > 1
+
+    def test_close_error(self, tmpdir, monkeypatch):
+        writer = RotatingWARCWriter(str(tmpdir), max_records=1)
+        def close():
+            raise IOError("disk full")
+        writer.current.close = close
+        writer.write_record(WARCRecord(payload="hello 0"))
+        # the full file is closed on the background thread
+        writer.write_record(WARCRecord(payload="hello 1"))
+        with pytest.raises(IOError):
+            writer.close()
+
+    def test_async(self, tmpdir):
+        rotating = RotatingWARCWriter(str(tmpdir), max_records=3)
+        writer = AsyncWARCWriter(rotating, batch_size=5)
+        for i in range(10):
+            writer.write_record(WARCRecord(payload="hello %d" % i))
+        writer.close()
+
+        files = self.read_files(tmpdir, rotating)
+        assert [len(records) for records in files] == [4, 4, 4, 2]
+        payloads = [payload for records in files for header, payload in records[1:]]
+        assert payloads == ["hello %d" % i for i in range(10)]
+
+    def test_max_age(self, tmpdir):
+        writer = RotatingWARCWriter(str(tmpdir), max_age=0)
+        for i in range(3):
+            writer.write_record(WARCRecord(payload="hello %d" % i))
+        writer.close()
+        assert [len(records) for records in self.read_files(tmpdir, writer)] == [2, 2, 2]
+
+    def test_named_when_started(self, tmpdir, monkeypatch):
+        now = [1330594200]
+        gmtime = time.gmtime
+        monkeypatch.setattr(time, "gmtime", lambda t=None: gmtime(now[0]))
+        writer = RotatingWARCWriter(str(tmpdir), prefix="TEST", max_records=1)
+        record = WARCRecord(payload="hello 0")
+        writer.write_record(record)
+        # the next file is named when it is started, an hour later
+        now[0] += 3600
+        writer.write_record(WARCRecord(payload="hello 1"))
+        writer.close()
+
+        assert writer.filenames == ["TEST-20120301093000-00001.warc.gz", "TEST-20120301103000-00002.warc.gz"]
+        assert sorted(tmpdir.listdir()) == sorted(tmpdir.join(name) for name in writer.filenames)
+        assert ".open" not in tmpdir.join(writer.filenames[1]).read("rb")
+        files = self.read_files(tmpdir, writer)
+        assert files[1][0][0]['WARC-Date'] >= files[0][1][0]['WARC-Date']
+        # the header of the record given is changed
+        assert record['WARC-Warcinfo-ID'] == files[0][0][0].record_id
@@ -7,9 +7,22 @@ This file is part of warc
 :copyright: (c) 2012 Internet Archive
 """
 
-from UserDict import DictMixin
+import mmap
+import os
 
-class CaseInsensitiveDict(DictMixin):
+# Size of the blocks read by FilePart.readline
+BLOCK_SIZE = 8192
+
+# Size of the blocks read and dropped by FilePart.skip on unseekable files
+SKIP_SIZE = 64 * 1024
+
+def _intern(s):
+    """Interns byte strings, other strings are returned as they are."""
+    if type(s) is str:
+        return intern(s)
+    return s
+
+class CaseInsensitiveDict(object):
     """Almost like a dictionary, but keys are case-insensitive.
     
         >>> d = CaseInsensitiveDict(foo=1, Bar=2)
@@ -22,73 +35,504 @@ class CaseInsensitiveDict(DictMixin):
         11
         >>> d.keys()
         ["foo", "bar"]
+        >>> d.original_items()
+        [("foo", 11), ("Bar", 2)]
+
+    The keys are kept in the order they were first added, lower-cased for
+    the dictionary methods and with the case they were first given in for
+    :meth:`original_items`, so that headers can be written back as they 
+    were read.
+
+    All the dictionary methods are implemented directly on a dict of the 
+    lower-cased keys. The keys are interned, so that the many headers 
+    holding the same names share one copy of each name, and instances have
+    no ``__dict__``. Subclasses that add attributes should list them in 
+    ``__slots__`` to keep it that way.
     """
+    __slots__ = ("_d", "_keys", "_names")
+
     def __init__(self, mapping=None, **kwargs):
         self._d = {}
+        # The lower-cased keys and the keys as given, in order
+        self._keys = []
+        self._names = []
         self.update(mapping, **kwargs)
         
     def __setitem__(self, name, value):
-        self._d[name.lower()] = value
+        key = name.lower()
+        if key not in self._d:
+            self._keys.append(_intern(key))
+            self._names.append(_intern(name))
+        self._d[key] = value
     
     def __getitem__(self, name):
         return self._d[name.lower()]
         
     def __delitem__(self, name):
-        del self._d[name.lower()]
+        key = name.lower()
+        del self._d[key]
+        i = self._keys.index(key)
+        del self._keys[i]
+        del self._names[i]
+
+    def __contains__(self, name):
+        return name.lower() in self._d
+
+    has_key = __contains__
+
+    def get(self, name, default=None):
+        return self._d.get(name.lower(), default)
+
+    def setdefault(self, name, default=None):
+        key = name.lower()
+        if key not in self._d:
+            self[name] = default
+        return self._d[key]
+
+    def pop(self, name, *default):
+        key = name.lower()
+        if key not in self._d:
+            if default:
+                return default[0]
+            raise KeyError(name)
+        value = self._d[key]
+        del self[name]
+        return value
+
+    def popitem(self):
+        if not self._keys:
+            raise KeyError("popitem(): dictionary is empty")
+        key = self._keys[-1]
+        return key, self.pop(key)
+
+    def clear(self):
+        self._d.clear()
+        del self._keys[:]
+        del self._names[:]
+
+    def update(self, mapping=None, **kwargs):
+        """Updates the dictionary from a mapping or a sequence of (key, value)
+        pairs. The keys of a CaseInsensitiveDict are added with their 
+        original case.
+        """
+        if mapping is not None:
+            if isinstance(mapping, CaseInsensitiveDict):
+                mapping = mapping.original_items()
+            elif hasattr(mapping, "keys"):
+                mapping = [(k, mapping[k]) for k in mapping.keys()]
+            self._update(mapping)
+        if kwargs:
+            self._update(kwargs.iteritems())
+
+    def _update(self, items):
+        items = list(items)
+        names = [name for name, value in items]
+        keys = [name.lower() for name in names]
+        try:
+            names = map(intern, names)
+            keys = map(intern, keys)
+        except TypeError:
+            # unicode keys can't be interned
+            names = map(_intern, names)
+            keys = map(_intern, keys)
+
+        d = self._d
+        if not d:
+            # A new dict is filled with one call when there are no 
+            # duplicate keys, which is the common case.
+            d.update(zip(keys, [value for name, value in items]))
+            if len(d) == len(keys):
+                self._keys.extend(keys)
+                self._names.extend(names)
+                return
+            d.clear()
+
+        for key, name, (_, value) in zip(keys, names, items):
+            if key not in d:
+                self._keys.append(key)
+                self._names.append(name)
+            d[key] = value
+
+    def __len__(self):
+        return len(self._d)
+
+    def __iter__(self):
+        return iter(self._keys)
+
+    iterkeys = __iter__
+
+    def keys(self):
+        return list(self._keys)
+
+    def itervalues(self):
+        d = self._d
+        for key in self._keys:
+            yield d[key]
+
+    def values(self):
+        d = self._d
+        return [d[key] for key in self._keys]
+
+    def iteritems(self):
+        d = self._d
+        for key in self._keys:
+            yield key, d[key]
+
+    def items(self):
+        d = self._d
+        return [(key, d[key]) for key in self._keys]
+
+    def original_items(self):
+        """Returns the (key, value) pairs in order, with the keys in the case
+        they were first given in.
+        """
+        d = self._d
+        return [(name, d[key]) for key, name in zip(self._keys, self._names)]
         
     def __eq__(self, other):
         return isinstance(other, CaseInsensitiveDict) and other._d == self._d
-        
-    def keys(self):
-        return self._d.keys()
 
-class FilePart:
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __getstate__(self):
+        # Instances have no __dict__ for pickle to save, the state is the 
+        # items and the other slots of the subclasses.
+        slots = {}
+        for cls in self.__class__.__mro__:
+            for name in cls.__dict__.get("__slots__", ()):
+                if name not in CaseInsensitiveDict.__slots__ and hasattr(self, name):
+                    slots[name] = getattr(self, name)
+        return self.original_items(), slots
+
+    def __setstate__(self, state):
+        items, slots = state
+        for name, value in slots.items():
+            setattr(self, name, value)
+        # Interns the keys again
+        CaseInsensitiveDict.__init__(self, items)
+
+class FilePart(object):
     """File interface over a part of file.
     
     Takes a file and length to read from the file and returns a file-object 
     over that part of the file.
+
+    Data for :meth:`readline` is read from the file in blocks of `blocksize`
+    bytes and kept in a buffer, which is consumed by moving a position in it
+    rather than by making a new string of the rest of the buffer. Reads that
+    can't be served from the buffer go straight to the file. Nothing is ever
+    read past the end of the part.
     """
-    def __init__(self, fileobj, length):
+    __slots__ = ("fileobj", "length", "offset", "blocksize", "buf", "bufpos", "unread")
+
+    def __init__(self, fileobj, length, blocksize=BLOCK_SIZE):
         self.fileobj = fileobj
         self.length = length
         self.offset = 0
-        self.buf = "" 
-        
+        self.blocksize = blocksize
+        self.buf = ""
+        self.bufpos = 0
+        # Number of bytes of the part not yet read from the file
+        self.unread = length
+
+    def _fill(self):
+        """Reads the next block into the buffer. Returns False at the end 
+        of the part.
+        """
+        data = self.fileobj.read(min(self.blocksize, self.unread))
+        self.unread -= len(data)
+        self.buf = data
+        self.bufpos = 0
+        return data != ""
+
     def read(self, size=-1):
-        if size == -1:
-            return self._read(self.length)
-        else:
-            return self._read(size)
-        
-    def _read(self, size):
-        if len(self.buf) >= size:
-            content = self.buf[:size]
-            self.buf = self.buf[size:]
+        remaining = self.length - self.offset
+        if size < 0 or size > remaining:
+            size = remaining
+
+        bufpos = self.bufpos
+        available = len(self.buf) - bufpos
+        if size <= available:
+            content = self.buf[bufpos:bufpos+size]
+            self.bufpos = bufpos + size
         else:
-            size = min(size, self.length - self.offset - len(self.buf))
-            content = self.buf + self.fileobj.read(size)
+            content = self.fileobj.read(size - available)
+            self.unread -= len(content)
+            if available:
+                content = self.buf[bufpos:] + content
             self.buf = ""
+            self.bufpos = 0
         self.offset += len(content)
         return content
-        
-    def _unread(self, content):
-        self.buf = content + self.buf
-        self.offset -= len(content)
-        
-    def readline(self):
+
+    def readinto(self, b):
+        """Reads data into the writable buffer `b`, like bytearray or 
+        memoryview, without intermediate copies where the underlying file
+        supports readinto. Returns the number of bytes read.
+        """
+        view = memoryview(b)
+        size = min(len(view), self.length - self.offset)
+
+        n = min(size, len(self.buf) - self.bufpos)
+        if n:
+            view[:n] = self.buf[self.bufpos:self.bufpos+n]
+            self.bufpos += n
+
+        readinto = getattr(self.fileobj, "readinto", None)
+        while n < size:
+            if readinto is not None:
+                count = readinto(view[n:size])
+            else:
+                data = self.fileobj.read(size - n)
+                count = len(data)
+                view[n:n+count] = data
+            if not count:
+                break
+            self.unread -= count
+            n += count
+
+        self.offset += n
+        return n
+
+    def skip(self):
+        """Moves to the end of the part without reading the rest of it 
+        into strings where possible.
+
+        Files with a `skip` method, like :class:`warc.gzip2.GzipFile`, skip
+        the data themselves. Other files are seeked past the rest of the 
+        part, or read in blocks when they can't seek, like pipes.
+        """
+        unread = self.unread
+        self.buf = ""
+        self.bufpos = 0
+        self.offset = self.length
+        self.unread = 0
+        if unread == 0:
+            return
+        if hasattr(self.fileobj, "skip"):
+            self.fileobj.skip(unread)
+            return
+        try:
+            self.fileobj.seek(unread, os.SEEK_CUR)
+        except (AttributeError, IOError):
+            while unread > 0:
+                data = self.fileobj.read(min(unread, SKIP_SIZE))
+                if not data:
+                    break
+                unread -= len(data)
+
+    def readline(self, size=-1):
+        remaining = self.length - self.offset
+        if size < 0 or size > remaining:
+            size = remaining
+
+        chunks = []
+        while size > 0:
+            if self.bufpos == len(self.buf) and not self._fill():
+                break
+            buf, bufpos = self.buf, self.bufpos
+            end = buf.find("\n", bufpos, bufpos+size) + 1
+            if end == 0:
+                end = min(len(buf), bufpos+size)
+            chunks.append(buf[bufpos:end])
+            self.bufpos = end
+            size -= end - bufpos
+            if buf[end-1] == "\n":
+                break
+
+        line = "".join(chunks)
+        self.offset += len(line)
+        return line
+
+    def __iter__(self):
+        line = self.readline()
+        while line:
+            yield line
+            line = self.readline()
+
+def map_file(fileobj):
+    """Maps the file read-only into memory and returns the :class:`mmap.mmap`
+    object, which can be read like a file. Empty files can't be mapped and
+    are returned as they are.
+    """
+    fileobj.seek(0, os.SEEK_END)
+    if fileobj.tell() == 0:
+        return fileobj
+    return mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+
+class MappedPart(object):
+    """File interface over a part of a memory mapped file.
+
+    Works like :class:`FilePart` for a part starting at the current
+    position of the :class:`mmap.mmap` object `fileobj`. Lines are found by
+    searching the map and skipping only moves the position of the map.
+
+    :meth:`view` gives the unread data as a buffer sharing the memory of 
+    the map, which can be hashed or written to a file without copying it.
+    """
+    __slots__ = ("fileobj", "length", "offset", "start")
+
+    def __init__(self, fileobj, length):
+        self.fileobj = fileobj
+        self.length = length
+        self.offset = 0
+        self.start = fileobj.tell()
+
+    def read(self, size=-1):
+        remaining = self.length - self.offset
+        if size < 0 or size > remaining:
+            size = remaining
+        content = self.fileobj.read(size)
+        self.offset += len(content)
+        return content
+
+    def readinto(self, b):
+        """Reads data into the writable buffer `b`. Returns the number of
+        bytes read.
+        """
+        view = memoryview(b)
+        size = min(len(view), self.length - self.offset)
+        pos = self.start + self.offset
+        view[:size] = self.fileobj[pos:pos+size]
+        self.fileobj.seek(pos+size)
+        self.offset += size
+        return size
+
+    def readline(self, size=-1):
+        remaining = self.length - self.offset
+        if size < 0 or size > remaining:
+            size = remaining
+        pos = self.start + self.offset
+        end = self.fileobj.find("\n", pos, pos+size) + 1
+        if end == 0:
+            end = pos + size
+        return self.read(end - pos)
+
+    def view(self):
+        """Returns a read-only buffer over the unread part, without copying
+        it. The position is not moved.
+        """
+        pos = self.start + self.offset
+        return buffer(self.fileobj, pos, self.length - self.offset)
+
+    def skip(self):
+        """Moves to the end of the part."""
+        # A truncated file ends before the part
+        self.fileobj.seek(min(self.start + self.length, len(self.fileobj)))
+        self.offset = self.length
+
+    def __iter__(self):
+        line = self.readline()
+        while line:
+            yield line
+            line = self.readline()
+
+class PeekableFile(object):
+    """File interface over a file that can't seek, like a pipe, which can 
+    look at the data ahead without consuming it.
+
+    :meth:`peek` returns data from the file that is read again by the next
+    :meth:`read`. The data returned by the last read is kept, so that 
+    :meth:`seek` can move back into it, which is all that 
+    :class:`warc.gzip2.GzipFile` needs to read a compressed file. Seeking 
+    forward reads and drops the data. :meth:`tell` counts the bytes read
+    from the start of the file.
+    """
+    __slots__ = ("fileobj", "buf", "bufpos", "offset")
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.buf = ""
+        self.bufpos = 0
+        # Offset of the start of the buffer in the file
+        self.offset = 0
+
+    def _fill(self, size):
+        """Makes the buffer hold at least `size` bytes after the position,
+        unless the file ends before. Data before the position is dropped.
+        """
+        available = len(self.buf) - self.bufpos
+        if available >= size:
+            return
+        chunks = [self.buf[self.bufpos:]]
+        while available < size:
+            data = self.fileobj.read(size - available)
+            if not data:
+                break
+            chunks.append(data)
+            available += len(data)
+        self.offset += self.bufpos
+        self.buf = "".join(chunks)
+        self.bufpos = 0
+
+    def peek(self, size):
+        """Returns the next `size` bytes, or less at the end of the file,
+        without moving the position.
+        """
+        self._fill(size)
+        return self.buf[self.bufpos:self.bufpos+size]
+
+    def read(self, size=-1):
+        if size < 0:
+            data = self.buf[self.bufpos:] + self.fileobj.read()
+            self.offset += self.bufpos
+            self.buf = data
+            self.bufpos = 0
+        else:
+            self._fill(size)
+            data = self.buf[self.bufpos:self.bufpos+size]
+        self.bufpos += len(data)
+        return data
+
+    def readline(self, size=-1):
         chunks = []
-        chunk = self._read(1024)
-        while chunk and "\n" not in chunk:
-            chunks.append(chunk)
-            chunk = self._read(1024)
-            
-        if "\n" in chunk:
-            index = chunk.index("\n")
-            self._unread(chunk[index+1:])
-            chunk = chunk[:index+1]
-        chunks.append(chunk)
+        while size != 0:
+            end = self.buf.find("\n", self.bufpos) + 1
+            if end == 0:
+                end = len(self.buf)
+            if size > 0:
+                end = min(end, self.bufpos + size)
+                size -= end - self.bufpos
+            chunks.append(self.buf[self.bufpos:end])
+            self.bufpos = end
+            if chunks[-1].endswith("\n"):
+                break
+            data = self.fileobj.read(BLOCK_SIZE)
+            if not data:
+                break
+            self.offset += len(self.buf)
+            self.buf = data
+            self.bufpos = 0
         return "".join(chunks)
 
+    def tell(self):
+        return self.offset + self.bufpos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.tell()
+        elif whence != os.SEEK_SET:
+            raise IOError("Can't seek from the end of a file that can't seek")
+        if offset < self.offset:
+            raise IOError("Can't seek back before the data read last")
+        while offset > self.offset + len(self.buf):
+            self.offset += len(self.buf)
+            self.buf = self.fileobj.read(min(offset - self.offset, SKIP_SIZE))
+            self.bufpos = 0
+            if not self.buf:
+                return
+        self.bufpos = offset - self.offset
+
+    def close(self):
+        self.buf = ""
+        self.bufpos = 0
+        if hasattr(self.fileobj, "close"):
+            self.fileobj.close()
+
     def __iter__(self):
         line = self.readline()
         while line:
@@ -0,0 +1,274 @@
+"""
+warc.verify
+~~~~~~~~~~~
+
+Verifies the digests of the records of WARC files.
+
+Every record is read and the digests of its block and payload are computed
+while reading, in chunks, and compared with its WARC-Block-Digest and
+WARC-Payload-Digest headers. Digests of any algorithm of :mod:`hashlib`,
+like sha1 and sha256, are supported, in base32 or hex encoding.
+
+The payload digest is compared with the digest of the HTTP payload of
+records with HTTP messages, as in the WARC standard, and with the digest of
+the whole block, which :class:`warc.WARCRecord` writes.
+
+    >>> from warc import verify
+    >>> verify.write_report(["crawl.warc.gz"], sys.stdout, jobs=4)
+
+Files are verified on `jobs` processes. Compressed files are split into
+ranges at gzip member boundaries like for indexing, so that a single large
+file is verified in parallel too.
+
+:copyright: (c) 2012 Internet Archive
+"""
+
+import base64
+import binascii
+import hashlib
+import multiprocessing
+
+from . import SNIFF_SIZE, sniff_format
+from .index import split_ranges
+from .warc import WARCFile, CHUNK_SIZE
+
+# Size of the chunks hashed from memory mapped payloads
+VIEW_CHUNK_SIZE = 1024 * 1024
+
+# HTTP headers longer than this are not looked for the end of
+MAX_HTTP_HEADERS = 64 * 1024
+
+def parse_digest(value):
+    """Parses a digest header like "sha1:3I42H3S6NNFQ2MSVX7XZKYAYSCX5QBYJ".
+
+    Returns a tuple of the algorithm and the digest as bytes, or None if
+    the algorithm is not known or the digest can't be decoded.
+    """
+    algorithm, sep, encoded = value.partition(":")
+    algorithm = algorithm.strip().lower().replace("-", "")
+    encoded = encoded.strip()
+    try:
+        size = hashlib.new(algorithm).digest_size
+    except ValueError:
+        return None
+    try:
+        if len(encoded) == size * 2:
+            digest = binascii.unhexlify(encoded)
+        else:
+            encoded = encoded.upper()
+            digest = base64.b32decode(encoded + "=" * (-len(encoded) % 8))
+    except (TypeError, binascii.Error):
+        return None
+    if len(digest) != size:
+        return None
+    return algorithm, digest
+
+class HTTPPayloadHash:
+    """Hashes the part of an HTTP message after the headers.
+
+    :attr:`found` is False until the end of the headers is seen and None if
+    it is not seen within :data:`MAX_HTTP_HEADERS` bytes.
+    """
+    def __init__(self, algorithm):
+        self.hash = hashlib.new(algorithm)
+        self.head = ""
+        self.found = False
+
+    def update(self, chunk):
+        if self.found:
+            self.hash.update(chunk)
+        elif self.found is False:
+            start = max(len(self.head) - 3, 0)
+            self.head += str(chunk)
+            end = self.head.find("\r\n\r\n", start)
+            if end >= 0:
+                self.found = True
+                self.hash.update(buffer(self.head, end + 4))
+                self.head = ""
+            elif len(self.head) > MAX_HTTP_HEADERS:
+                self.found = None
+                self.head = ""
+
+    def digest(self):
+        return self.hash.digest()
+
+def iter_payload(payload):
+    """Returns an iterator over the chunks of a payload, which are buffers
+    over the map for memory mapped payloads.
+    """
+    if hasattr(payload, "view"):
+        view = payload.view()
+        return (buffer(view, start, VIEW_CHUNK_SIZE)
+                for start in xrange(0, len(view), VIEW_CHUNK_SIZE))
+    return iter(lambda: payload.read(CHUNK_SIZE), "")
+
+def verify_record(record):
+    """Reads the payload of a record and checks its digests. Returns a list
+    of the problems found, which is empty when the record is fine. Raises
+    IOError if the file ends before the end of the payload.
+    """
+    header = record.header
+    problems = []
+    block_digest = payload_digest = None
+    for name in ["WARC-Block-Digest", "WARC-Payload-Digest"]:
+        value = header.get(name)
+        if value is None:
+            continue
+        parsed = parse_digest(value)
+        if parsed is None:
+            problems.append("%s %s can't be checked" % (name, value))
+        elif name == "WARC-Block-Digest":
+            block_digest = parsed
+        else:
+            payload_digest = parsed
+
+    # Revisit records have the digest of the payload they refer to and
+    # truncated records don't have the whole payload.
+    if header.get("WARC-Type") == "revisit" or "WARC-Truncated" in header:
+        payload_digest = None
+
+    hashes = {}
+    if block_digest is not None:
+        hashes[block_digest[0]] = hashlib.new(block_digest[0])
+    http_hash = None
+    if payload_digest is not None:
+        hashes.setdefault(payload_digest[0], hashlib.new(payload_digest[0]))
+        if header.get("Content-Type", "").startswith("application/http"):
+            http_hash = HTTPPayloadHash(payload_digest[0])
+    updates = [h.update for h in hashes.values()]
+    if http_hash is not None:
+        updates.append(http_hash.update)
+
+    length = 0
+    for chunk in iter_payload(record.payload):
+        length += len(chunk)
+        for update in updates:
+            update(chunk)
+
+    if length != header.content_length:
+        raise IOError("Record is truncated, %d of %d bytes read" % (length, header.content_length))
+    if block_digest is not None and hashes[block_digest[0]].digest() != block_digest[1]:
+        problems.append("WARC-Block-Digest %s doesn't match the block" % header["WARC-Block-Digest"])
+    if payload_digest is not None:
+        digests = [hashes[payload_digest[0]].digest()]
+        if http_hash is not None and http_hash.found:
+            digests.append(http_hash.digest())
+        if payload_digest[1] not in digests:
+            problems.append("WARC-Payload-Digest %s doesn't match the payload" % header["WARC-Payload-Digest"])
+    return problems
+
+def _open_warc(path):
+    """Opens a WARC file for verifying. Uncompressed files are memory
+    mapped.
+    """
+    fileobj = open(path, "rb")
+    try:
+        format, compressed = sniff_format(fileobj.read(SNIFF_SIZE))
+    finally:
+        fileobj.close()
+    if format != "warc":
+        raise IOError("%s is not a WARC file" % path)
+    return WARCFile(path, compress=compressed, mmap=not compressed)
+
+def _problem(filename, offset, record_id, message):
+    return {
+        "filename": filename,
+        "offset": offset,
+        "record_id": record_id or "-",
+        "message": message,
+    }
+
+def _verify_range(args):
+    """Verifies the records starting in a range of a WARC file. Runs in the
+    worker processes. Returns the number of records read and the list of
+    problems found.
+    """
+    path, start, end = args
+    records = 0
+    problems = []
+    offset = start or 0
+    try:
+        f = _open_warc(path)
+    except IOError as e:
+        return records, [_problem(path, offset, None, str(e))]
+    try:
+        if start:
+            f.seek(start)
+        reader = f.reader
+        while end is None or offset < end:
+            record = reader.read_record()
+            if record is None:
+                break
+            records += 1
+            for message in verify_record(record):
+                problems.append(_problem(path, offset, record.header.record_id, message))
+            reader.finish_reading_current_record()
+            offset = f.tell()
+    except Exception as e:
+        # A damaged record or gzip member ends the range
+        problems.append(_problem(path, offset, None, "%s: %s" % (e.__class__.__name__, e)))
+    finally:
+        f.close()
+    return records, problems
+
+def _tasks(paths, jobs):
+    for path in paths:
+        format, compressed = None, False
+        if jobs > 1:
+            fileobj = open(path, "rb")
+            try:
+                format, compressed = sniff_format(fileobj.read(SNIFF_SIZE))
+            finally:
+                fileobj.close()
+        if format == "warc" and compressed:
+            # More ranges than processes to keep all the processes busy
+            for start, end in split_ranges(path, jobs * 4):
+                yield path, start, end
+        else:
+            yield path, None, None
+
+def iter_results(paths, jobs=1):
+    """Verifies the WARC files with the given names on `jobs` processes.
+
+    Returns an iterator over tuples of the number of records verified and
+    the list of problems found, for each file or part of a file, in the
+    order of the files. Each problem is a dictionary with the `filename`,
+    the `offset` of the record, its `record_id` and a `message`.
+    """
+    tasks = _tasks(paths, jobs)
+    if jobs <= 1:
+        for task in tasks:
+            yield _verify_range(task)
+        return
+
+    pool = multiprocessing.Pool(jobs)
+    try:
+        for result in pool.imap(_verify_range, tasks):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def verify_files(paths, jobs=1):
+    """Returns an iterator over the problems found in the WARC files with
+    the given names, see :func:`iter_results`.
+    """
+    for records, problems in iter_results(paths, jobs):
+        for problem in problems:
+            yield problem
+
+def write_report(paths, out, jobs=1):
+    """Verifies the WARC files with the given names and writes a line for
+    every problem found to the file object `out`, followed by a summary
+    line. Returns the number of problems.
+    """
+    count = 0
+    total = 0
+    for records, problems in iter_results(paths, jobs):
+        total += records
+        for problem in problems:
+            out.write("%(filename)s %(offset)d %(record_id)s %(message)s\n" % problem)
+            count += 1
+    out.write("%d records verified, %d problems found\n" % (total, count))
+    return count
@@ -11,12 +11,37 @@ import __builtin__
 import datetime
 import uuid
 import logging
+import os
 import re
 from cStringIO import StringIO
 import hashlib
+import mmap
+import tempfile
+import time
 
 from . import gzip2
-from .utils import CaseInsensitiveDict, FilePart
+from .utils import CaseInsensitiveDict, FilePart, MappedPart, map_file
+
+# Size of the chunks in which file-like payloads are read
+CHUNK_SIZE = 64 * 1024
+
+# Payloads that need to be spooled are kept in memory up to this size
+SPOOL_SIZE = 1024 * 1024
+
+def _iter_chunks(payload):
+    """Returns an iterator over the chunks of a file-like or iterator payload.
+    """
+    if hasattr(payload, "read"):
+        return iter(lambda: payload.read(CHUNK_SIZE), "")
+    else:
+        return iter(payload)
+
+def _tell(fileobj):
+    """Returns the position of a seekable file or None."""
+    try:
+        return fileobj.tell()
+    except (AttributeError, IOError):
+        return None
 
 class WARCHeader(CaseInsensitiveDict):
     """The WARC Header object represents the headers of a WARC record.
@@ -49,6 +74,10 @@ class WARCHeader(CaseInsensitiveDict):
         * length (length of the n/w doc in bytes)
 
     """
+    # The fields of LazyWARCHeader are here too, so that the classes have 
+    # the same layout and a LazyWARCHeader can become a WARCHeader.
+    __slots__ = ("version", "_block", "_pos")
+
     CONTENT_TYPES = dict(warcinfo='application/warc-fields',
                         response='application/http; msgtype=response',
                         request='application/http; msgtype=request',
@@ -87,21 +116,47 @@ class WARCHeader(CaseInsensitiveDict):
         if "Content-Type" not in self:
             self['Content-Type'] = WARCHeader.CONTENT_TYPES.get(self.type, "application/octet-stream")
                         
+    # Cache of canonical_name, up to CANONICAL_CACHE_SIZE names
+    _canonical_names = {}
+    CANONICAL_CACHE_SIZE = 1000
+
+    @classmethod
+    def canonical_name(cls, name):
+        """Returns the name to write for a header name.
+
+        Names with any upper case letters are written as they are, so that
+        headers read from a file are written back unchanged. All lower case
+        names are written in the standard form, like "WARC-Target-URI" for
+        "warc-target-uri".
+        """
+        if name != name.lower():
+            return name
+        canonical = name.title()
+        # Use standard forms for commonly used patterns
+        return canonical.replace("Warc-", "WARC-").replace("-Ip-", "-IP-").replace("-Id", "-ID").replace("-Uri", "-URI")
+
     def write_to(self, f):
         """Writes this header to a file, in the format specified by WARC.
+
+        The whole header is written with one call. Returns the number of 
+        bytes written.
         """
-        f.write(self.version + "\r\n")
-        for name, value in self.items():
-            name = name.title()
-            # Use standard forms for commonly used patterns
-            name = name.replace("Warc-", "WARC-").replace("-Ip-", "-IP-").replace("-Id", "-ID").replace("-Uri", "-URI")
-            f.write(name)
-            f.write(": ")
-            f.write(value)
-            f.write("\r\n")
-        
+        names = self._canonical_names
+        lines = [self.version, "\r\n"]
+        for name, value in self.original_items():
+            try:
+                name = names[name]
+            except KeyError:
+                canonical = self.canonical_name(name)
+                if len(names) < self.CANONICAL_CACHE_SIZE:
+                    names[name] = canonical
+                name = canonical
+            lines += (name, ": ", value, "\r\n")
         # Header ends with an extra CRLF
-        f.write("\r\n")
+        lines.append("\r\n")
+        data = "".join(lines)
+        f.write(data)
+        return len(data)
 
     @property
     def content_length(self):
@@ -131,18 +186,109 @@ class WARCHeader(CaseInsensitiveDict):
     def __repr__(self):
         return "<WARCHeader: type=%r, record_id=%r>" % (self.type, self.record_id)
 
+class LazyWARCHeader(WARCHeader):
+    """A WARCHeader read from a file, which keeps the header block as it was
+    read and splits it into fields only when they are needed.
+
+    Looking up a header by the name used in the file, like 
+    ``h['WARC-Type']``, ``h.type`` or ``h.content_length``, searches the
+    block for that line. Anything else, including a lookup that doesn't 
+    find the line, parses the block and turns this into a plain 
+    :class:`WARCHeader`.
+    """
+    __slots__ = ()
+
+    def __init__(self, block, pos):
+        """Creates the header from a header block that has been validated 
+        by :class:`WARCReader`. The header lines start at `pos`.
+        """
+        self.version = block[:pos-2]
+        self._block = block
+        self._pos = pos
+
+    def __getattr__(self, name):
+        # Called only when the fields have not been parsed yet
+        if name in ("_d", "_keys", "_names"):
+            self._parse()
+            return getattr(self, name)
+        raise AttributeError(name)
+
+    def __reduce__(self):
+        # Pickled as the WARCHeader it becomes when parsed. Without this, 
+        # the state would be read after the class and change it on the way.
+        self._parse()
+        return self.__reduce_ex__(2)
+
+    def _parse(self):
+        block, pos = self._block, self._pos
+        del self._block, self._pos
+        self.__class__ = WARCHeader
+        CaseInsensitiveDict.__init__(self, WARCReader.RE_HEADER.findall(block, pos))
+
+    def __getitem__(self, name):
+        # Every header line follows the CRLF of the line before it. The last
+        # line with the name is used, like when parsing the block.
+        block = self._block
+        i = block.rfind("\r\n" + name + ":")
+        if i == -1:
+            self._parse()
+            return self[name]
+        start = i + len(name) + 3
+        return block[start:block.index("\r\n", start)].lstrip(" ")
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def write_to(self, f):
+        """Writes the header block as it was read."""
+        f.write(self._block)
+        return len(self._block)
+
+    def __contains__(self, name):
+        try:
+            self[name]
+        except KeyError:
+            return False
+        return True
+
 class WARCRecord(object):
     """The WARCRecord object represents a WARC Record.
     """
+    __slots__ = ("header", "payload")
+
+    def __getstate__(self):
+        return self.header, self.payload
+
+    def __setstate__(self, state):
+        self.header, self.payload = state
+
     def __init__(self, header=None, payload=None,  headers={}, defaults=True):
         """Creates a new WARC record. 
+
+        The payload can be a string, a file-like object or an iterator over
+        strings. When the Content-Length or WARC-Payload-Digest headers are
+        not specified, they are computed by reading the payload in chunks. A
+        seekable file is rewound after that and any other payload is copied 
+        to a temporary file on the way, so the payload is never held in 
+        memory as a whole.
         """
 
         if header is None and defaults is True:
             headers.setdefault("WARC-Type", "response")
 
-        self.header = header or WARCHeader(headers, defaults=True)
+        if header is None:
+            header = WARCHeader(headers, defaults=True)
+        self.header = header
         self.payload = payload
+
+        if defaults is True and not isinstance(payload, basestring) and payload is not None:
+            if 'Content-Length' not in self.header or 'WARC-Payload-Digest' not in self.header:
+                length, digest = self._scan_payload(payload)
+                self.header.setdefault('Content-Length', str(length))
+                self.header.setdefault('WARC-Payload-Digest', digest)
         
         if defaults is True and 'Content-Length' not in self.header:
             if payload:
@@ -151,17 +297,51 @@ class WARCRecord(object):
                 self.header['Content-Length'] = "0"
                 
         if defaults is True and 'WARC-Payload-Digest' not in self.header:
-            self.header['WARC-Payload-Digest'] = self._compute_digest(payload)
+            self.header['WARC-Payload-Digest'] = self._compute_digest(payload or "")
             
     def _compute_digest(self, payload):
         return "sha1:" + hashlib.sha1(payload).hexdigest()
+
+    def _scan_payload(self, payload):
+        """Computes the length and digest of a file-like or iterator payload.
+
+        Payloads that can't be rewound are copied to a temporary file, 
+        which becomes the payload of this record.
+        """
+        sha1 = hashlib.sha1()
+        length = 0
+        start = _tell(payload)
+        if start is None:
+            spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)
+
+        for chunk in _iter_chunks(payload):
+            sha1.update(chunk)
+            length += len(chunk)
+            if start is None:
+                spool.write(chunk)
+
+        if start is None:
+            spool.seek(0)
+            self.payload = spool
+        else:
+            payload.seek(start)
+        return length, "sha1:" + sha1.hexdigest()
                 
     def write_to(self, f):
-        self.header.write_to(f)
-        f.write(self.payload)
-        f.write("\r\n")
-        f.write("\r\n")
-        f.flush()
+        """Writes this record to a file and returns the number of bytes 
+        written. The file is not flushed, see the `flush` argument of 
+        :class:`WARCFile`.
+        """
+        size = self.header.write_to(f)
+        if isinstance(self.payload, (basestring, buffer)):
+            f.write(self.payload)
+            size += len(self.payload)
+        elif self.payload is not None:
+            for chunk in _iter_chunks(self.payload):
+                f.write(chunk)
+                size += len(chunk)
+        f.write("\r\n\r\n")
+        return size + 4
         
     @property
     def type(self):
@@ -241,20 +421,142 @@ class WARCRecord(object):
         }
         return WARCRecord(payload=payload, headers=headers)
 
+def _gzip_options(compress):
+    """Returns the arguments for GzipFile from the compress argument of 
+    WARCFile.
+    """
+    if isinstance(compress, dict):
+        return compress
+    elif compress is True:
+        return {}
+    else:
+        return {"compresslevel": compress}
+
+def _flush_options(flush):
+    """Returns the flush policy as a dict from the flush argument of 
+    WARCFile.
+    """
+    if isinstance(flush, dict):
+        unknown = set(flush) - set(["records", "bytes", "seconds", "fsync"])
+        if unknown:
+            raise TypeError("Unknown flush options: %s" % ", ".join(sorted(unknown)))
+        return flush
+    elif flush:
+        return {"records": 1}
+    else:
+        return {}
+
 class WARCFile:
-    def __init__(self, filename=None, mode=None, fileobj=None, compress=None):
-        if fileobj is None:
-            fileobj = __builtin__.open(filename, mode or "rb")
-            mode = fileobj.mode
+    """A WARC file, for reading or writing WARC records.
+
+    :param compress: Whether the file is gzip compressed. It defaults to 
+        True when the filename ends with ".gz". When writing, it can also be
+        the compression level (1 is fastest, 9 compresses most) or a dict of
+        arguments for :class:`warc.gzip2.GzipFile`, like 
+        ``{"compresslevel": 6, "strategy": zlib.Z_FILTERED, "backend": zlib}``.
+        With ``"threads": n`` in the dict, records are compressed on n 
+        threads by :class:`warc.gzip2.ParallelGzipWriter`, which also takes
+        ``"max_pending"`` and ``"max_pending_bytes"``.
+    :param mmap: When True, an uncompressed file is memory mapped for 
+        reading. Headers are then found by searching the map and payloads
+        are :class:`warc.utils.MappedPart` objects, whose ``view()`` gives
+        the payload without copying it.
+    :param member_index: Only for compressed files. When writing, True 
+        makes a :class:`warc.gzip2.MemberIndex` of the gzip members, which
+        is saved next to the file by :meth:`close`, in a file named with
+        :data:`warc.gzip2.INDEX_SUFFIX` added to the filename. When 
+        appending, True extends the index file of the file, and raises 
+        ValueError if it has none or it is out of date (see 
+        :func:`warc.gzip2.load_index`). Writing a file by name without 
+        True deletes its index file, which would no longer match. When 
+        reading, True loads the index file, or builds the index when there
+        is no up to date index file, which decompresses the whole file 
+        when it is opened; ``MemberIndex.build`` and ``save`` make the 
+        index file for the next time. A MemberIndex can also be given, 
+        which is updated when writing but not saved. The index is 
+        available as :attr:`member_index`, :meth:`seek` uses it to check
+        offsets.
+    :param flush: When to flush the file when writing. True flushes after
+        every record, False only when the file is closed, which lets the
+        records be written with large buffered writes. A dict flushes 
+        after ``"records"`` records, ``"bytes"`` bytes of records (before
+        compression) or ``"seconds"`` seconds since the last flush, 
+        whichever comes first; the time is only checked when writing. With
+        ``"fsync": True`` in the dict, every flush and :meth:`close` also 
+        syncs the file to disk with ``os.fsync``.
+    """
+    def __init__(self, filename=None, mode=None, fileobj=None, compress=None, mmap=False,
+                 member_index=None, flush=True):
         # initiaize compress based on filename, if not already specified
         if compress is None and filename and filename.endswith(".gz"):
             compress = True
+        # Level 0 is gzip too, without compression
+        compressed = compress is not None and compress is not False
+        if mmap and (compressed or (mode and mode[0] in "wa")):
+            raise ValueError("mmap can only be used for reading uncompressed files")
+        if member_index and not compressed:
+            raise ValueError("member_index can only be used for compressed files")
+
+        # The file the member index is saved to on close
+        self._index_path = None
+        writing = bool(mode) and mode[0] in "wa"
+        index_path = filename and filename + gzip2.INDEX_SUFFIX
+        if writing and member_index is True:
+            self._index_path = index_path
+            if mode[0] == "a" and filename and os.path.exists(filename) and os.path.getsize(filename):
+                member_index = gzip2.load_index(filename)
+                if member_index is None:
+                    raise ValueError("%s has no up to date member index to append to" % filename)
+            else:
+                member_index = gzip2.MemberIndex()
+        elif writing and index_path and os.path.exists(index_path):
+            os.remove(index_path)
+
+        # The file opened here, which is closed along with this file
+        self._myfileobj = None
+        if fileobj is None:
+            fileobj = self._myfileobj = __builtin__.open(filename, mode or "rb")
+            mode = fileobj.mode
+        if mmap:
+            fileobj = map_file(fileobj)
+
+        if member_index is True:
+            member_index = self._load_member_index(filename, fileobj)
+        self.member_index = member_index
         
-        if compress:
-            fileobj = gzip2.GzipFile(fileobj=fileobj, mode=mode)
+        if compressed:
+            options = dict(_gzip_options(compress))
+            if writing and member_index is not None:
+                options["member_index"] = member_index
+            threads = options.pop("threads", None)
+            if threads and mode and mode[0] in "wa":
+                fileobj = gzip2.ParallelGzipWriter(fileobj, threads=threads, **options)
+            else:
+                options.pop("max_pending", None)
+                options.pop("max_pending_bytes", None)
+                fileobj = gzip2.GzipFile(fileobj=fileobj, mode=mode, **options)
         
         self.fileobj = fileobj
         self._reader = None
+
+        policy = _flush_options(flush)
+        self._flush_records = policy.get("records")
+        self._flush_bytes = policy.get("bytes")
+        self._flush_seconds = policy.get("seconds")
+        self._fsync = policy.get("fsync", False)
+        # Records and bytes written and time since the last flush
+        self._unflushed_records = 0
+        self._unflushed_bytes = 0
+        self._flushed_at = time.time()
+
+    def _load_member_index(self, filename, fileobj):
+        index = filename and gzip2.load_index(filename)
+        if index is not None:
+            return index
+        position = fileobj.tell()
+        index = gzip2.MemberIndex.build(fileobj)
+        fileobj.seek(position)
+        return index
         
     @property
     def reader(self):
@@ -263,23 +565,135 @@ class WARCFile:
         return self._reader
     
     def write_record(self, warc_record):
-        """Adds a warc record to this WARC file.
+        """Adds a warc record to this WARC file and returns the number of 
+        bytes written, before compression.
         """
-        warc_record.write_to(self.fileobj)
+        size = self._write(warc_record)
+        if self._needs_flush():
+            self.flush()
+        return size
+
+    def _write(self, warc_record):
+        size = warc_record.write_to(self.fileobj)
         # Each warc record is written as separate member in the gzip file
         # so that each record can be read independetly.
-        if isinstance(self.fileobj, gzip2.GzipFile):
+        if isinstance(self.fileobj, (gzip2.GzipFile, gzip2.ParallelGzipWriter)):
             self.fileobj.close_member()
+        self._unflushed_records += 1
+        self._unflushed_bytes += size
+        return size
+
+    def write_records(self, records, batch=False):
+        """Adds the warc records from an iterable to this WARC file and 
+        returns the number of records written.
+
+        The file is flushed as set by the `flush` argument of 
+        :class:`WARCFile`, so with ``flush=False`` or a dict the records 
+        are written with buffered writes instead of a flush for each. With
+        `batch` True, the flush policy is only checked after the last 
+        record, so the file is flushed at most once for all of them, also
+        with ``flush=True``.
+        """
+        count = 0
+        for record in records:
+            if batch:
+                self._write(record)
+            else:
+                self.write_record(record)
+            count += 1
+        if batch and self._needs_flush():
+            self.flush()
+        return count
+
+    def _needs_flush(self):
+        if self._flush_records is not None and self._unflushed_records >= self._flush_records:
+            return True
+        if self._flush_bytes is not None and self._unflushed_bytes >= self._flush_bytes:
+            return True
+        return (self._flush_seconds is not None 
+                and time.time() - self._flushed_at >= self._flush_seconds)
+
+    def _raw_fileobj(self):
+        """Returns the file the data is written to."""
+        if isinstance(self.fileobj, (gzip2.GzipFile, gzip2.ParallelGzipWriter)):
+            return self.fileobj.fileobj
+        return self.fileobj
+
+    def flush(self):
+        """Flushes the records written so far to the file, and syncs the file
+        to disk if the flush policy has ``"fsync": True``.
+
+        Records still being compressed on other threads are waited for 
+        when syncing, and are otherwise written by a later flush.
+        """
+        if self._fsync and isinstance(self.fileobj, gzip2.ParallelGzipWriter):
+            self.fileobj.flush(wait=True)
+        else:
+            self.fileobj.flush()
+        if self._fsync:
+            self._sync(self._raw_fileobj())
+        self._unflushed_records = 0
+        self._unflushed_bytes = 0
+        self._flushed_at = time.time()
+
+    def _sync(self, fileobj):
+        fileobj.flush()
+        if hasattr(fileobj, "fileno"):
+            os.fsync(fileobj.fileno())
         
     def read_record(self):
         """Reads a warc record from this WARC file."""
         return self.reader.read_record()
+
+    def read_record_at(self, offset):
+        """Reads the warc record starting at the given offset.
+
+        The offset is the one returned by :meth:`tell` or :meth:`browse`, 
+        which is the offset in the compressed file if this is a compressed 
+        file. Only the gzip member containing the record is decompressed, 
+        so the cost of this does not depend on the size of the file.
+        """
+        self.seek(offset)
+        return self.read_record()
+
+    def seek(self, offset):
+        """Moves to the record starting at the given offset.
+
+        If this is a compressed file, the offset must be the offset of a 
+        gzip member in the compressed file.
+        """
+        # The payload of the current record, if any, belongs to the old
+        # position and must not be consumed before reading the next record.
+        self.reader.current_payload = None
+        if isinstance(self.fileobj, gzip2.GzipFile):
+            if self.member_index is not None and self.member_index.find(offset) != offset:
+                raise IOError("No gzip member starts at offset %d" % offset)
+            self.fileobj.seek_member(offset)
+        else:
+            self.fileobj.seek(offset)
         
     def __iter__(self):
         return iter(self.reader)
         
     def close(self):
-        self.fileobj.close()
+        raw = self._raw_fileobj()
+        try:
+            # The gzip writers write the end of the file on close and leave
+            # the file they write to open, which is synced after that.
+            if raw is not self.fileobj:
+                self.fileobj.close()
+            if self._fsync and raw is not None and not getattr(raw, "closed", False):
+                self._sync(raw)
+            if raw is self.fileobj:
+                self.fileobj.close()
+        finally:
+            # GzipFile doesn't close the file given to it
+            if self._myfileobj is not None:
+                self._myfileobj.close()
+                self._myfileobj = None
+        if self._index_path is not None:
+            self.member_index.save(self._index_path)
+            self._index_path = None
         
     def browse(self):
         """Utility to browse through the records in the warc file.
@@ -303,6 +717,21 @@ class WARCFile:
             yield record, offset, next_offset-offset
             offset = next_offset
 
+    def iter_headers(self):
+        """Returns an iterator over the headers of the records in the file.
+
+        The payloads are skipped without reading them, uncompressed files
+        are seeked past them and compressed files are decompressed without
+        keeping the data. This is much faster than reading the records when
+        only the headers are needed, like for counting the records of each
+        type.
+        """
+        reader = self.reader
+        record = reader.read_record()
+        while record is not None:
+            yield record.header
+            record = reader.read_record()
+
     def tell(self):
         """Returns the file offset. If this is a compressed file, then the 
         offset in the compressed file is returned.
@@ -315,36 +744,65 @@ class WARCFile:
 class WARCReader:
     RE_VERSION = re.compile("WARC/(\d+.\d+)\r\n")
     RE_HEADER = re.compile(r"([a-zA-Z_\-]+): *(.*)\r\n")
+    RE_HEADER_BLOCK = re.compile(r"(?:[a-zA-Z_\-]+: *.*\r\n)*\r\n\Z")
     SUPPORTED_VERSIONS = ["1.0"]
     
     def __init__(self, fileobj):
         self.fileobj = fileobj
         self.current_payload = None
+        # isinstance on GzipFile is slow (it is an abstract base class), so
+        # it is checked only once.
+        self.compressed = isinstance(fileobj, gzip2.GzipFile)
+        self.mapped = isinstance(fileobj, mmap.mmap)
         
+    def _read_header_block(self, fileobj):
+        """Reads the header of a record, up to and including the blank line 
+        at the end of it.
+        """
+        if self.compressed:
+            # Look for the end of the header in the decompressed buffer
+            return fileobj.read_until("\r\n\r\n")
+        if self.mapped:
+            # Look for the end of the header in the map
+            start = fileobj.tell()
+            end = fileobj.find("\r\n\r\n", start)
+            return fileobj.read(end + 4 - start if end != -1 else -1)
+
+        readline = fileobj.readline
+        lines = [readline()]
+        if lines[0]:
+            line = readline()
+            while line:
+                lines.append(line)
+                if line == "\r\n":
+                    break
+                line = readline()
+        return "".join(lines)
+
     def read_header(self, fileobj):
-        version_line = fileobj.readline()
-        if not version_line:
+        block = self._read_header_block(fileobj)
+        if not block:
             return None
-            
-        m = self.RE_VERSION.match(version_line)
+
+        m = self.RE_VERSION.match(block)
         if not m:
-            raise IOError("Bad version line: %r" % version_line)
+            raise IOError("Bad version line: %r" % block[:block.find("\n")+1])
         version = m.group(1)
         if version not in self.SUPPORTED_VERSIONS:
             raise IOError("Unsupported WARC version: %s" % version)
-            
-        headers = {}
-        while True:
-            line = fileobj.readline()
-            if line == "\r\n": # end of headers
-                break
-            m = self.RE_HEADER.match(line)
-            if not m:
-                raise IOError("Bad header line: %r" % line)
-            name, value = m.groups()
-            headers[name] = value
-        return WARCHeader(headers)
-        
+
+        # Validate all the header lines with one match before splitting them
+        # into fields. Only when that fails, the lines are checked one by one
+        # to find the bad one.
+        pos = m.end()
+        if not self.RE_HEADER_BLOCK.match(block, pos):
+            m = self.RE_HEADER.match(block, pos)
+            while m:
+                pos = m.end()
+                m = self.RE_HEADER.match(block, pos)
+            raise IOError("Bad header line: %r" % block[pos:block.find("\n", pos)+1])
+        return LazyWARCHeader(block, pos)
+
     def expect(self, fileobj, expected_line, message=None):
         line = fileobj.readline()
         if line != expected_line:
@@ -354,8 +812,8 @@ class WARCReader:
     def finish_reading_current_record(self):
         # consume the footer from the previous record
         if self.current_payload:
-            # consume all data from the current_payload before moving to next record
-            self.current_payload.read()
+            # skip the rest of the current_payload before moving to next record
+            self.current_payload.skip()
             self.expect(self.current_payload.fileobj, "\r\n")
             self.expect(self.current_payload.fileobj, "\r\n")
             self.current_payload = None
@@ -363,7 +821,7 @@ class WARCReader:
     def read_record(self):
         self.finish_reading_current_record()
 
-        if isinstance(self.fileobj, gzip2.GzipFile):
+        if self.compressed:
             fileobj = self.fileobj.read_member()
             if fileobj is None:
                 return None
@@ -374,7 +832,10 @@ class WARCReader:
         if header is None:
             return None
         
-        self.current_payload = FilePart(fileobj, header.content_length)
+        if self.mapped:
+            self.current_payload = MappedPart(fileobj, header.content_length)
+        else:
+            self.current_payload = FilePart(fileobj, header.content_length)
         record = WARCRecord(header, self.current_payload, defaults=False)
         return record
 
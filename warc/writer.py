@@ -0,0 +1,324 @@
+"""
+warc.writer
+~~~~~~~~~~~
+
+Writers built on top of :class:`warc.WARCFile` for crawlers.
+
+:copyright: (c) 2012 Internet Archive
+"""
+
+import os
+import Queue
+import threading
+import time
+
+from . import gzip2
+from .warc import WARCFile, WARCRecord
+
+# Put in the queue to stop the writer thread
+_STOP = object()
+
+class AsyncWARCWriter:
+    """Writes WARC records to a :class:`warc.WARCFile` on a background thread.
+
+    Records can be handed over from any number of threads, or from the
+    callbacks of an event loop, without waiting for them to be compressed
+    and written to disk. The writer thread takes the queued records in
+    batches of up to `batch_size` records and writes each batch with
+    :meth:`warc.WARCFile.write_records`, checking the flush policy of the
+    file once per batch, so a file opened with ``flush=True`` is flushed
+    once per batch instead of once per record.
+
+    At most `max_pending` records are queued. When the queue is full,
+    :meth:`write_record` blocks, or raises :class:`Queue.Full` when called
+    with ``block=False``, so that a producer faster than the disk is slowed
+    down instead of filling up the memory. Event loops should use
+    ``block=False`` and retry later, or check :meth:`full` first.
+
+    Errors from writing are raised by the next call to :meth:`write_record`,
+    :meth:`flush` or :meth:`close`. No more records are written after an
+    error.
+
+    The records can also be written to a :class:`RotatingWARCWriter`, which
+    is closed with the writer.
+
+        >>> writer = AsyncWARCWriter(warc.open("crawl.warc.gz", "w"))
+        >>> writer.write_record(record)
+        >>> writer.close()
+    """
+    def __init__(self, warcfile, max_pending=1000, batch_size=100):
+        self.warcfile = warcfile
+        self.batch_size = batch_size
+        self._queue = Queue.Queue(max_pending)
+        self._error = None
+        self._closed = False
+        # Number of records queued or being written
+        self._unwritten = 0
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def _run(self):
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except Queue.Empty:
+                    break
+
+            records = [record for record in batch if record is not _STOP]
+            stop = len(records) < len(batch)
+            if records and self._error is None:
+                try:
+                    self.warcfile.write_records(records, batch=True)
+                except Exception as e:
+                    self._error = e
+            self._count(-len(records))
+            for record in batch:
+                self._queue.task_done()
+
+    def _count(self, n):
+        self._lock.acquire()
+        try:
+            self._unwritten += n
+        finally:
+            self._lock.release()
+
+    def _check_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def write_record(self, record, block=True, timeout=None):
+        """Queues a record to be written.
+
+        When the queue is full, this waits for up to `timeout` seconds, or
+        forever if timeout is None, for a free place. :class:`Queue.Full`
+        is raised if there is none, or immediately when `block` is False.
+        """
+        if self._closed:
+            raise ValueError("write_record() on closed AsyncWARCWriter")
+        self._check_error()
+        self._count(1)
+        try:
+            self._queue.put(record, block, timeout)
+        except Queue.Full:
+            self._count(-1)
+            raise
+
+    @property
+    def pending(self):
+        """Number of records queued or being written."""
+        return self._unwritten
+
+    def full(self):
+        """Returns True if :meth:`write_record` would block."""
+        return self._queue.full()
+
+    def flush(self):
+        """Waits until all the queued records are written."""
+        self._queue.join()
+        self._check_error()
+
+    def close(self):
+        """Writes all the queued records, stops the writer thread and closes
+        the WARC file.
+        """
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+        self.warcfile.close()
+        self._check_error()
+
+class RotatingWARCWriter:
+    """Writes WARC records to a sequence of WARC files of bounded size.
+
+    A new file is started when the records written to the current file add
+    up to `max_size` bytes (before compression), `max_records` records or
+    the file is `max_age` seconds old. The limits that are None are not checked. The
+    limits are checked before writing each record, so a file can exceed
+    `max_size` by the size of one record.
+
+    Every file starts with a warcinfo record with the fields in `warcinfo`,
+    and the records written to a file get a WARC-Warcinfo-ID header with the
+    record id of its warcinfo record, unless they already have one. The
+    header is added to the header of the record given to 
+    :meth:`write_record`, not to a copy of it.
+
+    The files are named from `template`, which gets the `prefix`, the UTC
+    `timestamp` of starting the file and a `serial` number starting at 1.
+    The next file is created in advance when a file is started, under a 
+    temporary name ending in :attr:`OPEN_SUFFIX`, so that switching files
+    takes no time while records are coming in. When it is started, it is 
+    renamed with the timestamp of that time and its warcinfo record, dated
+    then too, is written. Closing the full file and creating the next one
+    is done on a background thread, and errors from it are raised by the 
+    next switch of files or by :meth:`close`. The file created in advance
+    is deleted by :meth:`close`.
+
+    The files are flushed as set by `flush`, which is passed to 
+    :class:`warc.WARCFile`.
+
+        >>> writer = RotatingWARCWriter("crawl", prefix="CRAWL", max_size=1024**3, 
+        ...                             warcinfo={"operator": "archive.org"})
+        >>> writer.write_record(record)
+        >>> writer.close()
+    """
+    TEMPLATE = "%(prefix)s-%(timestamp)s-%(serial)05d"
+    OPEN_SUFFIX = ".open"
+
+    def __init__(self, directory=".", prefix="WARC", max_size=1024**3, max_records=None,
+                 max_age=None, compress=True, warcinfo=None, template=None, flush=True):
+        self.directory = directory
+        self.prefix = prefix
+        self.max_size = max_size
+        self.max_records = max_records
+        self.max_age = max_age
+        self.compress = compress
+        self._flush = flush
+        self.warcinfo = warcinfo or {}
+        self.template = (template or self.TEMPLATE) + (".warc" if compress is False else ".warc.gz")
+
+        # Names of the files written so far, including the current one
+        self.filenames = []
+        self.current = None
+        self._serial = 0
+        self._error = None
+        self._opener = None
+        self._next = self._open_file()
+        self._start_next()
+
+    def _make_warcinfo(self, filename):
+        fields = [("software", "warc python library"), ("format", "WARC File Format 1.0")]
+        fields += sorted(self.warcinfo.items())
+        payload = "".join("%s: %s\r\n" % (name, value) for name, value in fields)
+        return WARCRecord(payload=payload, headers={
+            "WARC-Type": "warcinfo",
+            "WARC-Filename": filename
+        })
+
+    def _make_filename(self, serial):
+        return self.template % dict(prefix=self.prefix, 
+                                    timestamp=time.strftime("%Y%m%d%H%M%S", time.gmtime()),
+                                    serial=serial)
+
+    def _open_file(self):
+        """Creates the next file under a temporary name. Returns a tuple of
+        the WARCFile, its serial number and the temporary name.
+        """
+        self._serial += 1
+        filename = self._make_filename(self._serial) + self.OPEN_SUFFIX
+        f = WARCFile(os.path.join(self.directory, filename), "wb", compress=self.compress,
+                     flush=self._flush)
+        return f, self._serial, filename
+
+    def _open_next(self, previous):
+        """Closes the previous file and creates the next one in advance. Runs
+        on the thread started by :meth:`_start_next`.
+        """
+        try:
+            if previous is not None:
+                previous.close()
+            self._next = self._open_file()
+        except Exception as e:
+            self._error = e
+
+    def _wait_next(self):
+        if self._opener is not None:
+            self._opener.join()
+            self._opener = None
+        if self._error is not None:
+            raise self._error
+
+    def _start_next(self):
+        """Makes the file opened in advance the current file, naming it and
+        writing its warcinfo record. The previous file is closed and the 
+        one after it is opened on a background thread.
+        """
+        self._wait_next()
+        previous = self.current
+        f, serial, open_filename = self._next
+        self._next = None
+        filename = self._make_filename(serial)
+        path = os.path.join(self.directory, filename)
+        os.rename(os.path.join(self.directory, open_filename), path)
+        if isinstance(f.fileobj, gzip2.GzipFile):
+            # The gzip member headers hold the name of the file. No header
+            # is written before the first record.
+            f.fileobj.name = path
+        warcinfo = self._make_warcinfo(filename)
+
+        self.current = f
+        self.size = f.write_record(warcinfo)
+        self.warcinfo_id = warcinfo.header.record_id
+        self.filenames.append(filename)
+        self.records = 0
+        self.started = time.time()
+        self._opener = threading.Thread(target=self._open_next, args=(previous,))
+        self._opener.start()
+
+    def _is_full(self):
+        if self.records == 0:
+            return False
+        if self.max_records is not None and self.records >= self.max_records:
+            return True
+        if self.max_age is not None and time.time() - self.started >= self.max_age:
+            return True
+        return self.max_size is not None and self.size >= self.max_size
+
+    @property
+    def filename(self):
+        """Name of the file being written."""
+        return self.filenames[-1]
+
+    def write_record(self, record):
+        """Writes a record to the current file, starting a new file first if 
+        the current one is full.
+        """
+        self._write(record, batch=False)
+
+    def _write(self, record, batch):
+        if self._is_full():
+            self._start_next()
+        if 'WARC-Warcinfo-ID' not in record.header:
+            record.header['WARC-Warcinfo-ID'] = self.warcinfo_id
+        if batch:
+            # The flush policy is checked by write_records
+            self.size += self.current._write(record)
+        else:
+            self.size += self.current.write_record(record)
+        self.records += 1
+
+    def write_records(self, records, batch=False):
+        """Writes the records from an iterable like :meth:`write_record` and
+        returns the number of records written. With `batch` True, the flush
+        policy of the current file is only checked after the last record, 
+        as with :meth:`warc.WARCFile.write_records`.
+        """
+        count = 0
+        for record in records:
+            self._write(record, batch)
+            count += 1
+        if batch and self.current._needs_flush():
+            self.current.flush()
+        return count
+
+    def close(self):
+        """Closes the current file and deletes the file opened in advance.
+        """
+        if self.current is None:
+            return
+        try:
+            self._wait_next()
+        finally:
+            self.current.close()
+            self.current = None
+            if self._next is not None:
+                f, serial, filename = self._next
+                f.close()
+                os.remove(os.path.join(self.directory, filename))
+                self._next = None